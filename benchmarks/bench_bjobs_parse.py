@@ -0,0 +1,56 @@
+"""Peak memory and time of decoding a large ``bjobs -json`` output: whole document vs streamed records.
+
+Run with ``python -m benchmarks.bench_bjobs_parse [job_count]``.
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.fixtures import make_bjobs_json
+from mjobs.data.lsf_repo import iter_bjobs_records, parse_bjobs_json
+from mjobs.models import JobRecord
+
+
+def whole_document(path: str) -> int:
+    """Read the output at once and json.loads it, like check_output + parse."""
+    with open(path) as output:
+        records = parse_bjobs_json(output.read())
+    return len([JobRecord.from_bjobs_json(record) for record in records])
+
+
+def streamed(path: str) -> int:
+    """Decode the records one by one from the file, like from the bjobs pipe."""
+    with open(path) as output:
+        return len([JobRecord.from_bjobs_json(record) for record in iter_bjobs_records(output)])
+
+
+def measure(label: str, parse, path: str) -> None:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = parse(path)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:>15}: {count:,} jobs in {elapsed:.2f}s, peak {peak / 2**20:7.1f} MiB")
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    fd, path = tempfile.mkstemp(suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as output:
+            output.write(make_bjobs_json(count))
+        print(f"bjobs -json output: {os.path.getsize(path) / 2**20:.1f} MiB")
+        measure("whole document", whole_document, path)
+        measure("streamed", streamed, path)
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
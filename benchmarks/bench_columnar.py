@@ -0,0 +1,115 @@
+"""Memory and filter/sort cost of a 100k-job snapshot: SlurmJob list, JobRecord list, JobColumns.
+
+Run with ``python -m benchmarks.bench_columnar [job_count]``.
+"""
+
+import gc
+import re
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fixtures import make_squeue_output
+from mjobs.models import JOB_FIELDS, SQUEUE_FIELDS, JobColumns, JobQuery, JobRecord, SlurmJob
+
+
+def retained(build):
+    """Bytes still allocated by what ``build`` returns."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    lines = make_squeue_output(count).splitlines()
+    field_count = len(SQUEUE_FIELDS)
+
+    def build_models():
+        records = [JobRecord.from_squeue_line(line, field_count) for line in lines]
+        return [SlurmJob(**{field: getattr(r, field) for field in JOB_FIELDS}) for r in records]
+
+    def build_records():
+        return [JobRecord.from_squeue_line(line, field_count) for line in lines]
+
+    def build_columns():
+        return JobColumns.from_records([JobRecord.from_squeue_line(line, field_count) for line in lines])
+
+    models, models_size = retained(build_models)
+    records, records_size = retained(build_records)
+    columns, columns_size = retained(build_columns)
+
+    print(f"{count:,} jobs retained memory")
+    print(f"  list[SlurmJob]:  {models_size / 2**20:8.1f} MiB")
+    print(f"  list[JobRecord]: {records_size / 2**20:8.1f} MiB")
+    print(
+        f"  JobColumns:      {columns_size / 2**20:8.1f} MiB ({models_size / columns_size:.1f}x smaller than SlurmJob)"
+    )
+
+    regex = re.compile("SPADES|train")
+
+    start = time.perf_counter()
+    matched = sorted((j for j in models if regex.search(j.job_name) or regex.search(j.command)), key=lambda j: j.job_id)
+    objects_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indices = columns.sort_indices("job_id", columns.match_regex(regex, ("job_name", "command")))
+    columns_time = time.perf_counter() - start
+    assert len(indices) == len(matched)
+
+    print(f"--filter + sort: objects {objects_time * 1000:.1f} ms, columns {columns_time * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    text = "ali"
+    matched = [
+        j
+        for j in models
+        if text in j.job_name.lower()
+        or text in j.job_state.lower()
+        or text in j.user_name.lower()
+        or text in j.command.lower()
+    ]
+    objects_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indices = columns.search(text, ("job_name", "job_state", "user_name", "command"))
+    columns_time = time.perf_counter() - start
+    assert len(indices) == len(matched)
+
+    print(f"dashboard search: objects {objects_time * 1000:.1f} ms, columns {columns_time * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    index = columns.search_index(("job_name", "job_state", "user_name", "command"))
+    build_time = time.perf_counter() - start
+    timings = []
+    for typed in ("a", "al", "ali", "alig", "ali", "al"):
+        start = time.perf_counter()
+        index.search(typed)
+        timings.append(f"{typed!r} {(time.perf_counter() - start) * 1000:.1f}")
+    print(f"search index: built in {build_time * 1000:.1f} ms, as you type (ms): {', '.join(timings)}")
+
+    query = JobQuery.parse("state:RUNNING user:alice mem>32G name~nf-.*SPADES")
+    start = time.perf_counter()
+    matched = [j for j in records if query.matches(j)]
+    objects_time = time.perf_counter() - start
+    start = time.perf_counter()
+    indices = query.select(columns)
+    columns_time = time.perf_counter() - start
+    assert len(indices) == len(matched)
+    start = time.perf_counter()
+    query.select(columns)
+    indexed_time = time.perf_counter() - start
+
+    print(
+        f"query: objects {objects_time * 1000:.1f} ms, columns {columns_time * 1000:.1f} ms "
+        f"(postings built), {indexed_time * 1000:.1f} ms (postings reused)"
+    )
+    del records
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Rows per second of the --format exporters and --export-parquet, against --tsv going through Rich Text.
+
+Run with ``python -m benchmarks.bench_export [job_count]``.
+"""
+
+import io
+import sys
+import time
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from rich.console import Console
+
+from benchmarks.fixtures import make_squeue_output
+from mjobs.core.export import TEXT_EXPORT_FORMATS, JobExporter
+from mjobs.models import JOB_FIELDS, SQUEUE_FIELDS, JobRecord
+from mjobs.slurm import Slurm
+
+
+def best_rate(write, count: int, repeat: int = 3) -> float:
+    """Best rows per second of ``write(stream)`` over a few runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        stream = io.StringIO()
+        start = time.perf_counter()
+        write(stream)
+        best = min(best, time.perf_counter() - start)
+    return count / best
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    field_count = len(SQUEUE_FIELDS)
+    jobs = [JobRecord.from_squeue_line(line, field_count) for line in make_squeue_output(count).splitlines()]
+    fields = [field for field in JOB_FIELDS if field != "cluster"]
+
+    slurm = Slurm(Console(file=io.StringIO()), Console(file=io.StringIO()))
+    slurm.args = SimpleNamespace(tsv=True, no_header=False, clusters=[], collapse_arrays=False, extended=False)
+    slurm.query = None
+
+    def legacy_tsv(stream):
+        # What --tsv did before: Rich Text cells through csv.writer
+        slurm.args.tsv = False
+        rows = [slurm.table_row(job) for job in jobs]
+        slurm.args.tsv = True
+        with patch("sys.stdout", stream):
+            slurm.render(title="", columns=slurm.table_columns(), rows=rows)
+
+    def tsv(stream):
+        with patch("sys.stdout", stream):
+            slurm.render(title="", columns=slurm.table_columns(), rows=slurm.table_rows(jobs))
+
+    print(f"{count:,} jobs, {len(fields)} fields")
+    print(f"  --tsv with Rich Text: {best_rate(legacy_tsv, count):>12,.0f} rows/s")
+    print(f"  --tsv plain values:   {best_rate(tsv, count):>12,.0f} rows/s")
+    for output_format in TEXT_EXPORT_FORMATS:
+        exporter = JobExporter(output_format, fields)
+        rate = best_rate(lambda stream: exporter.write(jobs, stream), count)
+        print(f"  --format {output_format:<11} {rate:>12,.0f} rows/s")
+
+    try:
+        from mjobs.core.arrow import write_arrow_stream, write_parquet
+    except ImportError:
+        return
+    rate = best_rate(lambda stream: write_arrow_stream(jobs, fields, io.BytesIO()), count)
+    print(f"  --format arrow       {rate:>12,.0f} rows/s")
+    rate = best_rate(lambda stream: write_parquet(jobs, fields, io.BytesIO()), count)
+    print(f"  --export-parquet     {rate:>12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
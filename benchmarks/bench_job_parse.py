@@ -0,0 +1,54 @@
+"""Parse throughput of squeue lines into pydantic SlurmJob vs slotted JobRecord.
+
+Run with ``python -m benchmarks.bench_job_parse [job_count]``.
+"""
+
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fixtures import make_squeue_output
+from mjobs.models import JOB_FIELDS, SQUEUE_FIELDS, JobRecord, SlurmJob
+
+
+def parse_pydantic(lines, field_count):
+    jobs = []
+    for line in lines:
+        values = [element.strip() for element in line.strip('"').split("|")]
+        if len(values) == field_count - 1:
+            values.append("-----")
+        jobs.append(SlurmJob(**dict(zip(JOB_FIELDS, values))))
+    return jobs
+
+
+def parse_records(lines, field_count):
+    return [JobRecord.from_squeue_line(line, field_count) for line in lines]
+
+
+def bench(label, parse, lines, field_count, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        jobs = parse(lines, field_count)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    jobs = parse(lines, field_count)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del jobs
+
+    print(f"{label:>10}: {len(lines) / best:>10,.0f} jobs/s, {memory / len(lines):,.0f} bytes/job")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    lines = make_squeue_output(count).splitlines()
+    field_count = len(SQUEUE_FIELDS)
+
+    bench("SlurmJob", parse_pydantic, lines, field_count)
+    bench("JobRecord", parse_records, lines, field_count)
+
+
+if __name__ == "__main__":
+    main()
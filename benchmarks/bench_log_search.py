@@ -0,0 +1,61 @@
+"""Measure the search of the file viewer on a large generated log file.
+
+Run with ``python -m benchmarks.bench_log_search [size_in_mb]``.
+"""
+
+import os
+import re
+import sys
+import tempfile
+import time
+
+from mjobs.widgets.log_file import LogFile, LogSearch
+
+
+def make_log(path: str, size: int) -> None:
+    """Write a log of about ``size`` bytes with an error every ~10k lines."""
+    block = "".join(
+        f"2024-05-01 12:00:{i % 60:02d} INFO step {i} processed 1024 records in 0.0{i % 10}s\n" for i in range(10_000)
+    )
+    block += "2024-05-01 12:00:00 ERROR step failed\nTraceback (most recent call last):\n"
+    with open(path, "w") as log:
+        for _ in range(max(size // len(block), 1)):
+            log.write(block)
+
+
+def bench(label: str, log_file: LogFile, pattern: str) -> None:
+    start = time.perf_counter()
+    search = LogSearch(log_file, pattern)
+    while not search.scan():
+        pass
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:>16}: {len(search.matches):>7} matches in {elapsed:.2f}s ({log_file.size / elapsed / 1e6:,.0f} MB/s)"
+    )
+
+
+def bench_re(log_file: LogFile, pattern: str) -> None:
+    """A plain multiline regex over the whole mapping, for reference."""
+    regex = re.compile(pattern.encode(), re.MULTILINE)
+    start = time.perf_counter()
+    count = sum(1 for _ in regex.finditer(log_file._mm))
+    elapsed = time.perf_counter() - start
+    print(f"{'re.finditer':>16}: {count:>7} matches in {elapsed:.2f}s ({log_file.size / elapsed / 1e6:,.0f} MB/s)")
+
+
+def main() -> None:
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "job.out")
+        make_log(path, size << 20)
+        log_file = LogFile(path)
+        print(f"{log_file.size:,} bytes")
+        bench_re(log_file, "ERROR|Traceback")
+        bench("literals", log_file, "ERROR|Traceback")
+        bench("literal, no case", log_file, "error")
+        bench("regex", log_file, r"ERROR step \w+")
+        log_file.close()
+
+
+if __name__ == "__main__":
+    main()
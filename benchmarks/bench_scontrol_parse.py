@@ -0,0 +1,55 @@
+"""Compare the scontrol show job parser with the regex it replaced.
+
+Run with ``python -m benchmarks.bench_scontrol_parse [record_count]``.
+"""
+
+import io
+import re
+import sys
+import time
+
+from rich.console import Console
+
+from benchmarks.fixtures import make_scontrol_output
+from mjobs.data import SlurmRepository
+
+
+def parse_legacy(output: str) -> list:
+    """The previous parser: join the lines and scan with a lazy, backtracking regex, per record."""
+    records = []
+    for record in re.split(r"\n\s*\n", output):
+        details = {}
+        text = " ".join(record.split("\n"))
+        pattern = r"(\w+)=([^\s]+(?:\s+[^\s=]+)*?)(?=\s+\w+=|\s*$)"
+        for match in re.finditer(pattern, text):
+            key, value = match.groups()
+            value = value.strip()
+            if value.startswith('"') and value.endswith('"'):
+                value = value[1:-1]
+            details[key] = value
+        records.append(details)
+    return records
+
+
+def bench(label: str, parse, payload: str, repeat: int = 3) -> None:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        records = parse(payload)
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:>10}: {len(records):>7} records in {best:.3f}s ({len(records) / best:,.0f} records/s)")
+
+
+def main() -> None:
+    counts = [int(sys.argv[1])] if len(sys.argv) > 1 else [100, 1_000, 10_000]
+    repository = SlurmRepository(Console(file=io.StringIO()), Console(file=io.StringIO()))
+
+    for count in counts:
+        payload = make_scontrol_output(count)
+        print(f"{count} records, {len(payload):,} bytes")
+        bench("legacy", parse_legacy, payload)
+        bench("tokenizer", repository._parse_scontrol_records, payload)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""Compare the squeue --format and squeue --json parsers of SlurmRepository.
+
+Run with ``python benchmarks/bench_squeue_parsers.py [job_count]``.
+"""
+
+import io
+import sys
+import time
+
+from rich.console import Console
+
+from benchmarks.fixtures import make_squeue_json, make_squeue_output
+from mjobs.data import SlurmRepository
+
+
+def bench(label: str, parse, payload: str, repeat: int = 3) -> None:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        jobs = parse(payload)
+        best = min(best, time.perf_counter() - start)
+    print(f"{label:>10}: {len(jobs):>7} jobs in {best:.3f}s ({len(jobs) / best:,.0f} jobs/s, {len(payload):,} bytes)")
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    repository = SlurmRepository(Console(file=io.StringIO()), Console(file=io.StringIO()))
+
+    bench("--format", repository._parse_squeue_output, make_squeue_output(count))
+    bench("--json", repository._parse_squeue_json, make_squeue_json(count))
+
+
+if __name__ == "__main__":
+    main()
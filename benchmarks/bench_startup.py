@@ -0,0 +1,60 @@
+"""Import time of short mjobs invocations, from ``python -X importtime``, and the modules they shouldn't load.
+
+Run with ``python -m benchmarks.bench_startup [runs]``.
+"""
+
+import re
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+# Modules a listing doesn't need, they come with the dashboard, the tables and the pydantic model
+HEAVY_MODULES = ("pydantic", "textual", "asyncio", "rich.table", "rich.status")
+
+COMMANDS = {
+    "--version": ["--version"],
+    "--tsv": ["--test-data", "--tsv"],
+    "--format ndjson": ["--test-data", "--format", "ndjson"],
+    "table": ["--test-data"],
+}
+
+_IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run_mjobs(args: List[str]) -> Tuple[float, Dict[str, int], int]:
+    """Run mjobs in a fresh interpreter with -X importtime.
+
+    :param args: The mjobs arguments
+    :return: The wall time in seconds, the cumulative microseconds of the top-level imports, and their total
+    """
+    code = f"import sys; sys.argv = ['mjobs'] + {args!r}; from mjobs.main import main; main()"
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    elapsed = time.perf_counter() - start
+    modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match is None:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        total += int(self_us)
+        modules[module] = int(cumulative_us)
+    return elapsed, modules, total
+
+
+def main() -> None:
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, args in COMMANDS.items():
+        results = [run_mjobs(args) for _ in range(runs)]
+        elapsed, modules, total = min(results, key=lambda result: result[2])
+        heavy = [module for module in HEAVY_MODULES if module in modules]
+        print(f"mjobs {name}: imports {total / 1000:6.1f} ms, process {elapsed * 1000:6.1f} ms (best of {runs})")
+        print(f"  heavy modules: {', '.join(heavy) if heavy else 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""JobsTable refresh cost against the number of changed jobs, on a large table.
+
+Run with ``python -m benchmarks.bench_table_refresh [job_count]``.
+"""
+
+import asyncio
+import sys
+import time
+
+from textual.app import App
+
+from benchmarks.fixtures import make_squeue_output
+from mjobs.models import SQUEUE_FIELDS, JobRecord
+from mjobs.widgets.jobs_table import JobsTable
+
+
+class TableApp(App):
+    def compose(self):
+        yield JobsTable(id="jobs_table")
+
+
+def changed_snapshot(jobs, changes):
+    """Flip the state of ``changes`` jobs, drop ``changes`` jobs and add ``changes`` new ones."""
+    updated = list(jobs[changes:])
+    for index in range(min(changes, len(updated))):
+        job = updated[index]
+        updated[index] = JobRecord(*(job.as_tuple()[:5] + ("COMPLETED",) + job.as_tuple()[6:]))
+    for index in range(changes):
+        new = jobs[index].as_tuple()
+        updated.append(JobRecord(*((f"9{index:08d}",) + new[1:])))
+    return updated
+
+
+async def run(count):
+    field_count = len(SQUEUE_FIELDS)
+    jobs = [JobRecord.from_squeue_line(line, field_count) for line in make_squeue_output(count).splitlines()]
+
+    app = TableApp()
+    async with app.run_test():
+        table = app.query_one(JobsTable)
+
+        start = time.perf_counter()
+        table.populate_table(jobs)
+        print(f"initial load of {count:,} jobs: {time.perf_counter() - start:.3f}s")
+
+        for changes in (0, 10, 100, 1000):
+            snapshot = changed_snapshot(jobs, changes)
+            start = time.perf_counter()
+            touched = table.populate_table(snapshot)
+            elapsed = time.perf_counter() - start
+            print(f"refresh with {changes:>5} added/removed/changed: {elapsed * 1000:8.1f} ms ({touched} rows touched)")
+            table.populate_table(jobs)
+
+        start = time.perf_counter()
+        table.clear()
+        table._row_values.clear()
+        table.populate_table(jobs)
+        print(f"full rebuild (previous behaviour): {time.perf_counter() - start:.3f}s")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+    asyncio.run(run(count))
+
+
+if __name__ == "__main__":
+    main()
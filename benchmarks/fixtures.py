@@ -0,0 +1,191 @@
+"""Synthetic scheduler outputs shaped like real captures, shared by the benchmarks."""
+
+import json
+import random
+import time
+from typing import Any, Dict, List
+
+STATES = ["RUNNING", "PENDING", "PENDING", "RUNNING", "COMPLETING", "SUSPENDED"]
+PARTITIONS = ["compute", "gpu", "highmem", "bigmem", "short", "long", "standard"]
+ACCOUNTS = ["metagenomics", "rnaseq", "structural", "training"]
+USERS = ["alice", "bob", "charlie", "diana", "eve", "frank"]
+NAMES = [
+    "blast_search",
+    "nf-EBIMETAGENOMICS_MIASSEMBLER_MIASSEMBLER_SHORT_READS_ASSEMBLER_SPADES_(ERR13502861)",
+    "nf-CHIPSEQ_PIPELINE_BWA_MEM_(SRR12345678)",
+    "training_model",
+    "variant_calling",
+]
+COMMANDS = [
+    "/hps/nobackup/alice/work/ab/12cd/.command.run",
+    "python train_model.py --epochs 100 --lr 0.001",
+    "spades.py -1 reads_1.fastq -2 reads_2.fastq -o assembly/",
+]
+
+
+def make_jobs(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """Generate ``count`` job dicts using the squeue json field names."""
+    rng = random.Random(seed)
+    now = int(time.time())
+    jobs = []
+    for index in range(count):
+        state = rng.choice(STATES)
+        user = rng.choice(USERS)
+        submit = now - rng.randint(60, 7 * 86400)
+        start = submit + rng.randint(1, 3600) if state != "PENDING" else 0
+        limit = rng.choice([60, 240, 720, 1440, 10080])
+        jobs.append(
+            {
+                "job_id": 1000000 + index,
+                "name": rng.choice(NAMES),
+                "time_limit": limit,
+                "memory_per_node": rng.choice([4096, 16384, 65536, 4000]),
+                "partition": rng.choice(PARTITIONS),
+                "job_state": state,
+                "user_name": user,
+                "command": rng.choice(COMMANDS),
+                "state_reason": "Priority" if state == "PENDING" else "None",
+                "start_time": start,
+                "submit_time": submit,
+                "end_time": start + limit * 60 if start else 0,
+                "current_working_directory": f"/hps/nobackup/{user}/work/{index % 997:03d}",
+                "nodes": f"compute-{rng.randint(1, 400):03d}" if state != "PENDING" else "",
+                "account": ACCOUNTS[index % len(ACCOUNTS)],
+                "qos": "high" if index % 10 == 0 else "normal",
+            }
+        )
+    return jobs
+
+
+def _squeue_time(epoch: int) -> str:
+    if not epoch:
+        return "N/A"
+    return time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(epoch))
+
+
+def _squeue_duration(minutes: int) -> str:
+    days, minutes = divmod(minutes, 1440)
+    hours, minutes = divmod(minutes, 60)
+    if days:
+        return f"{days}-{hours:02d}:{minutes:02d}:00"
+    return f"{hours}:{minutes:02d}:00"
+
+
+def make_squeue_output(count: int, seed: int = 42) -> str:
+    """Render jobs as the ``squeue -h --format`` output of SlurmRepository."""
+    lines = []
+    for job in make_jobs(count, seed):
+        fields = [
+            str(job["job_id"]),
+            job["name"],
+            _squeue_duration(job["time_limit"]),
+            f"{job['memory_per_node'] // 1024}G"
+            if job["memory_per_node"] % 1024 == 0
+            else f"{job['memory_per_node']}M",
+            job["partition"],
+            job["job_state"],
+            job["user_name"],
+            job["command"],
+            job["state_reason"],
+            _squeue_time(job["start_time"]),
+            _squeue_time(job["submit_time"]),
+            _squeue_duration(job["time_limit"]),
+            job["current_working_directory"],
+            job["account"],
+            job["qos"],
+            job["nodes"],
+        ]
+        lines.append('"' + "|".join(fields) + '"')
+    return "\n".join(lines) + "\n"
+
+
+def make_squeue_json(count: int, seed: int = 42) -> str:
+    """Render jobs as ``squeue --json`` output (data_parser style number wrappers)."""
+
+    def number(value: int) -> Dict[str, Any]:
+        return {"set": bool(value), "infinite": False, "number": value}
+
+    records = []
+    for job in make_jobs(count, seed):
+        record = dict(job)
+        record["job_state"] = [job["job_state"]]
+        for key in ("time_limit", "memory_per_node", "start_time", "submit_time", "end_time"):
+            record[key] = number(job[key])
+        record["array_job_id"] = number(0)
+        record["array_task_id"] = {"set": False, "infinite": False, "number": 0}
+        records.append(record)
+    return json.dumps(
+        {"meta": {"plugin": {"type": "openapi/slurmctld"}}, "errors": [], "warnings": [], "jobs": records}
+    )
+
+
+def make_scontrol_output(count: int, seed: int = 42) -> str:
+    """Render jobs as ``scontrol show job`` output, records separated by a blank line.
+
+    The commands and working directories contain spaces, like real ones sometimes do.
+    """
+    records = []
+    for job in make_jobs(count, seed):
+        user = job["user_name"]
+        workdir = job["current_working_directory"] + " (copy)"
+        records.append(
+            f"JobId={job['job_id']} JobName={job['name']}\n"
+            f"   UserId={user}(1000) GroupId={user}(1000) MCS_label=N/A\n"
+            f"   Priority=4294901759 Nice=0 Account=(null) QOS=normal\n"
+            f"   JobState={job['job_state']} Reason={job['state_reason']} Dependency=(null)\n"
+            f"   Requeue=1 Restarts=0 BatchFlag=1 Reboot=0 ExitCode=0:0\n"
+            f"   RunTime=00:01:00 TimeLimit={_squeue_duration(job['time_limit'])} TimeMin=N/A\n"
+            f"   SubmitTime={_squeue_time(job['submit_time'])} EligibleTime={_squeue_time(job['submit_time'])}\n"
+            f"   StartTime={_squeue_time(job['start_time'])} EndTime={_squeue_time(job['end_time'])} Deadline=N/A\n"
+            f"   Partition={job['partition']} AllocNode:Sid=login-1:12345\n"
+            f"   ReqNodeList=(null) ExcNodeList=(null)\n"
+            f"   NodeList={job['nodes'] or '(null)'}\n"
+            f"   NumNodes=1 NumCPUs=1 NumTasks=1 CPUs/Task=1 ReqB:S:C:T=0:0:*:*\n"
+            f"   TRES=cpu=1,mem={job['memory_per_node']}M,node=1,billing=1\n"
+            f"   Socks/Node=* NtasksPerN:B:S:C=0:0:*:* CoreSpec=*\n"
+            f"   MinCPUsNode=1 MinMemoryNode={job['memory_per_node']}M MinTmpDiskNode=0\n"
+            f"   Features=(null) DelayBoot=00:00:00\n"
+            f"   OverSubscribe=OK Contiguous=0 Licenses=(null) Network=(null)\n"
+            f"   Command={job['command']}\n"
+            f"   WorkDir={workdir}\n"
+            f"   StdErr={workdir}/slurm-{job['job_id']}.err\n"
+            f"   StdIn=/dev/null\n"
+            f"   StdOut={workdir}/slurm-{job['job_id']}.out\n"
+        )
+    return "\n".join(records)
+
+
+LSF_STATES = {"RUNNING": "RUN", "PENDING": "PEND", "COMPLETING": "RUN", "SUSPENDED": "USUSP"}
+
+
+def make_bjobs_json(count: int, seed: int = 42) -> str:
+    """Render jobs as ``bjobs -json -o ...`` output, with the fields of LsfRepository."""
+
+    def lsf_time(epoch: int) -> str:
+        return time.strftime("%b %d %H:%M", time.localtime(epoch)) if epoch else "-"
+
+    records = []
+    for job in make_jobs(count, seed):
+        workdir = job["current_working_directory"]
+        state = LSF_STATES[job["job_state"]]
+        records.append(
+            {
+                "STAT": state,
+                "JOB_NAME": job["name"],
+                "JOBID": str(job["job_id"]),
+                "JOB_GROUP": f"/{job['account']}",
+                "USER": job["user_name"],
+                "QUEUE": job["partition"],
+                "SUBMIT_TIME": lsf_time(job["submit_time"]),
+                "START_TIME": lsf_time(job["start_time"]),
+                "FINISH_TIME": lsf_time(job["end_time"]) + " L" if job["end_time"] else "-",
+                "EXEC_HOST": job["nodes"] or "-",
+                "COMMAND": job["command"],
+                "EXIT_REASON": "",
+                "EXIT_CODE": "",
+                "ERROR_FILE": f"{workdir}/lsf-{job['job_id']}.err",
+                "OUTPUT_FILE": f"{workdir}/lsf-{job['job_id']}.out",
+                "PEND_REASON": "New job is waiting for scheduling;" if state == "PEND" else "",
+            }
+        )
+    return json.dumps({"COMMAND": "bjobs", "JOBS": len(records), "RECORDS": records}, indent=2)
@@ -17,9 +17,15 @@
 import csv
 import sys
 from abc import ABC
+from typing import TYPE_CHECKING, Iterable, List
 
 from rich.console import Console
-from rich.table import Table
+from rich.text import Text
+
+from mjobs.core.export import JobExporter
+
+if TYPE_CHECKING:
+    from mjobs.models import JobRecord
 
 
 class Base(ABC):
@@ -40,9 +46,45 @@ class Base(ABC):
                 writer.writerow([c.get("header") for c in columns])
             writer.writerows(rows)
         else:
+            from rich.table import Table
+
             table = Table(title=title, show_lines=True, show_header=not self.args.no_header)
             for col in columns:
                 table.add_column(**col)
             for row in rows:
                 table.add_row(*row)
             self.console.print(table)
+
+    def export(self, jobs: Iterable["JobRecord"]) -> int:
+        """Write the jobs to stdout in the --format, or to the --export-parquet file.
+
+        The plain field values are written without going through Rich, Arrow
+        and Parquet need pyarrow which is only imported here.
+
+        :param jobs: The jobs
+        :return: Number of jobs written
+        """
+        fields = self.export_fields()
+        try:
+            if self.args.export_parquet:
+                from mjobs.core.arrow import write_parquet
+
+                count = write_parquet(jobs, fields, self.args.export_parquet)
+                self.console.print(Text(f"Exported {count} job(s) to {self.args.export_parquet}"))
+                return count
+            if self.args.output_format == "arrow":
+                from mjobs.core.arrow import write_arrow_stream
+
+                sys.stdout.flush()
+                return write_arrow_stream(jobs, fields, sys.stdout.buffer)
+        except ImportError as e:
+            self.error_console.print(Text(str(e)), style="bold red")
+            sys.exit(1)
+        exporter = JobExporter(self.args.output_format, fields, header=not self.args.no_header)
+        return exporter.write(jobs, sys.stdout)
+
+    def export_fields(self) -> List[str]:
+        """The JobRecord fields written by :meth:`export`."""
+        from mjobs.models import JOB_FIELDS
+
+        return [field for field in JOB_FIELDS if field != "cluster"]
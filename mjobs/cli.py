@@ -4,9 +4,7 @@
 import click
 from rich.console import Console
 
-from mjobs.core.factory import create_job_repository
-from mjobs.lsf import LSF
-from mjobs.slurm import Slurm
+from mjobs.core.export import EXPORT_FORMATS
 from mjobs.version import VERSION
 
 SLURM_JOB_STATES = [
@@ -42,7 +40,15 @@ error_console = Console(stderr=True, style="bold red")
 
 @click.command()
 @click.version_option(version=VERSION, prog_name="mjobs")
-@click.option("-f", "--filter", default=None, help="Filter jobs by regex on the job name or pending reason.")
+@click.option(
+    "-f",
+    "--filter",
+    default=None,
+    help=(
+        "Filter jobs with a query (state:RUNNING name~nf- mem>32G ...), the other words are regexes on the job name "
+        "and command. A filter without field terms is one regex, spaces included."
+    ),
+)
 @click.option("-ts", "--tsv", is_flag=True, help="No fancy table, a good ol' tsv")
 @click.option("-nh", "--no-header", is_flag=True, help="Don't print the table header, useful to pipe the tsv output")
 @click.option("-d", "--dashboard", is_flag=True, help="Launch interactive dashboard mode")
@@ -62,6 +68,53 @@ error_console = Console(stderr=True, style="bold red")
     "-w", "--nodelist", multiple=True, help="Report only on jobs allocated to the specified node or list of nodes."
 )
 @click.option("-e", "--extended", is_flag=True, help="Add the execution nodes, stdoutput file and stderror file.")
+@click.option(
+    "--stream",
+    is_flag=True,
+    help=(
+        "Print a tsv while squeue is still running, sorted by job id (implies --tsv). "
+        "Reads the squeue --format output, never --json, which can't be read before squeue is done."
+    ),
+)
+@click.option(
+    "--refresh-interval",
+    default=10.0,
+    type=click.FloatRange(min=0),
+    show_default=True,
+    help="Seconds between dashboard refreshes, backs off while nothing changes (0 disables).",
+)
+@click.option(
+    "--cache-ttl",
+    default=0.0,
+    type=click.FloatRange(min=0),
+    envvar="MJOBS_CACHE_TTL",
+    show_default=True,
+    help="Share squeue results between mjobs runs for this many seconds, e.g. in watch loops (0 disables).",
+)
+@click.option(
+    "-M",
+    "--clusters",
+    default=None,
+    help="Comma separated list of clusters to query, all at once, the jobs are listed with their cluster.",
+)
+@click.option(
+    "--collapse-arrays",
+    is_flag=True,
+    help="One row per job array and state, with the number of tasks, instead of one per task.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(EXPORT_FORMATS),
+    default=None,
+    help="Export the plain job fields (arrow is an Arrow IPC stream), much faster than --tsv on large listings.",
+)
+@click.option(
+    "--export-parquet",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the jobs, with typed times and durations, to a Parquet file (needs pyarrow).",
+)
 def slurm(
     filter,
     tsv,
@@ -75,11 +128,26 @@ def slurm(
     states,
     nodelist,
     extended,
+    stream,
+    refresh_interval,
+    cache_ttl,
+    clusters,
+    collapse_arrays,
+    output_format,
+    export_parquet,
 ):
+    # Imported here, so each command only loads what it runs
+    from mjobs.core.factory import create_job_repository
+    from mjobs.slurm import Slurm
+
+    clusters = [cluster.strip() for cluster in clusters.split(",") if cluster.strip()] if clusters else []
     job_repository = create_job_repository(
         test_mode=test_data,
         console=console if not test_data else None,
         error_console=error_console if not test_data else None,
+        # Never cancel jobs from a cached listing
+        cache_ttl=cache_ttl if not kill else 0,
+        clusters=clusters,
     )
     Slurm(console, error_console, job_repository=job_repository).run(
         filter=filter,
@@ -94,12 +162,26 @@ def slurm(
         states=states,
         nodelist=nodelist,
         extended=extended,
+        stream=stream,
+        refresh_interval=refresh_interval,
+        clusters=clusters,
+        collapse_arrays=collapse_arrays,
+        output_format=output_format,
+        export_parquet=export_parquet,
     )
 
 
 @click.command()
 @click.version_option(version=VERSION, prog_name="mjobs")
-@click.option("-f", "--filter", default=None, help="Filter jobs by regex on the job name or pending reason.")
+@click.option(
+    "-f",
+    "--filter",
+    default=None,
+    help=(
+        "Filter jobs with a query (state:RUNNING name~nf- mem>32G ...), the other words are regexes on the job name "
+        "and command. A filter without field terms is one regex, spaces included."
+    ),
+)
 @click.option("-ts", "--tsv", is_flag=True, help="No fancy table, a good ol' tsv")
 @click.option("-nh", "--no-header", is_flag=True, help="Don't print the table header, useful to pipe the tsv output")
 @click.option("-d", "--dashboard", is_flag=True, help="Launch interactive dashboard mode")
@@ -116,6 +198,34 @@ def slurm(
 @click.option("--pend", is_flag=True, help="Displays pending jobs with pending reasons.")
 @click.option("-e", "--extended", is_flag=True, help="Add the execution hosts, output file and error file.")
 @click.option("--bkill", is_flag=True, help="Terminate found or filtered jobs with bkill.")
+@click.option(
+    "--refresh-interval",
+    default=10.0,
+    type=click.FloatRange(min=0),
+    show_default=True,
+    help="Seconds between dashboard refreshes, backs off while nothing changes (0 disables).",
+)
+@click.option(
+    "--cache-ttl",
+    default=0.0,
+    type=click.FloatRange(min=0),
+    envvar="MJOBS_CACHE_TTL",
+    show_default=True,
+    help="Share bjobs results between mjobs dashboards for this many seconds (0 disables).",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(EXPORT_FORMATS),
+    default=None,
+    help="Export the plain job fields (arrow is an Arrow IPC stream), much faster than --tsv on large listings.",
+)
+@click.option(
+    "--export-parquet",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write the jobs, with typed times and durations, to a Parquet file (needs pyarrow).",
+)
 def lsf(
     filter,
     tsv,
@@ -134,8 +244,20 @@ def lsf(
     pend,
     extended,
     bkill,
+    refresh_interval,
+    cache_ttl,
+    output_format,
+    export_parquet,
 ):
-    LSF(console, error_console).run(
+    from mjobs.core.factory import create_job_repository
+    from mjobs.lsf import LSF
+
+    job_repository = None
+    if dashboard:
+        job_repository = create_job_repository(
+            console=console, error_console=error_console, cache_ttl=cache_ttl, scheduler="lsf"
+        )
+    LSF(console, error_console, job_repository=job_repository).run(
         filter=filter,
         tsv=tsv,
         no_header=no_header,
@@ -153,4 +275,7 @@ def lsf(
         pend=pend,
         extended=extended,
         bkill=bkill,
+        refresh_interval=refresh_interval,
+        output_format=output_format,
+        export_parquet=export_parquet,
     )
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from itertools import islice
+from operator import attrgetter
+from typing import TYPE_CHECKING, Any, BinaryIO, Iterable, Iterator, List, Sequence, Union
+
+from mjobs.models import JobRecord
+from mjobs.models.query import parse_duration
+
+if TYPE_CHECKING:
+    import pyarrow
+
+# pyarrow is optional, it's only imported to export
+PYARROW_MISSING = "Exporting to Arrow or Parquet needs pyarrow: pip install 'mjobs[arrow]'"
+
+# Rows per record batch
+BATCH_SIZE = 65536
+
+# How squeue prints %S and %V, in the local time of the cluster
+SQUEUE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+TIMESTAMP_FIELDS = frozenset({"submit_time", "start_time"})
+# end_time is the time left (squeue %L)
+DURATION_FIELDS = frozenset({"time_limit", "end_time"})
+# Few distinct values, stored once per batch
+DICTIONARY_FIELDS = frozenset({"job_state", "partition", "user_name", "account", "qos", "state_reason", "cluster"})
+INTEGER_FIELDS = frozenset({"task_count"})
+
+
+def import_pyarrow():
+    """Import pyarrow, only when something is exported.
+
+    :return: The pyarrow module
+    :raises ImportError: If pyarrow is not installed, with how to install it
+    """
+    try:
+        import pyarrow
+        import pyarrow.compute  # noqa: F401
+    except ImportError as e:
+        raise ImportError(PYARROW_MISSING) from e
+    return pyarrow
+
+
+def arrow_schema(fields: Sequence[str]) -> "pyarrow.Schema":
+    """Schema of the exported jobs.
+
+    Timestamps are naive, in the local time of the cluster like squeue prints
+    them, and empty when the job has none (pending jobs). The durations are
+    empty for ``UNLIMITED`` or ``INVALID`` limits.
+
+    :param fields: The JobRecord attributes, in order
+    :return: The schema
+    """
+    pa = import_pyarrow()
+    types = []
+    for field in fields:
+        if field in TIMESTAMP_FIELDS:
+            types.append(pa.field(field, pa.timestamp("s")))
+        elif field in DURATION_FIELDS:
+            types.append(pa.field(field, pa.duration("s")))
+        elif field in DICTIONARY_FIELDS:
+            types.append(pa.field(field, pa.dictionary(pa.int32(), pa.string())))
+        elif field in INTEGER_FIELDS:
+            types.append(pa.field(field, pa.int64()))
+        else:
+            types.append(pa.field(field, pa.string()))
+    return pa.schema(types)
+
+
+def iter_record_batches(jobs: Iterable[JobRecord], schema: "pyarrow.Schema") -> Iterator["pyarrow.RecordBatch"]:
+    """Convert the jobs to record batches, as they come from the iterable.
+
+    :param jobs: The jobs
+    :param schema: See :func:`arrow_schema`
+    :return: Iterator of record batches of up to ``BATCH_SIZE`` jobs
+    """
+    pa = import_pyarrow()
+    getters = [attrgetter(name) for name in schema.names]
+    jobs = iter(jobs)
+    while True:
+        chunk = list(islice(jobs, BATCH_SIZE))
+        if not chunk:
+            return
+        columns = [_column(pa, field, list(map(getter, chunk))) for field, getter in zip(schema, getters)]
+        yield pa.RecordBatch.from_arrays(columns, schema=schema)
+
+
+def _column(pa, field: "pyarrow.Field", values: List[Any]) -> "pyarrow.Array":
+    """One column of a batch, converted to the type of its field."""
+    if pa.types.is_timestamp(field.type):
+        return pa.compute.strptime(
+            pa.array(values, pa.string()), format=SQUEUE_TIME_FORMAT, unit="s", error_is_null=True
+        )
+    if pa.types.is_duration(field.type):
+        # Parse each distinct duration once
+        encoded = pa.array(values, pa.string()).dictionary_encode()
+        seconds = pa.array([parse_duration(value) for value in encoded.dictionary.to_pylist()], pa.int64())
+        return seconds.take(encoded.indices).cast(field.type)
+    if pa.types.is_dictionary(field.type):
+        return pa.array(values, pa.string()).dictionary_encode().cast(field.type)
+    return pa.array(values, field.type)
+
+
+def write_arrow_stream(jobs: Iterable[JobRecord], fields: Sequence[str], sink: BinaryIO) -> int:
+    """Write the jobs as an Arrow IPC stream, one record batch at a time.
+
+    :param jobs: The jobs, e.g. the iterator of a streamed listing
+    :param fields: The JobRecord attributes to write
+    :param sink: A binary file, e.g. ``sys.stdout.buffer``
+    :return: Number of jobs written
+    """
+    pa = import_pyarrow()
+    schema = arrow_schema(fields)
+    count = 0
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in iter_record_batches(jobs, schema):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
+
+
+def write_parquet(jobs: Iterable[JobRecord], fields: Sequence[str], path: Union[str, BinaryIO]) -> int:
+    """Write the jobs to a Parquet file, one row group per record batch.
+
+    :param jobs: The jobs
+    :param fields: The JobRecord attributes to write
+    :param path: The file
+    :return: Number of jobs written
+    """
+    import_pyarrow()
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(fields)
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in iter_record_batches(jobs, schema):
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from subprocess import STDOUT, CalledProcessError, check_output
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+# Bytes of ARG_MAX kept free, for what the kernel counts and we don't (auxv, alignment...)
+ARG_HEADROOM = 4096
+# Used when the system doesn't tell its limit, the historical Linux value
+DEFAULT_ARG_MAX = 131072
+# Size of the argv/envp pointer of each string
+_POINTER_SIZE = 8
+
+
+def argument_budget() -> int:
+    """Bytes a command line can take, what the environment leaves of ARG_MAX.
+
+    :return: The budget in bytes
+    """
+    try:
+        arg_max = os.sysconf("SC_ARG_MAX")
+    except (ValueError, OSError):
+        arg_max = DEFAULT_ARG_MAX
+    if arg_max <= 0:
+        arg_max = DEFAULT_ARG_MAX
+    environment = sum(len(key) + len(value) + 2 + _POINTER_SIZE for key, value in os.environ.items())
+    return max(arg_max - environment - ARG_HEADROOM, 4096)
+
+
+def _argument_size(argument: str) -> int:
+    """Bytes an argument takes in ARG_MAX: the string, its NUL and its argv pointer."""
+    return len(argument.encode()) + 1 + _POINTER_SIZE
+
+
+class CancelReport:
+    """Outcome of a bulk cancellation, per job."""
+
+    def __init__(self, cancelled: List[Hashable], failed: Dict[Hashable, str], commands: int):
+        """Create the report.
+
+        :param cancelled: The jobs that were cancelled
+        :param failed: Why each job that wasn't cancelled failed
+        :param commands: Number of commands that were run
+        """
+        self.cancelled = cancelled
+        self.failed = failed
+        self.commands = commands
+
+    @classmethod
+    def from_outcomes(
+        cls,
+        outcomes: Dict[Hashable, Optional[str]],
+        active: Optional[Dict[Hashable, str]] = None,
+        commands: int = 0,
+    ) -> "CancelReport":
+        """Decide which jobs were cancelled.
+
+        A cancel command fails as a whole when only one of its jobs can't be
+        cancelled, so the jobs of a failed command are checked against a listing
+        made afterwards when there is one: the jobs that are still active failed,
+        the others were cancelled. Without it, the exit status of the command of
+        each job is used. A job whose command succeeded was accepted, even if it's
+        still listed: bkill and scancel return before the jobs are over.
+
+        :param outcomes: The error of the command of each job, None if it succeeded
+        :param active: The state of the jobs still queued or running after the cancellation (optional)
+        :param commands: Number of commands that were run
+        :return: CancelReport instance
+        """
+        cancelled = []
+        failed = {}
+        for job, error in outcomes.items():
+            if not error or (active is not None and job not in active):
+                cancelled.append(job)
+            elif active is not None:
+                failed[job] = f"still {active[job]} ({error})"
+            else:
+                failed[job] = error
+        return cls(cancelled, failed, commands)
+
+
+class BulkCanceller:
+    """Cancels jobs with as few scheduler commands as the argument limit allows.
+
+    scancel and bkill take many job ids, forking one process per job costs
+    a round trip to the scheduler each and takes minutes for large job arrays.
+    The ids are packed into command lines up to ``budget`` bytes, run one after
+    the other or by ``max_workers`` threads.
+    """
+
+    def __init__(self, max_workers: int = 1, budget: Optional[int] = None):
+        """Initialize the canceller.
+
+        :param max_workers: Commands run at the same time
+        :param budget: Bytes a command line can take (default: :func:`argument_budget`)
+        """
+        self.max_workers = max(max_workers, 1)
+        self.budget = budget if budget is not None else argument_budget()
+
+    def command_lines(self, command: Sequence[str], job_ids: Sequence[str]) -> List[List[str]]:
+        """Split the job ids into as few command lines as the budget allows.
+
+        :param command: The command and its options, the job ids are appended
+        :param job_ids: The job ids
+        :return: The command lines
+        """
+        base_size = sum(map(_argument_size, command))
+        lines = []
+        line: List[str] = []
+        size = base_size
+        for job_id in job_ids:
+            job_id = str(job_id)
+            argument_size = _argument_size(job_id)
+            if line and size + argument_size > self.budget:
+                lines.append([*command, *line])
+                line, size = [], base_size
+            line.append(job_id)
+            size += argument_size
+        if line:
+            lines.append([*command, *line])
+        return lines
+
+    def cancel(self, command: Sequence[str], job_ids: Sequence[str]) -> List[Tuple[List[str], Optional[str]]]:
+        """Run the cancel command on all the jobs.
+
+        :param command: The command and its options, e.g. ``["scancel", "-M", "east"]``
+        :param job_ids: The job ids
+        :return: The job ids of each command line, with its error or None if it succeeded
+        """
+        lines = self.command_lines(command, job_ids)
+        if self.max_workers > 1 and len(lines) > 1:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(lines))) as executor:
+                errors = list(executor.map(self._run, lines))
+        else:
+            errors = [self._run(line) for line in lines]
+        return [(line[len(command) :], error) for line, error in zip(lines, errors)]
+
+    def _run(self, line: List[str]) -> Optional[str]:
+        """Run a command line, return its error if it fails."""
+        try:
+            check_output(line, universal_newlines=True, stderr=STDOUT)
+        except CalledProcessError as e:
+            output = (e.output or "").strip().splitlines()
+            return output[-1] if output else f"{line[0]} failed with exit code {e.returncode}"
+        except OSError as e:
+            return f"{line[0]} failed: {e}"
+        return None
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+from itertools import islice
+from json.encoder import encode_basestring
+from operator import attrgetter
+from typing import Any, Callable, Iterable, List, Sequence, TextIO, Tuple
+
+from mjobs.models import JobRecord
+
+TEXT_EXPORT_FORMATS = ("tsv", "csv", "ndjson", "json")
+# arrow is an Arrow IPC stream, see mjobs.core.arrow
+EXPORT_FORMATS = TEXT_EXPORT_FORMATS + ("arrow",)
+
+# Rows formatted, and written, at a time
+CHUNK_SIZE = 16384
+
+# Characters a value can't have as it is, per format
+_TSV_SPECIAL = re.compile(r"[\t\n\r]")
+_CSV_SPECIAL = re.compile(r'[,"\n\r]')
+_JSON_SPECIAL = re.compile(r'["\\\x00-\x1f]')
+
+
+def _tsv_value(value: str) -> str:
+    """A tsv has no quoting, tabs and line breaks become spaces."""
+    return _TSV_SPECIAL.sub(" ", value)
+
+
+def _csv_value(value: str) -> str:
+    """Quote a csv value if it needs to be, like csv.writer does."""
+    if _CSV_SPECIAL.search(value) is None:
+        return value
+    return '"' + value.replace('"', '""') + '"'
+
+
+class JobExporter:
+    """Writes jobs as tsv, csv, ndjson or json, straight from their field values.
+
+    Nothing goes through Rich: the rows are formatted a chunk at a time by
+    ``str.join`` and ``%``, and each chunk is one write on the output. Values
+    rarely need escaping, so a chunk is checked as a whole, with a search or a
+    count of separators over its text, and only a chunk that needs it is formatted
+    again value by value.
+    """
+
+    def __init__(self, output_format: str, fields: Sequence[str], header: bool = True):
+        """Initialize the exporter.
+
+        :param output_format: One of ``TEXT_EXPORT_FORMATS``
+        :param fields: The JobRecord attributes to write, in order
+        :param header: Write the field names first (tsv and csv)
+        :raises ValueError: If the format is unknown
+        """
+        if output_format not in TEXT_EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {output_format}, expected one of {', '.join(TEXT_EXPORT_FORMATS)}")
+        self.output_format = output_format
+        self.fields = list(fields)
+        self.header = header
+        getter = attrgetter(*self.fields)
+        self._row: Callable[[JobRecord], Tuple[Any, ...]] = (
+            getter if len(self.fields) > 1 else lambda job: (getter(job),)
+        )
+
+    def write(self, jobs: Iterable[JobRecord], stream: TextIO) -> int:
+        """Write the jobs, as they come from the iterable.
+
+        :param jobs: The jobs, e.g. a list or the iterator of a streamed listing
+        :param stream: Where to write them
+        :return: Number of jobs written
+        """
+        jobs = iter(jobs)
+        count = 0
+        if self.header and self.output_format in ("tsv", "csv"):
+            stream.write(("\t" if self.output_format == "tsv" else ",").join(self.fields) + "\n")
+        elif self.output_format == "json":
+            stream.write("[")
+
+        while True:
+            rows = list(map(self._row, islice(jobs, CHUNK_SIZE)))
+            if not rows:
+                break
+            if self.output_format == "json":
+                stream.write(("\n" if not count else ",\n") + self._format_json_rows(rows, ",\n"))
+            elif self.output_format == "ndjson":
+                stream.write(self._format_json_rows(rows, "\n") + "\n")
+            else:
+                stream.write(self._format_delimited_rows(rows) + "\n")
+            count += len(rows)
+
+        if self.output_format == "json":
+            stream.write("\n]\n" if count else "]\n")
+        return count
+
+    def _format_delimited_rows(self, rows: List[Tuple[Any, ...]]) -> str:
+        """The tsv or csv lines of a chunk, without the last line break."""
+        if not all(isinstance(value, str) for value in rows[0]):
+            # Numbers, e.g. the number of tasks
+            rows = [tuple(map(str, row)) for row in rows]
+        if self.output_format == "tsv":
+            delimiter, escape = "\t", _tsv_value
+        else:
+            delimiter, escape = ",", _csv_value
+        text = "\n".join(map(delimiter.join, rows))
+        # A value with a delimiter or a line break adds one to the count
+        if (
+            text.count(delimiter) == len(rows) * (len(self.fields) - 1)
+            and text.count("\n") == len(rows) - 1
+            and "\r" not in text
+            and (delimiter == "\t" or '"' not in text)
+        ):
+            return text
+        return "\n".join(delimiter.join(map(escape, row)) for row in rows)
+
+    def _format_json_rows(self, rows: List[Tuple[Any, ...]], separator: str) -> str:
+        """The json objects of a chunk, joined with ``separator``.
+
+        The string values are quoted by the row template, unless one of the chunk
+        has characters to escape: the values are then encoded one by one.
+        """
+        strings = [index for index, value in enumerate(rows[0]) if isinstance(value, str)]
+        # Numbers, e.g. the number of tasks, are written as they are
+        values = rows if len(strings) == len(self.fields) else [[row[index] for index in strings] for row in rows]
+        clean = _JSON_SPECIAL.search(" ".join(map(" ".join, values))) is None
+        if not clean:
+            rows = [
+                tuple(encode_basestring(value) if isinstance(value, str) else value for value in row) for row in rows
+            ]
+        slots = ['"%s"' if clean and index in strings else "%s" for index in range(len(self.fields))]
+        template = "{" + ",".join(f"{encode_basestring(field)}:{slot}" for field, slot in zip(self.fields, slots)) + "}"
+        return separator.join(map(template.__mod__, rows))
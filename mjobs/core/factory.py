@@ -15,35 +15,59 @@
 # limitations under the License.
 
 import shutil
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
-from rich.console import Console
+if TYPE_CHECKING:
+    from rich.console import Console
 
-from mjobs.data import JobRepository, SlurmRepository, TestJobRepository
+    from mjobs.data import JobRepository
 
 
 def create_job_repository(
-    test_mode: bool = False, console: Optional[Console] = None, error_console: Optional[Console] = None
-) -> JobRepository:
+    test_mode: bool = False,
+    console: Optional["Console"] = None,
+    error_console: Optional["Console"] = None,
+    cache_ttl: float = 0,
+    clusters: Optional[List[str]] = None,
+    scheduler: str = "slurm",
+) -> "JobRepository":
     """Factory function to create the appropriate job repository.
 
     :param test_mode: If True, create test repository; otherwise create real repository
     :param console: Rich console for output (required for real repository)
     :param error_console: Rich console for errors (required for real repository)
-    :return: JobRepository instance (either SlurmRepository or TestJobRepository)
-    :raises RuntimeError: If Slurm is not available and not in test mode
+    :param cache_ttl: Share the scheduler snapshots between invocations for this many seconds (0: no cache)
+    :param clusters: Clusters to query concurrently (default: only the local cluster, Slurm only)
+    :param scheduler: The scheduler of the real repository, 'slurm' or 'lsf'
+    :return: JobRepository instance (SlurmRepository or LsfRepository, optionally cached, or TestJobRepository)
+    :raises RuntimeError: If the scheduler is not available and not in test mode
     """
+    # The repositories are imported when needed, detect_scheduler is on the start path of every command
     if test_mode:
-        return TestJobRepository()
+        from mjobs.data.test_repo import TestJobRepository
 
-    # Check for Slurm availability
-    if not shutil.which("squeue"):
-        raise RuntimeError("Slurm 'squeue' command not found. Use --test-data flag for testing without Slurm.")
+        return TestJobRepository(clusters=clusters)
+
+    command = "bjobs" if scheduler == "lsf" else "squeue"
+    if not shutil.which(command):
+        raise RuntimeError(f"'{command}' command not found. Use --test-data flag for testing without a scheduler.")
 
     if console is None or error_console is None:
-        raise ValueError("console and error_console are required for real Slurm repository")
+        raise ValueError(f"console and error_console are required for real {scheduler} repository")
+
+    if scheduler == "lsf":
+        from mjobs.data.lsf_repo import LsfRepository
+
+        repository = LsfRepository(console, error_console)
+    else:
+        from mjobs.data.slurm_repo import SlurmRepository
+
+        repository = SlurmRepository(console, error_console, clusters=clusters)
+    if cache_ttl > 0:
+        from mjobs.data.caching_repo import CachingJobRepository
 
-    return SlurmRepository(console, error_console)
+        return CachingJobRepository(repository, ttl=cache_ttl)
+    return repository
 
 
 def detect_scheduler() -> str:
@@ -14,21 +14,70 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List
+from time import monotonic
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
 
+from textual import work
 from textual.app import App, ComposeResult
 from textual.binding import Binding
 from textual.containers import Container
 from textual.screen import ModalScreen
+from textual.timer import Timer
 from textual.widgets import Footer, Header, Input, Label
 
+from mjobs.models import ArrayJobRecord, JobRecord, QueryError, collapse_arrays
+from mjobs.models.arrays import first_task_id, parse_array_id
 from mjobs.widgets.file_viewer import FileViewerScreen
 from mjobs.widgets.job_details import JobDetailsPanel
 from mjobs.widgets.jobs_table import JobsTable
 
 
+class RefreshPolicy:
+    """Adaptive interval between two automatic refreshes.
+
+    The interval grows by ``backoff`` after every refresh that changed nothing, up to
+    ``max_interval``, and goes back to ``interval`` as soon as something changes. It is
+    also kept above ``latency_factor`` times the duration of the last query, so a slow
+    slurmctld gets asked less often.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        max_interval: Optional[float] = None,
+        backoff: float = 1.5,
+        latency_factor: float = 10.0,
+    ):
+        self.base_interval = interval
+        self.max_interval = max_interval if max_interval is not None else interval * 6
+        self.backoff = backoff
+        self.latency_factor = latency_factor
+        self.interval = interval
+
+    def next_interval(self, changes: int, elapsed: float) -> float:
+        """Seconds to wait before the next refresh.
+
+        :param changes: Number of jobs added, removed or changed by the last refresh
+        :param elapsed: Duration of the last query, in seconds
+        :return: The delay until the next refresh
+        """
+        if changes:
+            self.interval = self.base_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return min(max(self.interval, elapsed * self.latency_factor), self.max_interval)
+
+
+def format_age(seconds: float) -> str:
+    """Format a number of seconds as ``42s`` or ``3m05s``."""
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    return f"{seconds // 60}m{seconds % 60:02d}s"
+
+
 class SearchScreen(ModalScreen[str]):
-    """Simple modal search screen."""
+    """Simple modal search screen, it reports the search text as it's typed."""
 
     BINDINGS = [
         Binding("escape", "cancel", "Cancel"),
@@ -37,15 +86,15 @@ class SearchScreen(ModalScreen[str]):
 
     CSS = """
     SearchScreen {
-        align: center middle;
+        align: center top;
     }
 
     #search_dialog {
         width: 90;
-        height: 15;
+        height: 11;
         border: thick $background 80%;
         background: $surface;
-        padding: 2;
+        padding: 0 2;
     }
 
     #search_input {
@@ -62,15 +111,34 @@ class SearchScreen(ModalScreen[str]):
     }
     """
 
+    def __init__(self, search_text: str = "", on_change: Optional[Callable[[str], None]] = None, **kwargs):
+        """Initialize the search screen.
+
+        :param search_text: Current search, to refine it
+        :param on_change: Called with the search text on every change
+        """
+        super().__init__(**kwargs)
+        self.search_text = search_text
+        self.on_change = on_change
+
     def compose(self) -> ComposeResult:
         with Container(id="search_dialog"):
             yield Label("Search Jobs")
-            yield Input(placeholder="Filter by job name, state, user, command...", id="search_input")
+            yield Input(
+                value=self.search_text,
+                placeholder="Filter by job name, state, user, command... or state:RUNNING mem>32G name~regex",
+                id="search_input",
+            )
 
     def on_mount(self):
         search_input = self.query_one("#search_input", Input)
         search_input.focus()
 
+    def on_input_changed(self, event: Input.Changed):
+        """Filter the jobs as the search is typed."""
+        if self.on_change is not None:
+            self.on_change(event.value)
+
     def action_submit(self):
         search_input = self.query_one("#search_input", Input)
         search_text = search_input.value
@@ -136,82 +204,242 @@ class Dashboard(App):
         Binding("enter", "show_details", "Show Details"),
         Binding("escape", "hide_details", "Hide Details"),
         Binding("r", "refresh", "Refresh"),
+        Binding("a", "toggle_arrays", "Collapse Arrays"),
+        Binding("x", "toggle_array", "Expand Array"),
         Binding("o", "open_stdout", "Open StdOut"),
         Binding("e", "open_stderr", "Open StdErr"),
         Binding("ctrl+o", "copy_stdout_path", "Copy StdOut Path"),
         Binding("ctrl+e", "copy_stderr_path", "Copy StdErr Path"),
     ]
 
-    def __init__(self, slurm_instance, **kwargs):
+    # Seconds without typing before the table follows the search, updating thousands of rows takes a while
+    SEARCH_DELAY = 0.15
+    # Jobs prefetched around the cursor, no more than the repository asks scontrol for one
+    # by one (SlurmRepository.SCONTROL_PER_JOB_MAX) so a prefetch never dumps all the jobs
+    PREFETCH_MAX = 8
+
+    def __init__(self, slurm_instance, refresh_interval: float = 10.0, **kwargs):
         super().__init__(**kwargs)
         self.slurm = slurm_instance
+        # Awaited by the workers, so the event loop never blocks on squeue or scontrol
+        self.repository = slurm_instance.job_repository.as_async()
         self.jobs = []
         self.details_visible = False
+        # No automatic refresh if the interval is 0
+        self.refresh_policy = RefreshPolicy(refresh_interval) if refresh_interval > 0 else None
+        self.last_refresh: Optional[float] = None
+        self.next_refresh: Optional[float] = None
+        self._refresh_timer: Optional[Timer] = None
+        self._search_timer: Optional[Timer] = None
+        # squeue (or bjobs) arguments of the last refresh
+        self._fetched_args: List[str] = []
+        # Job arrays are shown as one row per state, except the (cluster, array id) expanded
+        self.collapse_arrays = True
+        self.expanded_arrays: Set[Tuple[str, str]] = set()
+        # First row on screen and cursor row of the last prefetch
+        self._prefetched_position: Optional[Tuple[int, int]] = None
 
     def compose(self) -> ComposeResult:
         """Create child widgets for the app."""
         yield Header()
-        yield JobsTable(id="jobs_table")
+        yield JobsTable(id="jobs_table", show_cluster=bool(getattr(self.slurm.args, "clusters", None)), show_tasks=True)
         yield JobDetailsPanel(id="details_panel")
         yield Footer()
 
     def on_mount(self) -> None:
         """Called when app starts."""
         self.title = "mjobs dashboard"
+        self.sub_title = "loading..."
+        self.set_interval(1, self._update_refresh_age)
         self.refresh_jobs()
 
     def refresh_jobs(self):
-        """Refresh job data."""
+        """Refresh job data.
+
+        The query is awaited in a worker so the UI stays responsive, the table is
+        updated once it's done. A refresh still in progress is cancelled.
+        """
+        if self._refresh_timer is not None:
+            self._refresh_timer.stop()
+            self._refresh_timer = None
+        self._fetched_args = self._build_extra_args()
+        self._fetch_jobs(self._fetched_args)
+
+    @work(exclusive=True, group="refresh")
+    async def _fetch_jobs(self, extra_args: List[str]):
+        """Await the jobs from the repository (could be real or test implementation).
+
+        A refresh that is superseded is cancelled, and its squeue killed.
+        """
+        started = monotonic()
         try:
-            # Get jobs from slurm instance (could be real or test implementation)
-            extra_args = self._build_extra_args()
-            self.jobs = self.slurm.get_jobs(self.slurm.args.job_id, extra_args)
+            jobs = await self.repository.get_jobs(self.slurm.args.job_id, extra_args)
+        except Exception as e:
+            self._refresh_failed(e, monotonic() - started)
+            return
+        self._apply_jobs(jobs, monotonic() - started)
 
-            # Update table
-            jobs_table = self.query_one("#jobs_table", JobsTable)
-            jobs_table.populate_table(self.jobs)
+    def _apply_jobs(self, jobs, elapsed: float):
+        """Show the jobs of a completed refresh."""
+        self.jobs = jobs
+        jobs_table = self.query_one("#jobs_table", JobsTable)
+        changes = jobs_table.populate_table(self._displayed_jobs())
+        self._schedule_refresh(changes, elapsed)
+
+    def _displayed_jobs(self) -> List[JobRecord]:
+        """The rows of the table: the jobs, with the arrays that are not expanded collapsed."""
+        if not self.collapse_arrays:
+            return self.jobs
+        return collapse_arrays(self.jobs, self.expanded_arrays)
+
+    def action_toggle_arrays(self):
+        """Collapse all the job arrays, or show all their tasks."""
+        self.collapse_arrays = not self.collapse_arrays
+        self.expanded_arrays.clear()
+        self.query_one("#jobs_table", JobsTable).populate_table(self._displayed_jobs())
+
+    def action_toggle_array(self):
+        """Show the tasks of the selected job array, or collapse them again."""
+        selected_job = self.query_one("#jobs_table", JobsTable).get_selected_job()
+        if selected_job is None or not self.collapse_arrays:
+            return
+        parsed = parse_array_id(selected_job.job_id)
+        if parsed is None:
+            self.notify("Not a job array", severity="warning")
+            return
+        array = (selected_job.cluster, parsed[0])
+        if isinstance(selected_job, ArrayJobRecord):
+            self.expanded_arrays.add(array)
+        else:
+            self.expanded_arrays.discard(array)
+        jobs_table = self.query_one("#jobs_table", JobsTable)
+        jobs_table.populate_table(self._displayed_jobs())
 
-        except Exception as e:
-            self.notify(f"Error refreshing jobs: {e}", severity="error")
+        # The selected row was replaced, stay on the array
+        for row, job in enumerate(jobs_table.filtered_jobs):
+            parsed = parse_array_id(job.job_id)
+            if parsed is not None and (job.cluster, parsed[0]) == array:
+                jobs_table.move_cursor(row=row)
+                break
 
-    def _build_extra_args(self) -> List[str]:
-        """Build extra arguments for slurm job query."""
-        extra_args = []
-        args = self.slurm.args
-
-        if args.user:
-            extra_args.extend(["-u", args.user])
-        if args.partition:
-            extra_args.extend(["-p", args.partition])
-        for state in args.states or []:
-            extra_args.extend(["-t", state])
-        for node in args.nodelist or []:
-            extra_args.extend(["-w", node])
+    def on_data_table_row_highlighted(self, message: JobsTable.RowHighlighted):
+        self._page_changed()
+
+    def on_jobs_table_scrolled(self, message: JobsTable.Scrolled):
+        self._page_changed()
+
+    def _page_changed(self):
+        """Prefetch the details of the jobs around the cursor when the page or the cursor moved.
+
+        Refreshes don't prefetch: the details of the active jobs expire between them,
+        reading them again on every refresh would keep slurmctld busy.
+        """
+        jobs_table = self.query_one("#jobs_table", JobsTable)
+        position = (int(jobs_table.scroll_y), jobs_table.cursor_row)
+        if position == self._prefetched_position:
+            return
+        self._prefetched_position = position
+        page = jobs_table.page_jobs()
+        cursor = max(jobs_table.cursor_row - position[0], 0)
+        # The selected job first, then the ones below it and above it
+        nearest = page[cursor:] + page[:cursor][::-1]
+        self._prefetch_details([first_task_id(job.job_id) for job in nearest[: self.PREFETCH_MAX]])
+
+    @work(exclusive=True, group="details")
+    async def _prefetch_details(self, job_ids: List[str]):
+        """Read the details of the jobs around the cursor, so opening them is instant."""
+        if not job_ids:
+            return
+        try:
+            await self.repository.get_jobs_details(job_ids)
+        except Exception:
+            # They will be asked for again, one by one, when a job is opened
+            pass
 
+    def _refresh_failed(self, error: Exception, elapsed: float):
+        self.notify(f"Error refreshing jobs: {error}", severity="error")
+        self._schedule_refresh(0, elapsed)
+
+    def _schedule_refresh(self, changes: int, elapsed: float):
+        """Plan the next automatic refresh, backing off while nothing changes."""
+        self.last_refresh = monotonic()
+        if self.refresh_policy is not None:
+            interval = self.refresh_policy.next_interval(changes, elapsed)
+            self.next_refresh = self.last_refresh + interval
+            self._refresh_timer = self.set_timer(interval, self.refresh_jobs)
+        self._update_refresh_age()
+
+    def _update_refresh_age(self):
+        """Show how long ago the jobs were refreshed in the header."""
+        if self.last_refresh is None:
+            return
+        now = monotonic()
+        sub_title = f"updated {format_age(now - self.last_refresh)} ago"
+        if self._refresh_timer is not None and self.next_refresh is not None:
+            sub_title += f", next in {format_age(max(self.next_refresh - now, 0))}"
+        self.sub_title = sub_title
+
+    def _build_extra_args(self) -> List[str]:
+        """Build extra arguments for the job query: the command line filters (squeue or bjobs ones) and the search."""
+        extra_args = self.slurm.filter_args()
+        extra_args.extend(self._search_args(extra_args))
         return extra_args
 
+    def _search_args(self, extra_args: List[str]) -> List[str]:
+        """Scheduler arguments for the terms of the search that the scheduler can evaluate (see plan_filters).
+
+        The table still evaluates the whole search, which covers the jobs fetched
+        before it changed.
+        """
+        query = self.query_one("#jobs_table", JobsTable).query
+        repository = getattr(self.slurm, "job_repository", None)
+        if query is None or repository is None:
+            return []
+        return repository.plan_filters(query, extra_args)[0]
+
     def action_search(self):
-        """Show search modal."""
+        """Show search modal, the jobs are filtered as the search is typed."""
+        jobs_table = self.query_one("#jobs_table", JobsTable)
 
         def handle_search(search_text: str):
-            if search_text:
-                jobs_table = self.query_one("#jobs_table", JobsTable)
+            self._cancel_live_search()
+            try:
                 jobs_table.filter_jobs(search_text)
+            except QueryError as e:
+                self.notify(str(e), severity="error", timeout=5)
+                return
+            if self._build_extra_args() != self._fetched_args:
+                # squeue filters on the search now, or stopped to, get the jobs again
+                self.refresh_jobs()
+            if search_text:
                 self.notify(f"Filtered jobs by: {search_text}", timeout=2)
             else:
-                # Clear filter
-                jobs_table = self.query_one("#jobs_table", JobsTable)
-                jobs_table.filter_jobs("")
                 self.notify("Cleared filter", timeout=2)
 
-        self.push_screen(SearchScreen(), handle_search)
+        self.push_screen(SearchScreen(jobs_table.search_text, on_change=self._live_search), handle_search)
+
+    def _live_search(self, search_text: str) -> None:
+        """Filter the table once the typing pauses."""
+        self._cancel_live_search()
+        jobs_table = self.query_one("#jobs_table", JobsTable)
+
+        def apply_search():
+            try:
+                jobs_table.filter_jobs(search_text)
+            except QueryError:
+                # Most likely a query that's still being typed, it's reported when submitted
+                pass
+
+        self._search_timer = self.set_timer(self.SEARCH_DELAY, apply_search)
+
+    def _cancel_live_search(self) -> None:
+        if self._search_timer is not None:
+            self._search_timer.stop()
+            self._search_timer = None
 
     def on_jobs_table_row_selected(self, message: JobsTable.RowSelected):
         """Handle job selection from table."""
-        details_panel = self.query_one("#details_panel", JobDetailsPanel)
-        details_panel.update_job_details(message.job, slurm_instance=self.slurm)
-        details_panel.add_class("visible")
-        self.details_visible = True
+        self._show_job_details(message.job)
 
     def action_show_details(self):
         """Show details panel for selected job."""
@@ -219,10 +447,30 @@ class Dashboard(App):
         selected_job = jobs_table.get_selected_job()
 
         if selected_job:
-            details_panel = self.query_one("#details_panel", JobDetailsPanel)
-            details_panel.update_job_details(selected_job, slurm_instance=self.slurm)
-            details_panel.add_class("visible")
-            self.details_visible = True
+            self._show_job_details(selected_job)
+
+    def _show_job_details(self, job: JobRecord):
+        """Show the panel with what the listing knows of the job, then with its scontrol details."""
+        details_panel = self.query_one("#details_panel", JobDetailsPanel)
+        details_panel.update_job_details(job)
+        details_panel.add_class("visible")
+        self.details_visible = True
+        self._load_job_details(job)
+
+    @work(exclusive=True, group="job_details")
+    async def _load_job_details(self, job: JobRecord):
+        """Await the details of the job, and show them if the panel still shows it.
+
+        A row of several array tasks shows the details of its first task.
+        """
+        try:
+            details = await self.repository.get_job_details(first_task_id(job.job_id))
+        except Exception as e:
+            self.notify(f"Error getting the details of {job.job_id}: {e}", severity="error")
+            return
+        details_panel = self.query_one("#details_panel", JobDetailsPanel)
+        if details and details_panel.current_job is job:
+            details_panel.update_job_details(job, details)
 
     def action_hide_details(self):
         """Hide details panel."""
@@ -234,7 +482,7 @@ class Dashboard(App):
     def action_refresh(self):
         """Manually refresh job data."""
         self.refresh_jobs()
-        self.notify("Jobs refreshed", timeout=2)
+        self.notify("Refreshing jobs", timeout=2)
 
     def action_open_stdout(self):
         """Open stdout file for the selected job."""
@@ -244,20 +492,33 @@ class Dashboard(App):
         """Open stderr file for the selected job."""
         self._open_specific_file("StdErr")
 
-    def _open_specific_file(self, file_type: str):
-        """Open a specific file type (StdOut, StdErr, StdIn) for the selected job."""
-        jobs_table = self.query_one("#jobs_table", JobsTable)
-        selected_job = jobs_table.get_selected_job()
+    async def _selected_job_details(self) -> Tuple[Optional[JobRecord], Dict[str, Any]]:
+        """The selected job and its details, awaited from the repository.
+
+        The files of a row of several array tasks are those of its first task, the
+        others are reached by expanding the array.
 
+        :return: The job, None if no job is selected (it's reported), and its details
+        """
+        selected_job = self.query_one("#jobs_table", JobsTable).get_selected_job()
         if not selected_job:
             self.notify("No job selected", severity="warning")
-            return
+            return None, {}
+        job_id = first_task_id(selected_job.job_id)
+        if job_id != selected_job.job_id:
+            self.notify(f"Using the task {job_id} of {selected_job.job_id}, expand the array (x) for the others")
+        try:
+            return selected_job, await self.repository.get_job_details(job_id)
+        except Exception as e:
+            self.notify(f"Error getting the details of {job_id}: {e}", severity="error")
+            return None, {}
 
-        # Get job details to find file paths
-        if hasattr(self.slurm, "get_job_details"):
-            details = self.slurm.get_job_details(selected_job.job_id)
-        else:
-            details = {}
+    @work(exclusive=True, group="job_file")
+    async def _open_specific_file(self, file_type: str):
+        """Open a specific file type (StdOut, StdErr, StdIn) for the selected job."""
+        selected_job, details = await self._selected_job_details()
+        if not selected_job:
+            return
 
         # Check if the requested file type exists and is valid
         if file_type not in details:
@@ -269,18 +530,22 @@ class Dashboard(App):
             self.notify(f"{file_type} is not a valid file path: {file_path}", severity="info")
             return
 
-        # Open the specific file
-        self.open_file_viewer(file_path)
+        # Open the specific file, following the output of running jobs
+        self.open_file_viewer(file_path, follow=selected_job.job_state == "RUNNING")
 
-    def open_file_viewer(self, file_path: str):
-        """Open the file viewer overlay for the given file path."""
+    def open_file_viewer(self, file_path: str, follow: bool = False):
+        """Open the file viewer overlay for the given file path.
+
+        :param file_path: The file to show
+        :param follow: Show what is appended to the file as it's written
+        """
 
         def handle_viewer_result(result):
             # File viewer doesn't return anything, just closes
             pass
 
         try:
-            viewer = FileViewerScreen(file_path)
+            viewer = FileViewerScreen(file_path, follow=follow)
             self.push_screen(viewer, handle_viewer_result)
         except Exception as e:
             self.notify(f"Error opening file viewer: {e}", severity="error")
@@ -293,21 +558,13 @@ class Dashboard(App):
         """Copy stderr file path to clipboard."""
         self._copy_file_path("StdErr")
 
-    def _copy_file_path(self, file_type: str):
+    @work(exclusive=True, group="job_file")
+    async def _copy_file_path(self, file_type: str):
         """Copy a specific file path to clipboard."""
-        jobs_table = self.query_one("#jobs_table", JobsTable)
-        selected_job = jobs_table.get_selected_job()
-
+        selected_job, details = await self._selected_job_details()
         if not selected_job:
-            self.notify("No job selected", severity="warning")
             return
 
-        # Get job details (reusing existing logic)
-        if hasattr(self.slurm, "get_job_details"):
-            details = self.slurm.get_job_details(selected_job.job_id)
-        else:
-            details = {}
-
         if file_type not in details:
             self.notify(f"{file_type} not found for this job", severity="warning")
             return
@@ -329,7 +586,11 @@ class Dashboard(App):
         self.exit()
 
 
-def launch_dashboard(slurm_instance):
-    """Launch the interactive dashboard."""
-    app = Dashboard(slurm_instance)
+def launch_dashboard(slurm_instance, refresh_interval: float = 10.0):
+    """Launch the interactive dashboard.
+
+    :param slurm_instance: The Slurm or LSF instance to get the jobs from
+    :param refresh_interval: Seconds between two automatic refreshes, 0 to disable them
+    """
+    app = Dashboard(slurm_instance, refresh_interval=refresh_interval)
     app.run()
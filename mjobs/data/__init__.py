@@ -14,8 +14,50 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from importlib import import_module
+from typing import TYPE_CHECKING
+
 from .repository import JobRepository
-from .slurm_repo import SlurmRepository
-from .test_repo import TestJobRepository
 
-__all__ = ["JobRepository", "SlurmRepository", "TestJobRepository"]
+if TYPE_CHECKING:
+    from .async_repo import AsyncJobRepository, AsyncSlurmRepository, ThreadedJobRepository
+    from .caching_repo import CachingJobRepository
+    from .details_cache import JobDetailsCache
+    from .lsf_repo import LsfRepository
+    from .slurm_repo import SlurmRepository
+    from .test_repo import TestJobRepository
+
+# The module of each repository, imported on first use: a command only loads
+# the repository it runs, and asyncio only comes with the async ones
+_LAZY_EXPORTS = {
+    "AsyncJobRepository": ".async_repo",
+    "AsyncSlurmRepository": ".async_repo",
+    "ThreadedJobRepository": ".async_repo",
+    "CachingJobRepository": ".caching_repo",
+    "JobDetailsCache": ".details_cache",
+    "LsfRepository": ".lsf_repo",
+    "SlurmRepository": ".slurm_repo",
+    "TestJobRepository": ".test_repo",
+}
+
+__all__ = [
+    "AsyncJobRepository",
+    "AsyncSlurmRepository",
+    "CachingJobRepository",
+    "JobDetailsCache",
+    "JobRepository",
+    "LsfRepository",
+    "SlurmRepository",
+    "TestJobRepository",
+    "ThreadedJobRepository",
+]
+
+
+def __getattr__(name: str):
+    """Import a repository the first time it's used."""
+    module = _LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module, __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from abc import ABC, abstractmethod
+from subprocess import DEVNULL, PIPE, CalledProcessError
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+from mjobs.models import JobRecord
+
+from mjobs.data.repository import JobRepository, JobRepositoryError
+
+if TYPE_CHECKING:
+    from mjobs.data.slurm_repo import SlurmRepository
+
+
+async def run_command(args: List[str], timeout: Optional[float] = None, quiet: bool = False) -> str:
+    """Run a command without blocking the event loop and return its output, like ``check_output``.
+
+    The command is killed if it runs for longer than ``timeout``, or if the
+    awaiting task is cancelled.
+
+    :param args: The command and its arguments
+    :param timeout: Seconds to wait at most (default: no limit)
+    :param quiet: Discard the stderr of the command
+    :return: The standard output
+    :raises CalledProcessError: If the command exits with a non-zero status
+    :raises JobRepositoryError: If the command can't be started or times out
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(*args, stdout=PIPE, stderr=DEVNULL if quiet else None)
+    except OSError as e:
+        raise JobRepositoryError(f"Failed to run {args[0]}: {e}", original_error=e)
+
+    try:
+        stdout, _ = await asyncio.wait_for(process.communicate(), timeout)
+    except asyncio.TimeoutError as e:
+        raise JobRepositoryError(f"{args[0]} timed out after {timeout:g}s", original_error=e)
+    finally:
+        if process.returncode is None:
+            # Timed out or cancelled, don't leave the command running
+            process.kill()
+            await asyncio.shield(process.wait())
+
+    output = stdout.decode(errors="replace")
+    if process.returncode != 0:
+        raise CalledProcessError(process.returncode, args, output)
+    return output
+
+
+class AsyncJobRepository(ABC):
+    """Abstract repository interface for awaiting the job data from an event loop.
+
+    It mirrors :class:`JobRepository`, the Textual dashboard awaits it in its
+    workers: a refresh that is superseded is cancelled, and so is its scheduler
+    command, and the job list and job details can be fetched at the same time.
+    """
+
+    @abstractmethod
+    async def get_jobs(
+        self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None
+    ) -> List[JobRecord]:
+        """Retrieve jobs based on criteria.
+
+        :param job_ids: Specific job IDs to fetch (optional)
+        :param extra_args: Additional arguments for job filtering (optional)
+        :return: List of JobRecord instances
+        :raises JobRepositoryError: If job retrieval fails
+        """
+        pass
+
+    @abstractmethod
+    async def get_job_details(self, job_id: str) -> Dict[str, Any]:
+        """Get detailed information for a specific job.
+
+        :param job_id: The job ID to get details for
+        :return: Dictionary containing detailed job information
+        :raises JobRepositoryError: If job details retrieval fails
+        """
+        pass
+
+    async def get_jobs_details(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get detailed information for many jobs, all at once.
+
+        Repositories that can query many jobs with one call override this, by
+        default :meth:`get_job_details` is awaited for all the jobs concurrently.
+
+        :param job_ids: The job IDs to get details for
+        :return: Details by job ID, jobs that were not found are missing
+        :raises JobRepositoryError: If job details retrieval fails
+        """
+        job_ids = list(job_ids)
+        results = await asyncio.gather(*(self.get_job_details(job_id) for job_id in job_ids))
+        return {job_id: details for job_id, details in zip(job_ids, results) if details}
+
+    def invalidate(self) -> None:
+        """Forget any cached job data, the next query goes to the scheduler."""
+
+
+class ThreadedJobRepository(AsyncJobRepository):
+    """Awaitable view of a blocking :class:`JobRepository`, its calls run in a worker thread.
+
+    A cancelled call is not interrupted, its result is dropped.
+    """
+
+    def __init__(self, repository: JobRepository):
+        """Wrap a repository.
+
+        :param repository: The blocking repository
+        """
+        self.repository = repository
+
+    async def get_jobs(
+        self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None
+    ) -> List[JobRecord]:
+        return await asyncio.to_thread(self.repository.get_jobs, job_ids, extra_args)
+
+    async def get_job_details(self, job_id: str) -> Dict[str, Any]:
+        return await asyncio.to_thread(self.repository.get_job_details, job_id)
+
+    async def get_jobs_details(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return await asyncio.to_thread(self.repository.get_jobs_details, list(job_ids))
+
+    def invalidate(self) -> None:
+        self.repository.invalidate()
+
+
+class AsyncSlurmRepository(AsyncJobRepository):
+    """Runs squeue and scontrol as asyncio subprocesses.
+
+    It shares the command lines, the parsers, the details cache and the clusters
+    of a :class:`SlurmRepository`, so the jobs and details it fetches are the
+    same, and cached in the same place, as the blocking calls. Every command is
+    killed after ``timeout`` seconds.
+    """
+
+    # Seconds a squeue or scontrol call may take, slurmctld can be very slow under load
+    DEFAULT_TIMEOUT = 60.0
+
+    def __init__(self, repository: "SlurmRepository", timeout: Optional[float] = None):
+        """Initialize the repository.
+
+        :param repository: The blocking repository whose commands and parsers are used
+        :param timeout: Seconds a command may take (default: ``DEFAULT_TIMEOUT``)
+        """
+        self.repository = repository
+        self.timeout = timeout if timeout is not None else self.DEFAULT_TIMEOUT
+
+    async def get_jobs(
+        self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None
+    ) -> List[JobRecord]:
+        """Retrieve jobs from Slurm using squeue, the clusters are queried concurrently.
+
+        :param job_ids: Specific job IDs to fetch (optional)
+        :param extra_args: Additional squeue arguments (optional)
+        :return: List of JobRecord instances
+        :raises JobRepositoryError: If squeue command fails, times out or parsing fails
+        """
+        repository = self.repository
+        if not repository.clusters:
+            jobs = await self._get_jobs(job_ids, extra_args)
+        else:
+            results = await asyncio.gather(
+                *(self._get_jobs(job_ids, ["-M", cluster] + list(extra_args or [])) for cluster in repository.clusters),
+                return_exceptions=True,
+            )
+            jobs = repository.merge_cluster_jobs(zip(repository.clusters, results))
+        repository.track_jobs(jobs)
+        return jobs
+
+    async def _get_jobs(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> List[JobRecord]:
+        """Run the squeue commands of the blocking repository, with the same json fallback and completion."""
+        repository = self.repository
+        for squeue_cmd, json_output in repository.squeue_commands(job_ids, extra_args):
+            try:
+                output = await run_command(squeue_cmd, self.timeout, quiet=json_output)
+                jobs = repository.parse_squeue(output, json_output)
+                break
+            except Exception as e:
+                error = repository.squeue_failed(e, json_output)
+                if error is not None:
+                    raise error
+        else:
+            raise AssertionError("squeue_commands always ends with the --format command")
+
+        cut_job_ids = repository.cut_job_ids(jobs)
+        if cut_job_ids:
+            # The first time, the Slurm version is checked with a blocking squeue --version
+            json_cmd = await asyncio.to_thread(repository.cut_jobs_command, cut_job_ids, job_ids, extra_args)
+            if json_cmd:
+                try:
+                    jobs = repository.complete_jobs(jobs, await run_command(json_cmd, self.timeout, quiet=True))
+                except (CalledProcessError, JobRepositoryError, ValueError) as e:
+                    repository.squeue_failed(e, True)
+        return jobs
+
+    async def get_job_details(self, job_id: str) -> Dict[str, Any]:
+        """Get detailed job information using scontrol show job, cached like the blocking calls.
+
+        :param job_id: The job ID to get details for
+        :return: Dictionary containing parsed job details
+        :raises JobRepositoryError: If scontrol command fails or times out
+        """
+        repository = self.repository
+        job_id = str(job_id)
+        details = repository.details_cache.get(job_id)
+        if details is not None:
+            return details
+
+        try:
+            output = await run_command(repository.job_details_command(job_id), self.timeout)
+        except CalledProcessError as e:
+            # Don't raise for non-existent jobs, return empty dict
+            if e.returncode == 1:
+                return {}
+            raise JobRepositoryError(
+                f"scontrol show job {job_id} failed with exit code {e.returncode}: {e}", original_error=e
+            )
+        return repository.store_job_details(job_id, output)
+
+    async def get_jobs_details(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the details of many jobs, planned like :meth:`SlurmRepository.get_jobs_details`.
+
+        The jobs asked for one by one, or the dumps of the clusters, are awaited concurrently.
+
+        :param job_ids: The job IDs to get details for
+        :return: Details by job ID, jobs that were not found are missing
+        :raises JobRepositoryError: If scontrol command fails or times out
+        """
+        repository = self.repository
+        details, per_job, dumps = repository.plan_jobs_details(job_ids)
+        for job_id, job_details in zip(per_job, await asyncio.gather(*map(self.get_job_details, per_job))):
+            if job_details:
+                details[job_id] = job_details
+
+        async def get_cluster_dump(cluster: str) -> str:
+            try:
+                return await run_command(repository.details_dump_command(cluster), self.timeout)
+            except CalledProcessError as e:
+                raise JobRepositoryError(
+                    f"scontrol show job failed with exit code {e.returncode}: {e}", original_error=e
+                )
+
+        clusters = list(dumps)
+        for cluster, output in zip(clusters, await asyncio.gather(*map(get_cluster_dump, clusters))):
+            details.update(repository.store_details_dump(cluster, output, dumps[cluster]))
+        return details
+
+    def invalidate(self) -> None:
+        """Forget the cached job details."""
+        self.repository.invalidate()
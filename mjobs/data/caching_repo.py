@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from mjobs.models import JOB_FIELDS, JobQuery, JobRecord
+
+from .repository import JobRepository
+
+# Bump when the layout of the cache files changes
+CACHE_VERSION = 2
+
+
+def default_cache_dir() -> Path:
+    """Per-user directory for the snapshot cache.
+
+    ``$XDG_RUNTIME_DIR`` is private to the user and lives in memory, otherwise
+    a ``mjobs-<uid>`` directory in the temporary directory is used.
+
+    :return: Path of the cache directory (it may not exist yet)
+    """
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "mjobs"
+    return Path(tempfile.gettempdir()) / f"mjobs-{os.getuid()}"
+
+
+class CachingJobRepository(JobRepository):
+    """Shares the job snapshots (of squeue or bjobs) between mjobs invocations through files.
+
+    The parsed jobs of a query are stored in the cache directory for ``ttl``
+    seconds, keyed on the :meth:`JobRepository.snapshot_key` of the wrapped
+    repository, the scheduler command it would run. When the snapshot is missing
+    or stale, the first invocation takes a file lock and queries the scheduler
+    while the others wait for it and then read its snapshot, so a ``watch`` loop
+    in many terminals costs one scheduler call per ``ttl``.
+
+    The cache is best effort: if the directory can't be used, or the wrapped
+    repository has no snapshot key, the queries go straight to the wrapped repository.
+    """
+
+    def __init__(self, repository: JobRepository, ttl: float = 10.0, cache_dir: Optional[Path] = None):
+        """Initialize the caching repository.
+
+        :param repository: The repository that runs the scheduler commands
+        :param ttl: Seconds a snapshot is considered fresh
+        :param cache_dir: Where to keep the snapshots (default: :func:`default_cache_dir`)
+        """
+        self.repository = repository
+        self.ttl = ttl
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else default_cache_dir()
+
+    def get_jobs(self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None) -> List[JobRecord]:
+        """Retrieve jobs from a fresh snapshot, or from the scheduler to make a new one.
+
+        :param job_ids: Specific job IDs to fetch (optional)
+        :param extra_args: Additional scheduler arguments (optional)
+        :return: List of JobRecord instances
+        :raises JobRepositoryError: If the scheduler command fails or parsing fails
+        """
+        path = self._snapshot_path(job_ids, extra_args)
+        if path is None:
+            return self.repository.get_jobs(job_ids, extra_args)
+
+        jobs = self._read_snapshot(path)
+        if jobs is None:
+            with self._lock(path):
+                # Someone else may have refreshed it while we were waiting for the lock
+                jobs = self._read_snapshot(path)
+                if jobs is None:
+                    jobs = self.repository.get_jobs(job_ids, extra_args)
+                    self._write_snapshot(path, jobs)
+                    return jobs
+
+        self.repository.track_jobs(jobs)
+        return jobs
+
+    def iter_jobs(
+        self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None
+    ) -> Iterator[JobRecord]:
+        """Iterate over a fresh snapshot, or stream the jobs from the scheduler (without caching them).
+
+        :param job_ids: Specific job IDs to fetch (optional)
+        :param extra_args: Additional scheduler arguments (optional)
+        :return: Iterator of JobRecord instances
+        :raises JobRepositoryError: If the scheduler command fails or parsing fails
+        """
+        path = self._snapshot_path(job_ids, extra_args)
+        jobs = self._read_snapshot(path) if path is not None else None
+        if jobs is not None:
+            return iter(jobs)
+        return self.repository.iter_jobs(job_ids, extra_args)
+
+    def get_job_details(self, job_id: str) -> Dict[str, Any]:
+        """Get detailed job information, cached in memory by the wrapped repository.
+
+        :param job_id: The job ID to get details for
+        :return: Dictionary containing parsed job details
+        :raises JobRepositoryError: If the scheduler command fails
+        """
+        return self.repository.get_job_details(job_id)
+
+    def get_jobs_details(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the details of many jobs, like the wrapped repository.
+
+        :param job_ids: The job IDs to get details for
+        :return: Details by job ID, jobs that were not found are missing
+        :raises JobRepositoryError: If the scheduler command fails
+        """
+        return self.repository.get_jobs_details(job_ids)
+
+    def plan_filters(self, query: JobQuery, extra_args: Optional[List[str]] = None) -> Tuple[List[str], JobQuery]:
+        """Push the terms of a query down to the scheduler, like the wrapped repository.
+
+        :param query: The query
+        :param extra_args: The scheduler arguments that are already used (optional)
+        :return: The arguments to add to ``extra_args``, and the rest of the query
+        """
+        return self.repository.plan_filters(query, extra_args)
+
+    def invalidate(self) -> None:
+        """Remove the snapshots, the next query of every invocation goes to the scheduler."""
+        if not self.cache_dir.is_dir():
+            return
+        for path in self.cache_dir.glob("jobs-*.json"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        self.repository.invalidate()
+
+    def cache_key(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> Optional[str]:
+        """Key of the snapshot for a query, a hash of the snapshot key of the repository and the record layout.
+
+        :param job_ids: Job IDs to include
+        :param extra_args: Additional arguments
+        :return: Hexadecimal key, None if the repository doesn't share its listings
+        """
+        snapshot_key = self.repository.snapshot_key(job_ids, extra_args)
+        if snapshot_key is None:
+            return None
+        key = json.dumps([CACHE_VERSION, JOB_FIELDS, type(self.repository).__name__, snapshot_key])
+        return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+    def _snapshot_path(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> Optional[Path]:
+        """Path of the snapshot of a query, None if it can't be cached or the cache directory is unusable."""
+        key = self.cache_key(job_ids, extra_args)
+        if key is None:
+            return None
+        try:
+            self.cache_dir.mkdir(mode=0o700, parents=True, exist_ok=True)
+            # Don't read or write snapshots in a directory another user controls
+            if self.cache_dir.stat().st_uid != os.getuid():
+                return None
+        except OSError:
+            return None
+        return self.cache_dir / f"jobs-{key}.json"
+
+    def _read_snapshot(self, path: Path) -> Optional[List[JobRecord]]:
+        """Load a snapshot if it exists and is younger than the TTL."""
+        try:
+            if time.time() - path.stat().st_mtime > self.ttl:
+                return None
+            with open(path) as snapshot:
+                data = json.load(snapshot)
+            return [JobRecord(*values) for values in data["jobs"]]
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_snapshot(self, path: Path, jobs: List[JobRecord]) -> None:
+        """Atomically replace the snapshot, readers never see a partial file."""
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=".jobs-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as snapshot:
+                    json.dump({"version": CACHE_VERSION, "jobs": [job.as_tuple() for job in jobs]}, snapshot)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError:
+            pass
+
+    @contextmanager
+    def _lock(self, path: Path) -> Iterator[None]:
+        """Exclusive lock on a snapshot, held while it is refreshed."""
+        if fcntl is None:
+            yield
+            return
+        try:
+            lock_file = open(path.with_suffix(".lock"), "a")
+        except OSError:
+            yield
+            return
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
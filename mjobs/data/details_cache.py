@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from mjobs.models import TERMINAL_JOB_STATES, JobRecord
+
+
+class JobDetailsCache:
+    """Bounded LRU cache of job details, with a time to live per entry.
+
+    The details of jobs in a terminal state don't change anymore and are kept
+    for ``terminal_ttl``, the others for ``ttl``. An entry is also dropped as
+    soon as a squeue snapshot shows the job in another state than the one its
+    details were read in (see :meth:`update_states`).
+
+    It's shared by the dashboard UI and its refresh worker, so it's thread safe.
+    """
+
+    def __init__(self, maxsize: int = 2048, ttl: float = 30.0, terminal_ttl: float = 600.0):
+        """Initialize the cache.
+
+        :param maxsize: Maximum number of jobs kept, the least recently used go first. It holds
+            a few pages of the --extended listing (``Slurm.DETAILS_PAGE_SIZE`` jobs each)
+        :param ttl: Seconds the details of an active job are kept
+        :param terminal_ttl: Seconds the details of a finished job are kept
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.terminal_ttl = terminal_ttl
+        # job id -> (expiry time, job state, details)
+        self._entries: "OrderedDict[str, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Details of a job, if cached and not expired.
+
+        :param job_id: The job ID
+        :return: A copy of the details, or None
+        """
+        with self._lock:
+            entry = self._entries.get(job_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[job_id]
+                return None
+            self._entries.move_to_end(job_id)
+            return dict(entry[2])
+
+    def put(self, job_id: str, details: Dict[str, Any]) -> None:
+        """Store the details of a job.
+
+        :param job_id: The job ID
+        :param details: The parsed ``scontrol show job`` output
+        """
+        job_state = details.get("JobState", "")
+        ttl = self.terminal_ttl if job_state in TERMINAL_JOB_STATES else self.ttl
+        with self._lock:
+            self._entries[job_id] = (time.monotonic() + ttl, job_state, dict(details))
+            self._entries.move_to_end(job_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def update_states(self, jobs: Iterable[JobRecord]) -> None:
+        """Drop the details of the jobs whose state changed in a new snapshot.
+
+        :param jobs: The jobs of the latest squeue call
+        """
+        if not self._entries:
+            return
+        with self._lock:
+            entries = self._entries
+            for job in jobs:
+                entry = entries.get(job.job_id)
+                if entry is not None and entry[1] != job.job_state:
+                    del entries[job.job_id]
+
+    def clear(self) -> None:
+        """Forget all the details."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import io
+import json
+import re
+from subprocess import PIPE, CalledProcessError, Popen
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from rich.console import Console
+
+from mjobs.models import JobQuery, JobRecord
+
+from mjobs.data.details_cache import JobDetailsCache
+from mjobs.data.repository import JobRepository, JobRepositoryError
+
+# Fields asked to bjobs -o, the json records use them in upper case
+BJOBS_FIELDS = [
+    "stat",
+    "name",
+    "jobid",
+    "job_group",
+    "user",
+    "queue",
+    "submit_time",
+    "start_time",
+    "finish_time",
+    "exec_host",
+    "command",
+    "exit_reason",
+    "exit_code",
+    "error_file",
+    "output_file",
+    "pend_reason",
+]
+
+# bjobs options that filter on a field, by JobRecord field. They take a single value here,
+# a query on many of them is evaluated locally.
+BJOBS_FILTER_OPTIONS = {
+    "user_name": "-u",
+    "partition": "-q",
+    "nodes": "-m",
+}
+
+# bjobs options that select the jobs in a state, they exclude each other
+BJOBS_STATE_OPTIONS = {
+    "PENDING": "-p",
+    "RUNNING": "-r",
+    "SUSPENDED": "-s",
+}
+
+# Characters read from the bjobs output at a time by the streaming decoder
+BJOBS_READ_SIZE = 1 << 16
+
+_RECORDS_KEY = '"RECORDS"'
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# bjobs fields shown in the job details, with the scontrol names the dashboard knows
+BJOBS_DETAILS_FIELDS = {
+    "JOB_GROUP": "JobGroup",
+    "FINISH_TIME": "EndTime",
+    "EXIT_CODE": "ExitCode",
+    "EXIT_REASON": "ExitReason",
+    "OUTPUT_FILE": "StdOut",
+    "ERROR_FILE": "StdErr",
+}
+
+
+def iter_bjobs_records(
+    stream: TextIO,
+    on_error: Optional[Callable[[Dict[str, Any]], None]] = None,
+    read_size: int = BJOBS_READ_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """Decode the ``RECORDS`` array of a ``bjobs -json`` document one record at a time.
+
+    The stream is read ``read_size`` characters at a time and each record is
+    decoded as soon as it's complete, so only the record being read and one
+    chunk are held in memory rather than the whole output and its parsed copy.
+    What comes before the array (LSF messages, ``COMMAND``, ``JOBS``) and after it
+    is skipped.
+
+    :param stream: The bjobs output, e.g. the stdout pipe of the process
+    :param on_error: Called with the ``ERROR`` records instead of yielding them (optional)
+    :param read_size: Characters read from the stream at a time
+    :return: Iterator of the records, as dicts
+    :raises ValueError: If the output is not a bjobs json document or is truncated
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    document = False
+
+    def read() -> bool:
+        nonlocal buffer, position
+        chunk = stream.read(read_size)
+        if not chunk:
+            return False
+        # Drop what is already decoded, the buffer stays about one chunk long
+        buffer = buffer[position:] + chunk
+        position = 0
+        return True
+
+    def skip_whitespace() -> None:
+        nonlocal position
+        while True:
+            position = _JSON_WHITESPACE.match(buffer, position).end()
+            if position < len(buffer):
+                return
+            if not read():
+                raise ValueError("bjobs json output is truncated")
+
+    while True:
+        start = buffer.find(_RECORDS_KEY, position)
+        if start != -1:
+            position = start + len(_RECORDS_KEY)
+            break
+        document = document or "{" in buffer
+        # The key may be cut between two chunks
+        position = max(len(buffer) - len(_RECORDS_KEY), 0)
+        if not read():
+            if document:
+                # A document without records, no jobs
+                return
+            raise ValueError(f"Could not find bjobs output json in: {buffer[:200]}")
+
+    for expected in ":[":
+        skip_whitespace()
+        if buffer[position] != expected:
+            raise ValueError(f"Unexpected {buffer[position]!r} in the bjobs json output, expected {expected!r}")
+        position += 1
+
+    while True:
+        skip_whitespace()
+        char = buffer[position]
+        if char == "]":
+            return
+        if char == ",":
+            position += 1
+            continue
+        try:
+            record, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            # The record is not complete yet
+            if not read():
+                raise
+            continue
+        if on_error is not None and isinstance(record, dict) and "ERROR" in record:
+            on_error(record)
+        else:
+            yield record
+
+
+def parse_bjobs_json(output: str) -> List[Dict[str, Any]]:
+    """Read the records of a ``bjobs -json`` document.
+
+    :param output: Raw bjobs output, LSF may print messages around the document
+    :return: The entries of the ``RECORDS`` array, including the ``ERROR`` ones
+    :raises ValueError: If there is no json document in the output
+    """
+    return list(iter_bjobs_records(io.StringIO(output)))
+
+
+def stream_bjobs_records(
+    bjobs_cmd: List[str], on_error: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Iterator[Dict[str, Any]]:
+    """Run bjobs and decode its records while it's still writing them, see :func:`iter_bjobs_records`.
+
+    bjobs exits with an error when one of the requested jobs is not found, it
+    only fails if its output has no records.
+
+    :param bjobs_cmd: The bjobs command, with ``-json``
+    :param on_error: Called with the ``ERROR`` records instead of yielding them (optional)
+    :return: Iterator of the records, as dicts
+    :raises JobRepositoryError: If bjobs can't be run, or fails without printing records
+    """
+    try:
+        process = Popen(bjobs_cmd, stdout=PIPE, universal_newlines=True)
+    except OSError as e:
+        raise JobRepositoryError(f"Failed to retrieve jobs: {e}", original_error=e)
+
+    try:
+        try:
+            yield from iter_bjobs_records(process.stdout, on_error)
+        except ValueError as e:
+            process.stdout.read()
+            returncode = process.wait()
+            if returncode != 0:
+                error = CalledProcessError(returncode, bjobs_cmd)
+                raise JobRepositoryError(f"bjobs command failed with exit code {returncode}: {error}", original_error=e)
+            raise JobRepositoryError(f"Could not parse the bjobs output: {e}", original_error=e)
+        # What is left after the records, bjobs doesn't get a broken pipe
+        process.stdout.read()
+    finally:
+        if process.poll() is None:
+            # The consumer stopped early, don't wait for the whole output
+            process.kill()
+        process.stdout.close()
+        process.wait()
+
+
+class LsfRepository(JobRepository):
+    """Repository for accessing LSF job data via ``bjobs -json``.
+
+    The bjobs records are normalised into the same :class:`JobRecord` as the Slurm
+    jobs: the queue is the partition and the LSF states are mapped to the Slurm
+    ones (RUN is RUNNING, EXIT is FAILED...). The details of a job are the bjobs
+    fields, with the ``scontrol`` names (``StdOut``, ``StdErr``...).
+    """
+
+    def __init__(self, console: Console, error_console: Console, details_cache: Optional[JobDetailsCache] = None):
+        """Initialize the LSF repository.
+
+        :param console: Rich console for output
+        :param error_console: Rich console for error output
+        :param details_cache: Cache for the job details (default: a new JobDetailsCache)
+        """
+        self.console = console
+        self.error_console = error_console
+        self.details_cache = details_cache if details_cache is not None else JobDetailsCache()
+
+    def get_jobs(self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None) -> List[JobRecord]:
+        """Retrieve jobs from LSF using bjobs.
+
+        :param job_ids: Specific job IDs to fetch (optional)
+        :param extra_args: Additional bjobs arguments (optional)
+        :return: List of JobRecord instances
+        :raises JobRepositoryError: If bjobs command fails or parsing fails
+        """
+        jobs = list(self.iter_jobs(job_ids, extra_args))
+        self.track_jobs(jobs)
+        return jobs
+
+    def iter_jobs(
+        self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None
+    ) -> Iterator[JobRecord]:
+        """Stream jobs from the bjobs json output, while bjobs is still writing it.
+
+        :param job_ids: Specific job IDs to fetch (optional)
+        :param extra_args: Additional bjobs arguments (optional)
+        :return: Iterator of JobRecord instances
+        :raises JobRepositoryError: If bjobs command fails or parsing fails
+        """
+        for record in self._get_records(job_ids, extra_args):
+            try:
+                yield JobRecord.from_bjobs_json(record)
+            except ValueError as e:
+                self.error_console.log(f"Warning: Failed to parse job record: {e}")
+
+    def get_job_details(self, job_id: str) -> Dict[str, Any]:
+        """Get detailed job information, the bjobs fields of the job.
+
+        :param job_id: The job ID to get details for
+        :return: Dictionary containing the job details, empty if the job is not found
+        :raises JobRepositoryError: If bjobs command fails
+        """
+        job_id = str(job_id)
+        details = self.details_cache.get(job_id)
+        if details is not None:
+            return details
+        return self._fetch_details([job_id]).get(job_id, {})
+
+    def get_jobs_details(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the details of many jobs with a single bjobs call.
+
+        :param job_ids: The job IDs to get details for
+        :return: Details by job ID, jobs that were not found are missing
+        :raises JobRepositoryError: If bjobs command fails
+        """
+        details = {}
+        missing = []
+        for job_id in map(str, job_ids):
+            cached = self.details_cache.get(job_id)
+            if cached is not None:
+                details[job_id] = cached
+            else:
+                missing.append(job_id)
+        if missing:
+            details.update(self._fetch_details(missing))
+        return details
+
+    def plan_filters(self, query: JobQuery, extra_args: Optional[List[str]] = None) -> Tuple[List[str], JobQuery]:
+        """Turn the single value ``field:value`` terms of a query that bjobs can evaluate into its options.
+
+        The user, queue and host terms become ``-u``, ``-q`` and ``-m``, a PENDING,
+        RUNNING or SUSPENDED state ``-p``, ``-r`` or ``-s``. Options that
+        ``extra_args`` already has are left alone, so are terms with many values.
+
+        :param query: The query
+        :param extra_args: The bjobs arguments that are already used (optional)
+        :return: The bjobs arguments to add to ``extra_args``, and the rest of the query
+        """
+        used = set(extra_args or [])
+        # -a and -d select finished jobs too
+        state_used = not used.isdisjoint({*BJOBS_STATE_OPTIONS.values(), "-a", "-d"})
+        pushed_args: List[str] = []
+        pushed_terms = []
+        for term in query.terms:
+            if not term.indexed or len(term.values) != 1:
+                continue
+            [value] = term.values
+            if term.field == "job_state":
+                option = BJOBS_STATE_OPTIONS.get(value)
+                if option is None or state_used:
+                    continue
+                pushed_args.append(option)
+                state_used = True
+            else:
+                option = BJOBS_FILTER_OPTIONS.get(term.field)
+                if option is None or option in used:
+                    continue
+                pushed_args.extend([option, value])
+                used.add(option)
+            pushed_terms.append(term)
+        return pushed_args, query.without(pushed_terms)
+
+    def snapshot_key(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> Optional[List[Any]]:
+        """The bjobs command of a query.
+
+        :param job_ids: Job IDs to include
+        :param extra_args: Additional bjobs arguments
+        :return: The key of the snapshot of the query
+        """
+        return self._build_bjobs_command(job_ids, extra_args)
+
+    def track_jobs(self, jobs: List[JobRecord]) -> None:
+        """Drop the cached details of the jobs that changed state in a new listing.
+
+        :param jobs: The jobs of the listing
+        """
+        self.details_cache.update_states(jobs)
+
+    def invalidate(self) -> None:
+        """Forget the cached job details."""
+        self.details_cache.clear()
+
+    def _build_bjobs_command(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> List[str]:
+        """Build the bjobs command with the json output and arguments.
+
+        :param job_ids: Job IDs to include
+        :param extra_args: Additional arguments
+        :return: Complete bjobs command as list
+        """
+        bjobs = ["bjobs", "-json", "-o", " ".join(BJOBS_FIELDS)]
+        if extra_args:
+            bjobs.extend(list(map(str, extra_args)))
+        if job_ids:
+            bjobs.extend(list(map(str, job_ids)))
+        return bjobs
+
+    def _get_records(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> Iterator[Dict[str, Any]]:
+        """Stream the records of bjobs, the ``ERROR`` ones are reported and left out while decoding.
+
+        A job that was asked for by ID and is not found is not reported.
+        """
+
+        def report(record: Dict[str, Any]) -> None:
+            if record.get("JOBID") and not job_ids:
+                self.error_console.log(f"Warning: The job {record['JOBID']} has an error: {record['ERROR']}")
+
+        return stream_bjobs_records(self._build_bjobs_command(job_ids, extra_args), on_error=report)
+
+    def _fetch_details(self, job_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Read the details of jobs with one bjobs call and cache them."""
+        wanted = set(job_ids)
+        details = {}
+        for record in self._get_records(job_ids, None):
+            job_details = self._bjobs_details(record)
+            job_id = job_details.get("JobId")
+            if job_id in wanted:
+                self.details_cache.put(job_id, job_details)
+                details[job_id] = job_details
+        return details
+
+    def _bjobs_details(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """The details of a job from its bjobs record, with the scontrol names.
+
+        :param record: A bjobs json record
+        :return: Dictionary with the job details, empty if the record can't be parsed
+        """
+        try:
+            job = JobRecord.from_bjobs_json(record)
+        except ValueError:
+            return {}
+        details = {
+            "JobId": job.job_id,
+            "JobName": job.job_name,
+            "JobState": job.job_state,
+            "UserId": job.user_name,
+            "Partition": job.partition,
+            "Command": job.command,
+            "SubmitTime": job.submit_time,
+            "StartTime": job.start_time,
+            "NodeList": job.nodes,
+            "Reason": job.state_reason,
+        }
+        for field, key in BJOBS_DETAILS_FIELDS.items():
+            value = str(record.get(field) or "").strip()
+            if value and value != "-":
+                details[key] = value
+        return details
@@ -15,9 +15,12 @@
 # limitations under the License.
 
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
-from mjobs.models import SlurmJob
+from mjobs.models import JobQuery, JobRecord
+
+if TYPE_CHECKING:
+    from mjobs.data.async_repo import AsyncJobRepository
 
 
 class JobRepository(ABC):
@@ -28,16 +31,31 @@ class JobRepository(ABC):
     """
 
     @abstractmethod
-    def get_jobs(self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None) -> List[SlurmJob]:
+    def get_jobs(self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None) -> List[JobRecord]:
         """Retrieve jobs based on criteria.
 
         :param job_ids: Specific job IDs to fetch (optional)
         :param extra_args: Additional arguments for job filtering (optional)
-        :return: List of SlurmJob instances
+        :return: List of JobRecord instances
         :raises JobRepositoryError: If job retrieval fails
         """
         pass
 
+    def iter_jobs(
+        self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None
+    ) -> Iterator[JobRecord]:
+        """Retrieve jobs one by one, as soon as they are available.
+
+        Repositories that can read the scheduler output incrementally override this,
+        by default it iterates over :meth:`get_jobs`.
+
+        :param job_ids: Specific job IDs to fetch (optional)
+        :param extra_args: Additional arguments for job filtering (optional)
+        :return: Iterator of JobRecord instances
+        :raises JobRepositoryError: If job retrieval fails
+        """
+        return iter(self.get_jobs(job_ids, extra_args))
+
     @abstractmethod
     def get_job_details(self, job_id: str) -> Dict[str, Any]:
         """Get detailed information for a specific job.
@@ -48,6 +66,73 @@ class JobRepository(ABC):
         """
         pass
 
+    def get_jobs_details(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get detailed information for many jobs.
+
+        Repositories that can query many jobs at once override this, by default
+        it calls :meth:`get_job_details` for each job.
+
+        :param job_ids: The job IDs to get details for
+        :return: Details by job ID, jobs that were not found are missing
+        :raises JobRepositoryError: If job details retrieval fails
+        """
+        details = {}
+        for job_id in job_ids:
+            job_details = self.get_job_details(job_id)
+            if job_details:
+                details[job_id] = job_details
+        return details
+
+    def plan_filters(self, query: JobQuery, extra_args: Optional[List[str]] = None) -> Tuple[List[str], JobQuery]:
+        """Split a query into scheduler filter arguments and the part left to evaluate locally.
+
+        Repositories whose scheduler can filter the jobs override this, by default
+        the whole query is evaluated locally.
+
+        :param query: The query
+        :param extra_args: The filter arguments that are already used (optional)
+        :return: The arguments to add to ``extra_args``, and the rest of the query
+        """
+        return [], query
+
+    def snapshot_key(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> Optional[List[Any]]:
+        """What identifies the jobs of a query, to share them between invocations (see CachingJobRepository).
+
+        Repositories whose listings can be shared override this, usually with the
+        scheduler command they would run. By default the listings are not shared.
+
+        :param job_ids: Specific job IDs to fetch (optional)
+        :param extra_args: Additional arguments for job filtering (optional)
+        :return: A JSON serializable key, or None if the jobs of the query can't be shared
+        """
+        return None
+
+    def track_jobs(self, jobs: List[JobRecord]) -> None:
+        """Keep the repository in line with a listing it didn't make itself, e.g. a shared snapshot.
+
+        Repositories that keep state about the listed jobs override this, by default there is none.
+
+        :param jobs: The jobs of the listing
+        """
+
+    def invalidate(self) -> None:
+        """Forget any cached job data, the next query goes to the scheduler.
+
+        Repositories that cache override this, by default there is nothing to forget.
+        """
+
+    def as_async(self) -> "AsyncJobRepository":
+        """An awaitable view of this repository, for the dashboard.
+
+        Repositories that can run the scheduler commands as asyncio subprocesses
+        override this, by default the calls run in a worker thread.
+
+        :return: AsyncJobRepository instance
+        """
+        from mjobs.data.async_repo import ThreadedJobRepository
+
+        return ThreadedJobRepository(self)
+
 
 class JobRepositoryError(Exception):
     """Exception raised for job repository operations."""
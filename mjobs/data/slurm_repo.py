@@ -14,67 +14,433 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
 import re
-from subprocess import CalledProcessError, check_output
-from typing import Any, Dict, List, Optional
+from subprocess import DEVNULL, PIPE, CalledProcessError, Popen, check_output
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from rich.console import Console
 
-from mjobs.models import SQUEUE_FIELDS, SlurmJob
+from mjobs.models import SQUEUE_FIELDS, JobQuery, JobRecord
+from mjobs.models.record import VALID_JOB_STATES
 
+from mjobs.data.details_cache import JobDetailsCache
 from mjobs.data.repository import JobRepository, JobRepositoryError
 
+if TYPE_CHECKING:
+    from queue import Queue
+
+    from mjobs.data.async_repo import AsyncSlurmRepository
+
+# scontrol prints "Key=Value" pairs separated by spaces or newlines, with a blank line
+# between records. A key always follows whitespace, values may contain spaces and "="
+# (TRES=cpu=1,mem=4G), keys may contain "/" and ":" (CPUs/Task, ReqB:S:C:T).
+_SCONTROL_RECORD_SEPARATOR = re.compile(r"\n[ \t]*\n")
+_SCONTROL_KEY = re.compile(r"\s+([A-Za-z][\w/:]*)=")
+
+# squeue -M prints the name of the cluster before its jobs, even with -h
+_CLUSTER_HEADER = "CLUSTER: "
+
+# The --format fields squeue cuts at a width (%.200j), a value as long as it may have been cut
+_CUT_FIELD_WIDTHS = [
+    (name, int(spec[2:-1])) for spec, name in SQUEUE_FIELDS if re.fullmatch(r"%\.\d+\w", spec) and name != "job_id"
+]
+
+# squeue options (short, long) that filter on a field, by JobRecord field
+SQUEUE_FILTER_OPTIONS = {
+    "user_name": ("-u", "--user"),
+    "partition": ("-p", "--partition"),
+    "job_state": ("-t", "--states"),
+    "nodes": ("-w", "--nodelist"),
+    "job_name": ("-n", "--name"),
+    "account": ("-A", "--account"),
+    "qos": ("-q", "--qos"),
+}
+
+
+def plan_squeue_filters(query: JobQuery, extra_args: Optional[List[str]] = None) -> Tuple[List[str], JobQuery]:
+    """Turn the ``field:value`` terms of a query that squeue can evaluate into its filter options.
+
+    The first such term of each field in ``SQUEUE_FILTER_OPTIONS`` is pushed down,
+    slurmctld then only sends the matching jobs, and the rest of the query is left
+    to evaluate locally. A field that ``extra_args`` already filters on stays local,
+    squeue would only keep one of the two filters, and so do unknown job states.
+
+    :param query: The query
+    :param extra_args: The squeue arguments that are already used (optional)
+    :return: The squeue arguments to add, and the rest of the query
+    """
+    used = {arg.split("=", 1)[0] for arg in extra_args or []}
+    pushed_args: List[str] = []
+    pushed_terms = []
+    for term in query.terms:
+        options = SQUEUE_FILTER_OPTIONS.get(term.field)
+        if options is None or not term.indexed or used.intersection(options):
+            continue
+        if term.field == "job_state" and not term.values <= VALID_JOB_STATES:
+            continue
+        # --option=value, a value starting with "-" is not taken for an option
+        pushed_args.append(f"{options[1]}={','.join(sorted(term.values))}")
+        pushed_terms.append(term)
+        used.update(options)
+    return pushed_args, query.without(pushed_terms)
+
+
+def _drain_pipe(pipe: Iterable[str], lines: "Queue[Optional[str]]") -> None:
+    """Read the lines of a pipe into a queue, then None."""
+    try:
+        for line in pipe:
+            lines.put(line)
+    finally:
+        lines.put(None)
+
 
 class SlurmRepository(JobRepository):
     """Repository for accessing real Slurm job data via squeue/scontrol commands.
 
     This implementation calls actual Slurm commands to retrieve job information,
     with robust error handling and parsing.
+
+    With ``clusters``, each cluster is queried with its own ``-M <cluster>`` squeue,
+    all of them at the same time, and the jobs are tagged with their cluster: a
+    listing takes as long as the slowest cluster rather than the sum of them.
     """
 
-    def __init__(self, console: Console, error_console: Console):
+    # squeue learnt --json in 21.08, but until 23.02 it ignores -u, -p, -t, -w, -j... with it and
+    # prints the whole queue: the filters that were pushed down to squeue would be lost
+    JSON_MIN_VERSION: Tuple[int, int] = (23, 2)
+    # Jobs whose details are asked for one by one, scontrol shows all the jobs for more
+    SCONTROL_PER_JOB_MAX = 8
+    # Cut jobs asked to squeue --json by id, the whole query is asked again for more
+    JSON_PER_JOB_MAX = 500
+
+    def __init__(
+        self,
+        console: Console,
+        error_console: Console,
+        use_json: Optional[bool] = None,
+        details_cache: Optional[JobDetailsCache] = None,
+        clusters: Optional[List[str]] = None,
+    ):
         """Initialize the Slurm repository.
 
         :param console: Rich console for output
         :param error_console: Rich console for error output
+        :param use_json: List the jobs with ``squeue --json`` (True), never use it (False), or
+            only ask it for the values ``--format`` cut when the installed Slurm supports it (None)
+        :param details_cache: Cache for the ``scontrol show job`` details (default: a new JobDetailsCache)
+        :param clusters: Clusters to query (default: only the local cluster)
         """
         self.console = console
         self.error_console = error_console
-
-    def get_jobs(self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None) -> List[SlurmJob]:
+        self.use_json = use_json
+        # Whether the installed squeue filters with --json, checked the first time it's needed
+        self._json_available: Optional[bool] = None
+        self.details_cache = details_cache if details_cache is not None else JobDetailsCache()
+        self.clusters = list(clusters or [])
+        # Cluster of the jobs of the last listing (empty for the local one), scontrol has to be asked on the right one
+        self._job_clusters: Dict[str, str] = {}
+        # The scontrol details of the jobs of the last listing, by cluster, once read with one dump
+        self._listing_details: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    def get_jobs(self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None) -> List[JobRecord]:
         """Retrieve jobs from Slurm using squeue command.
 
+        The ``--format`` output is read, it's about three times faster to parse than
+        ``squeue --json``. The jobs whose values it cut (long job names or commands)
+        are then asked again with ``--json``, when the installed Slurm supports it.
+
         :param job_ids: Specific job IDs to fetch (optional)
         :param extra_args: Additional squeue arguments (optional)
-        :return: List of SlurmJob instances
+        :return: List of JobRecord instances
         :raises JobRepositoryError: If squeue command fails or parsing fails
         """
-        try:
-            squeue_cmd = self._build_squeue_command(job_ids, extra_args)
+        if self.clusters:
+            jobs = self._get_clusters_jobs(job_ids, extra_args)
+        else:
+            jobs = self._get_jobs(job_ids, extra_args)
+        self.track_jobs(jobs)
+        return jobs
 
-            # Execute squeue command
-            squeue_output = check_output(squeue_cmd, universal_newlines=True)
+    def track_jobs(self, jobs: List[JobRecord]) -> None:
+        """Keep the cached details and the cluster of each job in line with a new listing.
 
-            # Parse output into jobs
-            return self._parse_squeue_output(squeue_output)
+        :param jobs: The jobs of the listing
+        """
+        self._job_clusters = {}
+        # A new listing reads the details again
+        self._listing_details = {}
+        self._track_listed(jobs)
 
-        except CalledProcessError as e:
-            raise JobRepositoryError(f"squeue command failed with exit code {e.returncode}: {e}", original_error=e)
-        except Exception as e:
+    def _track_listed(self, jobs: Iterable[JobRecord]) -> None:
+        """Add jobs to the tracked listing, a streamed listing adds them as they are read."""
+        self.details_cache.update_states(jobs)
+        self._job_clusters.update((job.job_id, job.cluster) for job in jobs)
+
+    def _get_clusters_jobs(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> List[JobRecord]:
+        """Run the squeue of every cluster concurrently and merge their jobs, see :meth:`merge_cluster_jobs`."""
+        results = self._map_clusters(lambda cluster: self._get_jobs(job_ids, ["-M", cluster] + list(extra_args or [])))
+        return self.merge_cluster_jobs(zip(self.clusters, results))
+
+    def merge_cluster_jobs(self, results: Iterable[Tuple[str, Any]]) -> List[JobRecord]:
+        """Merge the jobs of the clusters, in the order of the clusters, and tag them with their cluster.
+
+        A cluster that can't be queried is reported and left out, unless none of them can.
+
+        :param results: Each cluster and its jobs, or the exception its squeue raised
+        :return: The jobs
+        :raises JobRepositoryError: If no cluster could be queried
+        """
+        jobs = []
+        errors = []
+        results = list(results)
+        for cluster, result in results:
+            if isinstance(result, JobRepositoryError):
+                self.error_console.log(f"Warning: cluster {cluster}: {result}")
+                errors.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                for job in result:
+                    job.cluster = cluster
+                jobs.extend(result)
+        if errors and len(errors) == len(results):
+            raise errors[0]
+        return jobs
+
+    def _map_clusters(self, function: Callable[[str], Any], clusters: Optional[List[str]] = None) -> List[Any]:
+        """Call ``function`` for each cluster, in a thread per cluster.
+
+        The Slurm commands spend their time waiting on slurmctld, so the threads overlap.
+
+        :param function: Called with the name of a cluster
+        :param clusters: The clusters (default: ``clusters``)
+        :return: The result of each cluster, or the JobRepositoryError it raised
+        """
+        clusters = self.clusters if clusters is None else clusters
+
+        def call(cluster: str) -> Any:
+            try:
+                return function(cluster)
+            except JobRepositoryError as e:
+                return e
+
+        if len(clusters) == 1:
+            return [call(clusters[0])]
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=len(clusters), thread_name_prefix="mjobs-cluster") as executor:
+            return list(executor.map(call, clusters))
+
+    def _get_jobs(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> List[JobRecord]:
+        """Run squeue, with the json or the format backend, then complete the values it cut."""
+        for squeue_cmd, json_output in self.squeue_commands(job_ids, extra_args):
+            try:
+                output = check_output(squeue_cmd, universal_newlines=True, stderr=DEVNULL if json_output else None)
+                jobs = self.parse_squeue(output, json_output)
+                break
+            except Exception as e:
+                error = self.squeue_failed(e, json_output)
+                if error is not None:
+                    raise error
+        else:
+            raise AssertionError("squeue_commands always ends with the --format command")
+
+        json_cmd = self.cut_jobs_command(self.cut_job_ids(jobs), job_ids, extra_args)
+        if json_cmd:
+            try:
+                jobs = self.complete_jobs(jobs, check_output(json_cmd, universal_newlines=True, stderr=DEVNULL))
+            except (CalledProcessError, OSError, ValueError) as e:
+                self.squeue_failed(e, True)
+        return jobs
+
+    def squeue_commands(
+        self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]
+    ) -> List[Tuple[List[str], bool]]:
+        """The squeue commands of a query, to try in order until one succeeds.
+
+        The ``--json`` one comes first when ``use_json`` asks for it, then the ``--format`` one.
+
+        :param job_ids: Job IDs to include
+        :param extra_args: Additional squeue arguments
+        :return: Each command, and whether it prints json (its stderr is better discarded)
+        """
+        commands = []
+        if self.use_json:
+            commands.append((self._build_squeue_json_command(job_ids, extra_args), True))
+        commands.append((self._build_squeue_command(job_ids, extra_args), False))
+        return commands
+
+    def parse_squeue(self, output: str, json_output: bool) -> List[JobRecord]:
+        """Parse the output of one of the :meth:`squeue_commands`.
+
+        :param output: The squeue output
+        :param json_output: Whether it's the ``--json`` output
+        :return: The jobs
+        :raises ValueError: If the output can't be parsed
+        """
+        return self._parse_squeue_json(output) if json_output else self._parse_squeue_output(output)
+
+    def squeue_failed(self, error: Exception, json_output: bool) -> Optional[JobRepositoryError]:
+        """Decide what to do when one of the :meth:`squeue_commands` fails.
+
+        A ``--json`` call that fails, or prints something we don't understand, means
+        Slurm was built without the json serializer plugin: json is not used anymore
+        and the next command is tried.
+
+        :param error: What the command, or the parser, raised
+        :param json_output: Whether it's the ``--json`` command
+        :return: The error to raise, None to try the next command
+        """
+        if json_output and isinstance(error, (CalledProcessError, OSError, ValueError)):
+            self.use_json = False
+            return None
+        if isinstance(error, JobRepositoryError):
+            return error
+        if isinstance(error, CalledProcessError):
+            return JobRepositoryError(
+                f"squeue command failed with exit code {error.returncode}: {error}", original_error=error
+            )
+        return JobRepositoryError(f"Failed to retrieve jobs: {error}", original_error=error)
+
+    def cut_job_ids(self, jobs: List[JobRecord]) -> List[str]:
+        """The IDs of the jobs whose ``--format`` values may have been cut by squeue.
+
+        :param jobs: The jobs of a ``--format`` listing
+        :return: The job IDs
+        """
+        return [
+            job.job_id for job in jobs if any(len(getattr(job, name)) >= width for name, width in _CUT_FIELD_WIDTHS)
+        ]
+
+    def cut_jobs_command(
+        self, cut_job_ids: List[str], job_ids: Optional[List[int]], extra_args: Optional[List[str]]
+    ) -> Optional[List[str]]:
+        """The ``squeue --json`` command that lists the whole values of the jobs ``--format`` cut.
+
+        Checking the version runs ``squeue --version`` the first time, so only
+        when some values were cut. Past ``JSON_PER_JOB_MAX`` jobs, the command
+        lists the whole query rather than each job.
+
+        :param cut_job_ids: The jobs, see :meth:`cut_job_ids`
+        :param job_ids: The job IDs of the listing
+        :param extra_args: The squeue arguments of the listing
+        :return: The command, None if there are no jobs or json is not to be used
+        """
+        if not cut_job_ids or self.use_json is not None or not self._json_supported():
+            return None
+        if len(cut_job_ids) <= self.JSON_PER_JOB_MAX:
+            return self._build_squeue_json_command(cut_job_ids, extra_args)
+        return self._build_squeue_json_command(job_ids, extra_args)
+
+    def complete_jobs(self, jobs: List[JobRecord], output: str) -> List[JobRecord]:
+        """Replace the jobs of a ``--format`` listing with their ``--json`` records.
+
+        :param jobs: The jobs of the listing
+        :param output: The output of the :meth:`cut_jobs_command`
+        :return: The jobs, in the same order
+        :raises ValueError: If the output is not the expected json document
+        """
+        complete = {job.job_id: job for job in self._parse_squeue_json(output)}
+        return [complete.get(job.job_id, job) for job in jobs]
+
+    def iter_jobs(
+        self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None
+    ) -> Iterator[JobRecord]:
+        """Stream jobs from the squeue --format output, while squeue is still writing it.
+
+        The output is read line by line from a pipe, so it's never held in memory as a whole.
+        With several clusters, all the squeue commands are started at once and the jobs
+        are yielded one cluster after the other; the pipes of the clusters that come
+        later are drained by a thread each meanwhile, so no squeue waits on a full pipe
+        and the listing takes as long as the slowest cluster. The jobs are tracked (see
+        :meth:`track_jobs`) as they are yielded. squeue --json is never used, its
+        output is a single document that can't be read before squeue is done.
+
+        :param job_ids: Specific job IDs to fetch (optional)
+        :param extra_args: Additional squeue arguments (optional)
+        :return: Iterator of JobRecord instances
+        :raises JobRepositoryError: If squeue command fails or parsing fails
+        """
+        commands = [
+            (cluster, self._build_squeue_command(job_ids, ["-M", cluster] + list(extra_args or [])))
+            for cluster in self.clusters
+        ] or [("", self._build_squeue_command(job_ids, extra_args))]
+
+        processes = []
+        try:
+            for cluster, squeue_cmd in commands:
+                processes.append((cluster, squeue_cmd, Popen(squeue_cmd, stdout=PIPE, universal_newlines=True)))
+        except OSError as e:
+            for _, _, process in processes:
+                process.kill()
+                process.stdout.close()
+                process.wait()
             raise JobRepositoryError(f"Failed to retrieve jobs: {e}", original_error=e)
 
+        # The first output is read as it comes, the others are buffered until their turn
+        outputs: List[Iterable[str]] = [processes[0][2].stdout]
+        readers = []
+        if len(processes) > 1:
+            from queue import Queue
+            from threading import Thread
+        for _, _, process in processes[1:]:
+            buffered: "Queue[Optional[str]]" = Queue()
+            reader = Thread(target=_drain_pipe, args=(process.stdout, buffered), name="mjobs-squeue", daemon=True)
+            reader.start()
+            readers.append(reader)
+            outputs.append(iter(buffered.get, None))
+
+        errors = []
+        self.track_jobs([])
+        try:
+            for (cluster, squeue_cmd, process), lines in zip(processes, outputs):
+                for job in self._parse_squeue_lines(lines):
+                    if cluster:
+                        job.cluster = cluster
+                    self._track_listed((job,))
+                    yield job
+                returncode = process.wait()
+                if returncode != 0:
+                    error = CalledProcessError(returncode, squeue_cmd)
+                    errors.append(
+                        JobRepositoryError(
+                            f"squeue command failed with exit code {returncode}: {error}", original_error=error
+                        )
+                    )
+                    if cluster:
+                        self.error_console.log(f"Warning: cluster {cluster}: {errors[-1]}")
+        finally:
+            for _, _, process in processes:
+                if process.poll() is None:
+                    # The consumer stopped early, don't wait for the whole output
+                    process.kill()
+            for reader in readers:
+                reader.join()
+            for _, _, process in processes:
+                process.stdout.close()
+                process.wait()
+
+        if errors and len(errors) == len(processes):
+            raise errors[0]
+
     def get_job_details(self, job_id: str) -> Dict[str, Any]:
         """Get detailed job information using scontrol show job.
 
+        The details are cached (see :class:`JobDetailsCache`), opening the details,
+        the stdout and the stderr of a job only calls scontrol once.
+
         :param job_id: The job ID to get details for
         :return: Dictionary containing parsed job details
         :raises JobRepositoryError: If scontrol command fails
         """
-        try:
-            scontrol_output = check_output(["scontrol", "show", "job", str(job_id)], universal_newlines=True).strip()
-
-            return self._parse_scontrol_output(scontrol_output)
+        job_id = str(job_id)
+        details = self.details_cache.get(job_id)
+        if details is not None:
+            return details
 
+        try:
+            scontrol_output = check_output(self.job_details_command(job_id), universal_newlines=True)
         except CalledProcessError as e:
             # Don't raise for non-existent jobs, return empty dict
             if e.returncode == 1:  # Job not found
@@ -84,6 +450,167 @@ class SlurmRepository(JobRepository):
             )
         except Exception as e:
             raise JobRepositoryError(f"Failed to get job details for {job_id}: {e}", original_error=e)
+        return self.store_job_details(job_id, scontrol_output)
+
+    def get_jobs_details(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Get the details of many jobs, with as few scontrol calls as possible.
+
+        scontrol shows one job, or all of them. A few jobs that are not cached
+        are asked for one by one, more than ``SCONTROL_PER_JOB_MAX`` are read from
+        one ``scontrol show job`` of their cluster. That dump is kept for the jobs
+        of the last listing, so the next pages of the same listing don't run it
+        again (see :meth:`plan_jobs_details`).
+
+        :param job_ids: The job IDs to get details for
+        :return: Details by job ID, jobs that were not found are missing
+        :raises JobRepositoryError: If scontrol command fails
+        """
+        details, per_job, dumps = self.plan_jobs_details(job_ids)
+        for job_id in per_job:
+            job_details = self.get_job_details(job_id)
+            if job_details:
+                details[job_id] = job_details
+
+        if dumps:
+            # One scontrol per cluster, the clusters are asked at the same time
+            def get_cluster_dump(cluster: str) -> str:
+                try:
+                    return check_output(self.details_dump_command(cluster), universal_newlines=True)
+                except CalledProcessError as e:
+                    raise JobRepositoryError(
+                        f"scontrol show job failed with exit code {e.returncode}: {e}", original_error=e
+                    )
+                except Exception as e:
+                    raise JobRepositoryError(f"Failed to get job details: {e}", original_error=e)
+
+            clusters = list(dumps)
+            for cluster, output in zip(clusters, self._map_clusters(get_cluster_dump, clusters)):
+                if isinstance(output, JobRepositoryError):
+                    raise output
+                details.update(self.store_details_dump(cluster, output, dumps[cluster]))
+
+        return details
+
+    def plan_jobs_details(
+        self, job_ids: Iterable[str]
+    ) -> Tuple[Dict[str, Dict[str, Any]], List[str], Dict[str, Set[str]]]:
+        """Find the details that are already known, and how to get the others.
+
+        A job is known when it's cached, or when the dump of its cluster was
+        already read for the last listing (a job missing from it was not found).
+
+        :param job_ids: The job IDs
+        :return: The known details by job ID, the jobs to ask scontrol for one by one,
+            and the jobs to look up in a dump of all the jobs, by cluster
+        """
+        details = {}
+        missing = []
+        for job_id in map(str, job_ids):
+            cached = self.details_cache.get(job_id)
+            if cached is not None:
+                details[job_id] = cached
+                continue
+            dump = self._listing_details.get(self._job_clusters.get(job_id, ""))
+            if dump is None:
+                missing.append(job_id)
+            elif job_id in dump:
+                details[job_id] = dump[job_id]
+                self.details_cache.put(job_id, dump[job_id])
+
+        if len(missing) <= self.SCONTROL_PER_JOB_MAX:
+            return details, missing, {}
+        dumps: Dict[str, Set[str]] = {}
+        for job_id in missing:
+            dumps.setdefault(self._job_clusters.get(job_id, ""), set()).add(job_id)
+        return details, [], dumps
+
+    def job_details_command(self, job_id: str) -> List[str]:
+        """The scontrol command showing one job, on the cluster it was listed on.
+
+        :param job_id: The job ID
+        :return: The command
+        """
+        return self._scontrol_command(self._job_clusters.get(job_id)) + ["show", "job", job_id]
+
+    def details_dump_command(self, cluster: str) -> List[str]:
+        """The scontrol command showing all the jobs of a cluster.
+
+        :param cluster: The cluster, empty for the local one
+        :return: The command
+        """
+        return self._scontrol_command(cluster) + ["show", "job"]
+
+    def store_job_details(self, job_id: str, output: str) -> Dict[str, Any]:
+        """Parse and cache the output of :meth:`job_details_command`.
+
+        :param job_id: The job ID
+        :param output: The scontrol output
+        :return: The details, empty if there are none
+        """
+        details = self._parse_scontrol_output(output.strip())
+        if details:
+            self.details_cache.put(job_id, details)
+        return details
+
+    def store_details_dump(self, cluster: str, output: str, wanted: Set[str]) -> Dict[str, Dict[str, Any]]:
+        """Parse the output of :meth:`details_dump_command` and keep it for the last listing.
+
+        Only the records of the jobs of the listing, and of ``wanted``, are kept:
+        the other jobs of the cluster are not shown.
+
+        :param cluster: The cluster of the dump
+        :param output: The scontrol output
+        :param wanted: The job IDs that were asked for
+        :return: The details of the wanted jobs that were found, by job ID
+        """
+        listed = {job_id for job_id, job_cluster in self._job_clusters.items() if job_cluster == cluster}
+        dump = {}
+        for job_details in self._parse_scontrol_records(output):
+            for job_id in self._scontrol_job_ids(job_details):
+                if job_id in wanted or job_id in listed:
+                    dump[job_id] = job_details
+        self._listing_details[cluster] = dump
+
+        found = {job_id: dump[job_id] for job_id in wanted if job_id in dump}
+        for job_id, job_details in found.items():
+            self.details_cache.put(job_id, job_details)
+        return found
+
+    def plan_filters(self, query: JobQuery, extra_args: Optional[List[str]] = None) -> Tuple[List[str], JobQuery]:
+        """Push the terms of a query that squeue can evaluate down to it, see :func:`plan_squeue_filters`.
+
+        :param query: The query
+        :param extra_args: The squeue arguments that are already used (optional)
+        :return: The squeue arguments to add to ``extra_args``, and the rest of the query
+        """
+        return plan_squeue_filters(query, extra_args)
+
+    def snapshot_key(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> Optional[List[Any]]:
+        """The squeue command of a query, and the clusters it runs on.
+
+        :param job_ids: Job IDs to include
+        :param extra_args: Additional squeue arguments
+        :return: The key of the snapshot of the query
+        """
+        return [self._build_squeue_command(job_ids, extra_args), self.clusters]
+
+    def invalidate(self) -> None:
+        """Forget the cached job details."""
+        self.details_cache.clear()
+        self._listing_details = {}
+
+    def as_async(self) -> "AsyncSlurmRepository":
+        """An awaitable view of this repository that runs squeue and scontrol as asyncio subprocesses.
+
+        :return: AsyncSlurmRepository sharing the parsers, caches and clusters of this repository
+        """
+        from mjobs.data.async_repo import AsyncSlurmRepository
+
+        return AsyncSlurmRepository(self)
+
+    def _scontrol_command(self, cluster: Optional[str]) -> List[str]:
+        """The scontrol command, for the cluster of a job if it's not the local one."""
+        return ["scontrol", "-M", cluster] if cluster else ["scontrol"]
 
     def _build_squeue_command(self, job_ids: Optional[List[int]], extra_args: Optional[List[str]]) -> List[str]:
         """Build the squeue command with proper formatting and arguments.
@@ -112,69 +639,168 @@ class SlurmRepository(JobRepository):
 
         return squeue
 
-    def _parse_squeue_output(self, output: str) -> List[SlurmJob]:
-        """Parse squeue output into SlurmJob instances with robust error handling.
+    def _build_squeue_json_command(
+        self, job_ids: Optional[Iterable[Any]], extra_args: Optional[List[str]]
+    ) -> List[str]:
+        """Build the squeue --json command, it shares the filters of the --format command.
+
+        :param job_ids: Job IDs to include
+        :param extra_args: Additional arguments
+        :return: Complete squeue command as list
+        """
+        squeue = ["squeue", "--json"]
+
+        if extra_args:
+            squeue.extend(list(map(str, extra_args)))
+
+        if job_ids:
+            squeue.extend(["-j", ",".join(list(map(str, job_ids)))])
+
+        return squeue
+
+    def _json_supported(self) -> bool:
+        """Check (once) if squeue supports --json.
+
+        :return: True if the json backend can be used
+        """
+        if self._json_available is None:
+            try:
+                version_output = check_output(["squeue", "--version"], universal_newlines=True, stderr=DEVNULL)
+                self._json_available = self._parse_slurm_version(version_output) >= self.JSON_MIN_VERSION
+            except (CalledProcessError, OSError):
+                self._json_available = False
+        return self._json_available
+
+    def _parse_slurm_version(self, output: str) -> Tuple[int, ...]:
+        """Parse the output of squeue --version (e.g. "slurm 23.02.7").
+
+        :param output: Raw squeue --version output
+        :return: Version as a tuple of ints, empty if it can't be parsed
+        """
+        match = re.search(r"(\d+)\.(\d+)", output)
+        if not match:
+            return ()
+        return tuple(int(part) for part in match.groups())
+
+    def _parse_squeue_json(self, output: str) -> List[JobRecord]:
+        """Parse squeue --json output into JobRecord instances.
+
+        :param output: Raw squeue --json output
+        :return: List of parsed JobRecord instances
+        :raises ValueError: If the output is not the expected json document
+        """
+        document = json.loads(output)
+        if not isinstance(document, dict) or not isinstance(document.get("jobs"), list):
+            raise ValueError("squeue --json output has no jobs list")
+
+        for error in document.get("errors") or []:
+            self.error_console.log(f"Warning: squeue reported: {error}")
+
+        jobs = []
+        for record in document["jobs"]:
+            try:
+                jobs.append(JobRecord.from_squeue_json(record))
+            except ValueError as e:
+                self.error_console.log(f"Warning: Failed to parse job record: {e}")
+
+        return jobs
+
+    def _parse_squeue_output(self, output: str) -> List[JobRecord]:
+        """Parse squeue output into JobRecord instances with robust error handling.
 
         :param output: Raw squeue output
-        :return: List of parsed SlurmJob instances
+        :return: List of parsed JobRecord instances
         :raises JobRepositoryError: If parsing fails for critical errors
         """
-        jobs = []
+        return list(self._parse_squeue_lines(output.split("\n")))
+
+    def _parse_squeue_lines(self, lines: Iterable[str]) -> Iterator[JobRecord]:
+        """Parse squeue output lines into JobRecord instances as they come.
+
+        :param lines: Raw squeue output lines
+        :return: Iterator of parsed JobRecord instances
+        :raises JobRepositoryError: If none of the lines can be parsed
+        """
+        parsed = 0
         failed_lines = []
         expected_field_count = len(SQUEUE_FIELDS)
+        line_num = 0
 
-        for line_num, line in enumerate(output.split("\n"), 1):
+        for line_num, line in enumerate(lines, 1):
             line = line.strip()
-            if not line:
+            if not line or line.startswith(_CLUSTER_HEADER):
                 continue
 
             try:
-                job = SlurmJob.from_squeue_line(line, expected_field_count)
-                jobs.append(job)
-
+                job = JobRecord.from_squeue_line(line, expected_field_count)
             except ValueError as e:
                 # Log parsing errors but don't fail completely
                 failed_lines.append((line_num, line, str(e)))
                 self.error_console.log(f"Warning: Failed to parse line {line_num}: {e}")
+                continue
+
+            parsed += 1
+            yield job
 
         # If we have some successful parses but some failures, warn but continue
-        if failed_lines and jobs:
+        if failed_lines and parsed:
             self.error_console.log(f"Warning: Failed to parse {len(failed_lines)} out of {line_num} job lines")
 
         # If we couldn't parse anything and there was output, that's an error
-        elif failed_lines and not jobs and output.strip():
+        elif failed_lines:
             raise JobRepositoryError(
                 f"Could not parse any job data from squeue output. First error: {failed_lines[0][2]}"
             )
 
-        return jobs
+    def _scontrol_job_ids(self, details: Dict[str, Any]) -> List[str]:
+        """IDs squeue may use for the job of a scontrol record.
+
+        Array tasks are listed as ``<array id>_<task id>`` (``_[<range>]`` while pending)
+        and heterogeneous job components as ``<het job id>+<offset>``.
+
+        :param details: Parsed scontrol record
+        :return: The job IDs
+        """
+        job_ids = [details.get("JobId", "")]
+        array_job_id, array_task_id = details.get("ArrayJobId"), details.get("ArrayTaskId")
+        if array_job_id and array_task_id:
+            if "-" in array_task_id or "," in array_task_id:
+                array_task_id = f"[{array_task_id}]"
+            job_ids.append(f"{array_job_id}_{array_task_id}")
+        het_job_id, het_job_offset = details.get("HetJobId"), details.get("HetJobOffset")
+        if het_job_id and het_job_offset:
+            job_ids.append(f"{het_job_id}+{het_job_offset}")
+        return job_ids
 
     def _parse_scontrol_output(self, output: str) -> Dict[str, Any]:
         """Parse scontrol show job output into a dictionary.
 
         :param output: Raw scontrol output text
-        :return: Dictionary with parsed job details
+        :return: Dictionary with parsed job details (of the first record)
         """
-        details = {}
-
-        # Split the output into key=value pairs
-        # scontrol output format: "Key=Value Key2=Value2 ..."
-        # Handle multi-line output by joining lines
-        text = " ".join(output.split("\n"))
-
-        # Regular expression to match key=value pairs, handling quoted values
-        pattern = r"(\w+)=([^\s]+(?:\s+[^\s=]+)*?)(?=\s+\w+=|\s*$)"
-
-        for match in re.finditer(pattern, text):
-            key, value = match.groups()
-
-            # Clean up the value
-            value = value.strip()
+        records = self._parse_scontrol_records(output)
+        return records[0] if records else {}
 
-            # Remove quotes if present
-            if value.startswith('"') and value.endswith('"'):
-                value = value[1:-1]
+    def _parse_scontrol_records(self, output: str) -> List[Dict[str, Any]]:
+        """Parse scontrol show output with one or many records.
 
-            details[key] = value
+        Each record is split once on its keys and the pairs go straight into a dict,
+        without backtracking or a Python loop over the pairs.
 
-        return details
+        :param output: Raw scontrol output text
+        :return: One dictionary per record
+        """
+        records = []
+        for record in _SCONTROL_RECORD_SEPARATOR.split(output):
+            # ["", key, value, key, value, ...], the leading space makes the first key a match
+            tokens = _SCONTROL_KEY.split(" " + record.rstrip())
+            if len(tokens) < 3:
+                continue
+            details = dict(zip(tokens[1::2], tokens[2::2]))
+            if '"' in record:
+                for key, value in details.items():
+                    # Remove quotes if present
+                    if len(value) > 1 and value.startswith('"') and value.endswith('"'):
+                        details[key] = value[1:-1]
+            records.append(details)
+        return records
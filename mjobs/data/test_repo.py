@@ -16,11 +16,12 @@
 
 import random
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from mjobs.models import SlurmJob
+from mjobs.models import JobQuery, JobRecord
 
 from mjobs.data.repository import JobRepository
+from mjobs.data.slurm_repo import SQUEUE_FILTER_OPTIONS, plan_squeue_filters
 
 
 class TestJobRepository(JobRepository):
@@ -30,10 +31,11 @@ class TestJobRepository(JobRepository):
     purposes without requiring actual Slurm installation.
     """
 
-    def __init__(self, seed: Optional[int] = None):
+    def __init__(self, seed: Optional[int] = None, clusters: Optional[List[str]] = None):
         """Initialize the test repository.
 
         :param seed: Random seed for reproducible test data (optional)
+        :param clusters: Clusters the fake jobs are spread on (default: none, the local cluster)
         """
         if seed is not None:
             random.seed(seed)
@@ -75,6 +77,9 @@ class TestJobRepository(JobRepository):
             "matlab -batch 'run_simulation(1000, 0.5)'",
             "Rscript analysis.R --input data.csv --output plots/",
         ]
+        self.accounts = ["default", "project_a", "project_b"]
+        self.qos_levels = ["normal", "high", "low"]
+        self.clusters = list(clusters or [])
         self.nodes_list = [
             "compute-001",
             "compute-002",
@@ -86,12 +91,12 @@ class TestJobRepository(JobRepository):
             "N/A",  # For non-running jobs
         ]
 
-    def get_jobs(self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None) -> List[SlurmJob]:
+    def get_jobs(self, job_ids: Optional[List[int]] = None, extra_args: Optional[List[str]] = None) -> List[JobRecord]:
         """Generate fake jobs that match the requested criteria.
 
         :param job_ids: Specific job IDs to generate (optional)
         :param extra_args: Filtering arguments (simulated, optional)
-        :return: List of fake SlurmJob instances
+        :return: List of fake JobRecord instances
         """
         # Generate default number of jobs or specific ones
         if job_ids:
@@ -123,8 +128,8 @@ class TestJobRepository(JobRepository):
             "GroupId": f"users({random.randint(100, 999)})",
             "Priority": str(random.randint(1, 100)),
             "Nice": "0",
-            "Account": random.choice(["default", "project_a", "project_b"]),
-            "QOS": random.choice(["normal", "high", "low"]),
+            "Account": job.account,
+            "QOS": job.qos,
             "JobState": job.job_state,
             "Reason": job.state_reason,
             "Dependency": "(null)",
@@ -183,16 +188,16 @@ class TestJobRepository(JobRepository):
             "MCS_label": "N/A",
         }
 
-    def _generate_random_job(self) -> SlurmJob:
+    def _generate_random_job(self) -> JobRecord:
         """Generate a completely random job."""
         job_id = str(random.randint(100000, 999999))
         return self._generate_job_with_id(job_id)
 
-    def _generate_job_with_id(self, job_id: str) -> SlurmJob:
+    def _generate_job_with_id(self, job_id: str) -> JobRecord:
         """Generate a job with a specific ID but random other attributes.
 
         :param job_id: The job ID to use
-        :return: SlurmJob with the specified ID
+        :return: JobRecord with the specified ID
         """
         # Use job_id as seed for consistent generation
         temp_random = random.Random(job_id)
@@ -206,7 +211,7 @@ class TestJobRepository(JobRepository):
         start_time = self._generate_start_time(temp_random, submit_time, job_state)
         end_time = self._generate_end_time_relative(temp_random, start_time, job_state)
 
-        return SlurmJob(
+        return JobRecord(
             job_id=job_id,
             job_name=job_name,
             time_limit=temp_random.choice(["1:00:00", "4:00:00", "12:00:00", "1-00:00:00", "7-00:00:00"]),
@@ -220,31 +225,48 @@ class TestJobRepository(JobRepository):
             submit_time=submit_time,
             end_time=end_time,
             workdir=f"/home/{user_name}/work/{job_name}_{job_id}",
+            account=temp_random.choice(self.accounts),
+            qos=temp_random.choice(self.qos_levels),
             nodes=temp_random.choice(self.nodes_list) if job_state == "RUNNING" else "N/A",
+            cluster=temp_random.choice(self.clusters) if self.clusters else "",
         )
 
-    def _apply_filters(self, jobs: List[SlurmJob], extra_args: List[str]) -> List[SlurmJob]:
+    def plan_filters(self, query: JobQuery, extra_args: Optional[List[str]] = None) -> Tuple[List[str], JobQuery]:
+        """Push the terms of a query down to the simulated squeue filters, like :class:`SlurmRepository`.
+
+        :param query: The query
+        :param extra_args: The squeue arguments that are already used (optional)
+        :return: The squeue arguments to add to ``extra_args``, and the rest of the query
+        """
+        return plan_squeue_filters(query, extra_args)
+
+    def _apply_filters(self, jobs: List[JobRecord], extra_args: List[str]) -> List[JobRecord]:
         """Apply filtering based on extra arguments (simulate squeue filters).
 
         :param jobs: List of jobs to filter
-        :param extra_args: Arguments like ["-u", "alice", "-t", "RUNNING"]
+        :param extra_args: Arguments like ["-u", "alice", "-t", "RUNNING"] or ["--user=alice,bob"]
         :return: Filtered list of jobs
         """
         filtered_jobs = jobs.copy()
-
-        # Simple simulation of common filters
-        for i in range(0, len(extra_args), 2):
-            if i + 1 >= len(extra_args):
-                break
-
-            flag, value = extra_args[i], extra_args[i + 1]
-
-            if flag == "-u":  # User filter
-                filtered_jobs = [job for job in filtered_jobs if job.user_name == value]
-            elif flag == "-t":  # State filter
-                filtered_jobs = [job for job in filtered_jobs if job.job_state == value.upper()]
-            elif flag == "-p":  # Partition filter
-                filtered_jobs = [job for job in filtered_jobs if job.partition == value]
+        fields = {option: field for field, options in SQUEUE_FILTER_OPTIONS.items() for option in options}
+
+        # Simple simulation of the squeue filters, "--option=value" or "-o value"
+        args = iter(extra_args)
+        for flag in args:
+            if flag.startswith("--") and "=" in flag:
+                flag, value = flag.split("=", 1)
+            else:
+                value = next(args, None)
+                if value is None:
+                    break
+
+            field = fields.get(flag)
+            if field is None:
+                continue
+            values = set(value.split(","))
+            if field == "job_state":
+                values = {state.upper() for state in values}
+            filtered_jobs = [job for job in filtered_jobs if getattr(job, field) in values]
 
         return filtered_jobs
 
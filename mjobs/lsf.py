@@ -15,22 +15,35 @@
 # limitations under the License.
 
 import getpass
-import json
-import re
 import sys
-from subprocess import check_output
 from types import SimpleNamespace
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional
 
 from rich.console import Console
 from rich.text import Text
 
 from mjobs.base import Base
+from mjobs.core.cancel import BulkCanceller, CancelReport
+from mjobs.data import JobRepository
+from mjobs.data.lsf_repo import BJOBS_FIELDS, LsfRepository, parse_bjobs_json, stream_bjobs_records
+from mjobs.data.repository import JobRepositoryError
+from mjobs.models import JobQuery, JobRecord, QueryError
+
+# States of the jobs that are over
+LSF_FINISHED_STATES = frozenset({"DONE", "EXIT"})
 
 
 class LSF(Base):
-    def __init__(self, console: Console, error_console: Console):
+    # bkill calls run at the same time when the jobs don't fit in one
+    CANCEL_WORKERS = 4
+    # Fields the free words of --filter are looked for in
+    FILTER_FIELDS = ("job_name", "state_reason")
+
+    def __init__(self, console: Console, error_console: Console, job_repository: Optional[JobRepository] = None):
         super().__init__(console, error_console)
+        # The dashboard, --filter and the exports use the JobRecords of the repository (a
+        # plain LsfRepository if none is given), the table and bkill the raw bjobs records
+        self.job_repository = job_repository
 
     def status_style(self, job_entry) -> Text:
         if job_entry["STAT"] == "RUN":
@@ -46,33 +59,56 @@ class LSF(Base):
         args_dict["job_id"] = args_dict.pop("job_ids", ())
         args_dict["all"] = args_dict.pop("show_all", False)
         args_dict["run"] = args_dict.pop("show_run", False)
+        args_dict.setdefault("refresh_interval", 10.0)
+        args_dict.setdefault("output_format", None)
+        args_dict.setdefault("export_parquet", None)
+        if args_dict["output_format"] or args_dict["export_parquet"]:
+            # Nothing but the export goes to stdout
+            args_dict["tsv"] = True
         self.args = SimpleNamespace(**args_dict)
 
+        if self.args.output_format and self.args.export_parquet:
+            self.error_console.print(Text("--format and --export-parquet can't be used together"), style="bold red")
+            sys.exit(2)
+
+        try:
+            self.query = JobQuery.parse(self.args.filter, self.FILTER_FIELDS) if self.args.filter else None
+        except QueryError as e:
+            self.error_console.print(Text(f"Invalid --filter: {e}"), style="bold red")
+            sys.exit(2)
+
+        if self.args.dashboard:
+            from mjobs.dashboard import launch_dashboard
+
+            launch_dashboard(self, refresh_interval=self.args.refresh_interval)
+            return
+
         jobs = []
-        lsf_args = []
+        lsf_args = self.filter_args()
+        repository = self.job_repository or LsfRepository(self.console, self.error_console)
 
-        if self.args.user:
-            lsf_args.extend(["-u", self.args.user])
-        if self.args.queue:
-            lsf_args.extend(["-q", self.args.queue])
-        if self.args.run:
-            lsf_args.extend(["-r"])
-        if self.args.all:
-            lsf_args.extend(["-a"])
-        if self.args.recent:
-            lsf_args.extend(["-d"])
-        if self.args.user_group:
-            lsf_args.extend(["-G", self.args.user_group])
-        if self.args.group:
-            lsf_args.extend(["-g", self.args.group])
-        if self.args.hosts:
-            lsf_args.extend(["-m", self.args.hosts])
-        if self.args.pend:
-            lsf_args.extend(["-p"])
+        local_query = self.query
+        if self.query:
+            # Let bjobs filter on what it can
+            pushed_args, local_query = repository.plan_filters(self.query, lsf_args)
+            lsf_args.extend(pushed_args)
+
+        if self.args.output_format or self.args.export_parquet:
+            # Exported as bjobs writes them
+            records = repository.iter_jobs(self.args.job_id, lsf_args)
+            if local_query:
+                records = filter(local_query.matches, records)
+            try:
+                self.export(records)
+            except JobRepositoryError as e:
+                self.error_console.print(Text(str(e)), style="bold red")
+                sys.exit(1)
+            return
 
         try:
-            status = self.console.status("Getting jobs from LSF...")
             if not self.args.tsv:
+                # rich.status loads the spinners and the table machinery, a tsv has no use for them
+                status = self.console.status("Getting jobs from LSF...")
                 status.start()
 
             jobs = self.get_jobs(self.args.job_id, lsf_args)
@@ -85,14 +121,8 @@ class LSF(Base):
                 status.stop()
             self.console.print_exception()
 
-        if self.args.filter:
-            filter_regex = re.compile(self.args.filter)
-            jobs = list(
-                filter(
-                    lambda j: filter_regex.search(j["JOB_NAME"]) or filter_regex.search(j["PEND_REASON"]),
-                    jobs,
-                )
-            )
+        if local_query:
+            jobs = [job for job in jobs if self._matches(local_query, job)]
 
         if self.args.kill:
             self.error_console.print(Text("--kill is not implemented for LSF. Use --bkill instead."), style="bold red")
@@ -127,15 +157,15 @@ class LSF(Base):
 
         rows = []
 
+        name_patterns = self.query.field_patterns("job_name") if self.query else []
+        reason_patterns = self.query.field_patterns("state_reason") if self.query else []
         for job in sorted(jobs, key=lambda j: j["JOBID"]):
-            if "ERROR" in job:
-                self.error_console.log(f"The job {job['JOBID']} has an error: {job['ERROR']}")
-                continue
             job_name = Text(job["JOB_NAME"])
             pending_reason = Text(job["PEND_REASON"]) or Text("----", justify="center")
-            if self.args.filter:
-                job_name.highlight_regex(rf"{self.args.filter}", "bold red")
-                pending_reason.highlight_regex(rf"{self.args.filter}", "bold red")
+            for pattern in name_patterns:
+                job_name.highlight_regex(pattern, "bold red")
+            for pattern in reason_patterns:
+                pending_reason.highlight_regex(pattern, "bold red")
 
             row = [
                 job["JOBID"],
@@ -165,59 +195,111 @@ class LSF(Base):
         if self.args.bkill:
             self.console.rule()
             self.console.print(
-                Text("Running bkill for each job..."),
+                Text(f"Running bkill on {len(rows)} job(s)..."),
                 style="bold white",
                 justify="center",
             )
+            report = self.bkill_jobs(jobs, lsf_args)
             for job in jobs:
-                job_id = job["JOBID"]
-                try:
-                    lsf_bkill_output = self.bkill(job_id)
-                    self.console.print(lsf_bkill_output.replace("\n", ""))
-                except Exception:
-                    self.error_console.print(Text(f"bkill for {job_id} failed"), style="bold red")
+                job_id = str(job["JOBID"])
+                reason = report.failed.get(job_id)
+                if reason is None:
+                    self.console.print(f"Job <{job_id}> is being terminated")
+                else:
+                    self.error_console.print(Text(f"bkill for {job_id} failed, {reason}"), style="bold red")
+            self.console.print(Text(f"Done. Killed: {len(report.cancelled)}, Failed: {len(report.failed)}"))
+
+    def _matches(self, query: JobQuery, record: Dict[str, Any]) -> bool:
+        """Check a bjobs record against the --filter query, on its JobRecord fields."""
+        try:
+            return query.matches(JobRecord.from_bjobs_json(record))
+        except ValueError:
+            return False
+
+    def filter_args(self) -> List[str]:
+        """The bjobs arguments of the command line filters."""
+        lsf_args = []
+        if self.args.user:
+            lsf_args.extend(["-u", self.args.user])
+        if self.args.queue:
+            lsf_args.extend(["-q", self.args.queue])
+        if self.args.run:
+            lsf_args.extend(["-r"])
+        if self.args.all:
+            lsf_args.extend(["-a"])
+        if self.args.recent:
+            lsf_args.extend(["-d"])
+        if self.args.user_group:
+            lsf_args.extend(["-G", self.args.user_group])
+        if self.args.group:
+            lsf_args.extend(["-g", self.args.group])
+        if self.args.hosts:
+            lsf_args.extend(["-m", self.args.hosts])
+        if self.args.pend:
+            lsf_args.extend(["-p"])
+        return lsf_args
 
     def parse_bjobs(self, bjobs_output_str):
-        bjobs_dict = None
-        bjobs_records = None
-        dict_start = bjobs_output_str.find("{")
-        dict_end = bjobs_output_str.rfind("}")
-        if dict_start != -1 and dict_end != -1:
-            bjobs_output = bjobs_output_str[dict_start : (dict_end + 1)]
-            bjobs_dict = json.loads(bjobs_output)
-            return bjobs_dict["RECORDS"]
-        if bjobs_records is None:
-            raise ValueError(f"Could not find bjobs output json in: {bjobs_output_str}")
-        return []
-
-    def get_jobs(self, job_ids: Optional[list[int]] = None, lsf_args: Optional[list[str]] = None):
-        fields = [
-            "stat",
-            "name",
-            "jobid",
-            "job_group",
-            "user",
-            "queue",
-            "submit_time",
-            "start_time",
-            "finish_time",
-            "exec_host",
-            "command",
-            "exit_reason",
-            "exit_code",
-            "error_file",
-            "output_file",
-            "pend_reason",
-        ]
-        args = ["bjobs", "-json", "-o", " ".join(fields)]
+        return parse_bjobs_json(bjobs_output_str)
+
+    def get_jobs(
+        self, job_ids: Optional[list[int]] = None, lsf_args: Optional[list[str]] = None, quiet: bool = False
+    ) -> List[Dict[str, Any]]:
+        """The bjobs records of the jobs, decoded while bjobs writes them.
+
+        The ``ERROR`` records are reported (unless ``quiet``) and left out as they are decoded.
+        """
+        args = ["bjobs", "-json", "-o", " ".join(BJOBS_FIELDS)]
         if lsf_args:
             args.extend(list(map(str, lsf_args)))
         if job_ids:
             args.extend(list(map(str, job_ids)))
-        bjobs_output = check_output(args, universal_newlines=True)
-        jobs = self.parse_bjobs(bjobs_output)
-        return jobs
+        return list(stream_bjobs_records(args, on_error=None if quiet else self._report_error))
+
+    def _report_error(self, record: Dict[str, Any]) -> None:
+        """Report an ERROR record of bjobs."""
+        if record.get("JOBID"):
+            self.error_console.log(f"The job {record['JOBID']} has an error: {record['ERROR']}")
+        else:
+            self.error_console.log(f"bjobs: {record['ERROR']}")
 
-    def bkill(self, job: int) -> None:
-        args = ["bkill", str(job)]
-        return check_output(args, universal_newlines=True)
+    def get_job_details(self, job_id: str) -> Dict[str, Any]:
+        if not self.job_repository:
+            raise ValueError("No job repository configured, the dashboard needs one.")
+
+        return self.job_repository.get_job_details(job_id)
+
+    def get_jobs_details(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        if not self.job_repository:
+            raise ValueError("No job repository configured, the dashboard needs one.")
+
+        return self.job_repository.get_jobs_details(job_ids)
+
+    def bkill_jobs(self, jobs: List[Dict[str, Any]], lsf_args: Optional[List[str]] = None) -> CancelReport:
+        """Terminate jobs with as few bkill calls as possible.
+
+        Only the listed jobs are passed to bkill, never ``0``: it would also terminate
+        the jobs submitted since the listing. The jobs are then listed again to tell
+        which ones were terminated.
+
+        :param jobs: The bjobs records of the jobs to terminate
+        :param lsf_args: The bjobs arguments the jobs were listed with
+        :return: CancelReport keyed on the job id
+        """
+        job_ids = [str(job["JOBID"]) for job in jobs]
+        canceller = BulkCanceller(max_workers=self.CANCEL_WORKERS)
+        outcomes = {}
+        commands = 0
+        for chunk, error in canceller.cancel(["bkill"], job_ids):
+            outcomes.update(dict.fromkeys(chunk, error))
+            commands += 1
+
+        try:
+            remaining = self.get_jobs(self.args.job_id, lsf_args, quiet=True)
+        except Exception as e:
+            self.error_console.print(Text(f"Could not list the jobs again, using the bkill exit status: {e}"))
+            return CancelReport.from_outcomes(outcomes, commands=commands)
+        active = {
+            str(job["JOBID"]): job.get("STAT", "") for job in remaining if job.get("STAT") not in LSF_FINISHED_STATES
+        }
+        return CancelReport.from_outcomes(outcomes, active, commands)
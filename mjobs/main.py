@@ -16,8 +16,6 @@
 
 import sys
 
-from rich.console import Console
-
 from mjobs.core.factory import detect_scheduler
 
 from mjobs.version import VERSION
@@ -34,6 +32,8 @@ def main():
     scheduler = detect_scheduler()
 
     if scheduler == "none" and not test_data_mode:
+        from rich.console import Console
+
         error_console = Console(stderr=True, style="bold red")
         error_console.log("I can't find bjobs or squeue... so, I can't do anything.")
         error_console.log("Use --test-data flag to run with fake data for testing.")
@@ -14,6 +14,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from .job import SQUEUE_FIELDS, SlurmJob
+from typing import TYPE_CHECKING
 
-__all__ = ["SlurmJob", "SQUEUE_FIELDS"]
+from .arrays import ArrayJobRecord, collapse_arrays
+from .columns import JobColumns, SearchIndex
+from .query import JobQuery, QueryError
+from .record import JOB_FIELDS, SQUEUE_FIELDS, TERMINAL_JOB_STATES, JobRecord
+
+if TYPE_CHECKING:
+    from .job import SlurmJob
+
+__all__ = [
+    "SlurmJob",
+    "JobRecord",
+    "ArrayJobRecord",
+    "collapse_arrays",
+    "JobColumns",
+    "SearchIndex",
+    "JobQuery",
+    "QueryError",
+    "SQUEUE_FIELDS",
+    "JOB_FIELDS",
+    "TERMINAL_JOB_STATES",
+]
+
+
+def __getattr__(name: str):
+    """Import the pydantic model on first use, the listings only need JobRecord."""
+    if name == "SlurmJob":
+        from .job import SlurmJob
+
+        return SlurmJob
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
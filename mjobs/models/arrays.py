@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+from typing import Collection, Dict, List, Optional, Tuple, Union
+
+from mjobs.models.record import JobRecord
+
+# squeue ids of array tasks: "<array id>_<task id>", or "<array id>_[<ranges>]" for the pending ones
+_ARRAY_TASK = re.compile(r"(\d+)_(?:(\d+)|\[([^\]]+)\])\Z")
+_TASK_RANGE = re.compile(r"(\d+)(?:-(\d+))?\Z")
+
+
+def parse_array_id(job_id: str) -> Optional[Tuple[str, List[Tuple[int, int]]]]:
+    """Split the squeue id of array tasks into the array id and the task ranges.
+
+    The ``%`` throttle of a pending range is ignored, a range with a step is not understood.
+
+    :param job_id: The job id, e.g. ``1200_7`` or ``1200_[1-5000%10]``
+    :return: The array id and the (first, last) task ranges, None if it's not an array task
+    """
+    match = _ARRAY_TASK.match(job_id)
+    if match is None:
+        return None
+    array_id, task_id, ranges = match.groups()
+    if task_id is not None:
+        return array_id, [(int(task_id), int(task_id))]
+    intervals = []
+    for part in ranges.split("%", 1)[0].split(","):
+        task_range = _TASK_RANGE.match(part)
+        if task_range is None:
+            return None
+        first, last = task_range.groups()
+        intervals.append((int(first), int(last if last is not None else first)))
+    return array_id, intervals
+
+
+def merge_task_ranges(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merge the task ranges that overlap or touch.
+
+    :param intervals: (first, last) task ranges, in any order
+    :return: The merged ranges, in order
+    """
+    merged: List[List[int]] = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], last)
+        else:
+            merged.append([first, last])
+    return [(first, last) for first, last in merged]
+
+
+def format_task_ranges(intervals: List[Tuple[int, int]]) -> str:
+    """Format task ranges like squeue: ``1-3,7``.
+
+    :param intervals: Merged (first, last) task ranges, see :func:`merge_task_ranges`
+    :return: The ranges
+    """
+    return ",".join(str(first) if first == last else f"{first}-{last}" for first, last in intervals)
+
+
+def first_task_id(job_id: str) -> str:
+    """The id of the first task of a row that stands for several tasks, scontrol only takes one.
+
+    :param job_id: The job id, e.g. ``1200_[1-40,42]``
+    :return: The id of the first task (``1200_1``), the job id itself for a job or a single task
+    """
+    parsed = parse_array_id(job_id)
+    if parsed is None:
+        return job_id
+    array_id, intervals = parsed
+    return f"{array_id}_{min(intervals)[0]}"
+
+
+class ArrayJobRecord(JobRecord):
+    """One row for the tasks of a job array that are in the same state.
+
+    The fields are those of the first task, except the job id which lists the
+    tasks like squeue does (``1200_[1-40,42]``), so it can be given to scancel.
+    """
+
+    __slots__ = ("array_id", "task_count")
+
+    @classmethod
+    def summarize(cls, array_id: str, tasks: List[JobRecord], intervals: List[Tuple[int, int]]) -> "ArrayJobRecord":
+        """Build the row of a group of tasks.
+
+        :param array_id: The id of the array
+        :param tasks: The tasks, the first one gives the fields
+        :param intervals: (first, last) ranges of all the task ids
+        :return: ArrayJobRecord instance
+        """
+        intervals = merge_task_ranges(intervals)
+        record = cls(*tasks[0].as_tuple())
+        record.job_id = f"{array_id}_[{format_task_ranges(intervals)}]"
+        record.array_id = array_id
+        record.task_count = sum(last - first + 1 for first, last in intervals)
+        return record
+
+
+def collapse_arrays(jobs: List[JobRecord], expanded: Collection[Tuple[str, str]] = ()) -> List[JobRecord]:
+    """Replace the tasks of each job array by one row per state.
+
+    Tasks are grouped on their cluster, array id and state, the row of a group
+    takes the place of its first task. A task alone in its group is kept as it is.
+
+    :param jobs: The jobs, in display order
+    :param expanded: (cluster, array id) of the arrays to leave as they are
+    :return: The jobs with the arrays collapsed
+    """
+    groups: Dict[Tuple[str, str, str], Tuple[List[JobRecord], List[Tuple[int, int]]]] = {}
+    # The jobs, and the key of a group in place of its first task
+    order: List[Union[JobRecord, Tuple[str, str, str]]] = []
+    for job in jobs:
+        parsed = parse_array_id(job.job_id)
+        if parsed is None or (job.cluster, parsed[0]) in expanded:
+            order.append(job)
+            continue
+        key = (job.cluster, parsed[0], job.job_state)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = group = ([], [])
+            order.append(key)
+        group[0].append(job)
+        group[1].extend(parsed[1])
+
+    collapsed = []
+    for item in order:
+        if isinstance(item, tuple):
+            tasks, intervals = groups[item]
+            if len(tasks) == 1 and "[" not in tasks[0].job_id:
+                collapsed.append(tasks[0])
+            else:
+                collapsed.append(ArrayJobRecord.summarize(item[1], tasks, intervals))
+        else:
+            collapsed.append(item)
+    return collapsed
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+from array import array
+from itertools import chain, compress
+from operator import attrgetter
+from typing import Callable, Dict, Iterable, List, Optional, Pattern, Sequence, Tuple
+
+from mjobs.models.record import JOB_FIELDS, JobRecord
+
+# Low cardinality fields, stored as small integer codes plus their distinct values
+ENCODED_FIELDS = ("job_state", "partition", "user_name", "account", "qos", "cluster")
+
+_record_values = attrgetter(*JOB_FIELDS)
+
+
+class JobColumns:
+    """Columnar container for a whole squeue snapshot.
+
+    Every field is stored in its own column of interned strings, except for
+    ``ENCODED_FIELDS`` which are stored as an ``array`` of codes into a list of
+    categories. Filters and sorts return row indices and only look at each
+    distinct value once, so they stay cheap on 100k-row listings.
+    """
+
+    def __init__(self, columns: Dict[str, List[str]], codes: Dict[str, array], categories: Dict[str, List[str]]):
+        """Initialize the snapshot, use :meth:`from_records` to build one.
+
+        :param columns: Plain columns, field name to list of values
+        :param codes: Encoded columns, field name to array of codes
+        :param categories: Encoded columns, field name to the distinct values
+        """
+        self._columns = columns
+        self._codes = codes
+        self._categories = categories
+        self._size = len(next(iter(columns.values()))) if columns else 0
+        self._search_indexes: Dict[Tuple[str, ...], SearchIndex] = {}
+        self._postings: Dict[str, Dict[str, List[int]]] = {}
+
+    @classmethod
+    def from_records(cls, records: Iterable[JobRecord]) -> "JobColumns":
+        """Build the columns of a snapshot.
+
+        :param records: Jobs of the snapshot
+        :return: JobColumns instance
+        """
+        rows = [_record_values(record) for record in records]
+        transposed = list(zip(*rows)) if rows else [() for _ in JOB_FIELDS]
+        del rows
+
+        columns = {}
+        codes = {}
+        categories = {}
+        for field, values in zip(JOB_FIELDS, transposed):
+            if field in ENCODED_FIELDS:
+                distinct = list(dict.fromkeys(values))
+                lookup = {value: code for code, value in enumerate(distinct)}
+                codes[field] = array("H" if len(distinct) < 65536 else "L", map(lookup.__getitem__, values))
+                categories[field] = [sys.intern(value) for value in distinct]
+            else:
+                columns[field] = list(map(sys.intern, values))
+
+        return cls(columns, codes, categories)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def values(self, field: str) -> Sequence[str]:
+        """Get the values of a column, decoding it if needed.
+
+        :param field: A field of ``JOB_FIELDS``
+        :return: The column values, in row order
+        """
+        if field in self._codes:
+            return list(map(self._categories[field].__getitem__, self._codes[field]))
+        return self._columns[field]
+
+    def codes(self, field: str) -> array:
+        """Get the codes of an encoded column."""
+        return self._codes[field]
+
+    def categories(self, field: str) -> List[str]:
+        """Get the distinct values of an encoded column, indexed by code."""
+        return self._categories[field]
+
+    def record(self, index: int) -> JobRecord:
+        """Materialize one row as a JobRecord."""
+        return JobRecord(
+            *(
+                self._categories[field][self._codes[field][index]]
+                if field in self._codes
+                else self._columns[field][index]
+                for field in JOB_FIELDS
+            )
+        )
+
+    def records(self, indices: Optional[Iterable[int]] = None) -> List[JobRecord]:
+        """Materialize rows as JobRecords.
+
+        :param indices: Rows to materialize, all of them by default
+        :return: List of JobRecord instances
+        """
+        return [self.record(index) for index in (range(self._size) if indices is None else indices)]
+
+    def sort_indices(self, field: str, indices: Optional[Iterable[int]] = None, reverse: bool = False) -> List[int]:
+        """Sort rows by a column.
+
+        :param field: Column to sort by
+        :param indices: Rows to sort, all of them by default
+        :param reverse: Sort in descending order
+        :return: Sorted row indices
+        """
+        values = self.values(field)
+        return sorted(range(self._size) if indices is None else indices, key=values.__getitem__, reverse=reverse)
+
+    def select(
+        self, predicate: Callable[[str], bool], fields: Sequence[str], indices: Optional[Iterable[int]] = None
+    ) -> List[int]:
+        """Select the rows where ``predicate`` holds for any of ``fields``.
+
+        The predicate is evaluated once per distinct value of each column.
+
+        :param predicate: Function of a field value
+        :param fields: Columns to test
+        :param indices: Rows to consider, all of them by default
+        :return: Matching row indices, in row order
+        """
+        mask = bytearray(self._size)
+        for field in fields:
+            if field in self._codes:
+                matching_codes = {code for code, value in enumerate(self._categories[field]) if predicate(value)}
+                if not matching_codes:
+                    continue
+                for index, code in enumerate(self._codes[field]):
+                    if code in matching_codes:
+                        mask[index] = 1
+            else:
+                column = self._columns[field]
+                matching = {value for value in set(column) if predicate(value)}
+                if not matching:
+                    continue
+                for index, value in enumerate(column):
+                    if value in matching:
+                        mask[index] = 1
+
+        if indices is None:
+            return [index for index, hit in enumerate(mask) if hit]
+        return [index for index in indices if mask[index]]
+
+    def match_regex(
+        self, pattern: Pattern, fields: Sequence[str], indices: Optional[Iterable[int]] = None
+    ) -> List[int]:
+        """Select the rows where the compiled regex matches (``search``) any of ``fields``."""
+        return self.select(lambda value: pattern.search(value) is not None, fields, indices)
+
+    def search(self, text: str, fields: Sequence[str], indices: Optional[Iterable[int]] = None) -> List[int]:
+        """Select the rows where any of ``fields`` contains ``text`` (case insensitive)."""
+        text = text.lower()
+        return self.select(lambda value: text in value.lower(), fields, indices)
+
+    def postings(self, field: str) -> Dict[str, List[int]]:
+        """Get the rows of each value of a column, the index is built on first use and kept with the snapshot.
+
+        :param field: A field of ``JOB_FIELDS``
+        :return: Value to row indices, in row order
+        """
+        postings = self._postings.get(field)
+        if postings is None:
+            if field in self._codes:
+                by_code: List[List[int]] = [[] for _ in self._categories[field]]
+                for index, code in enumerate(self._codes[field]):
+                    by_code[code].append(index)
+                postings = dict(zip(self._categories[field], by_code))
+            else:
+                postings = {}
+                for index, value in enumerate(self._columns[field]):
+                    rows = postings.get(value)
+                    if rows is None:
+                        postings[value] = [index]
+                    else:
+                        rows.append(index)
+            self._postings[field] = postings
+        return postings
+
+    def lookup(self, field: str, values: Iterable[str]) -> List[int]:
+        """Select the rows where ``field`` is one of ``values``, from the postings of the column.
+
+        :param field: A field of ``JOB_FIELDS``
+        :param values: Exact values to look up
+        :return: Matching row indices, in row order
+        """
+        postings = self.postings(field)
+        found = [postings[value] for value in set(values) if value in postings]
+        if len(found) == 1:
+            return list(found[0])
+        return sorted(chain.from_iterable(found))
+
+    def where(self, predicate: Callable[[str], bool], field: str, indices: Optional[Iterable[int]] = None) -> List[int]:
+        """Select the rows where ``predicate`` holds for ``field``, among ``indices``.
+
+        Unlike :meth:`select` only the given rows are visited, and the predicate is
+        still evaluated once per distinct value.
+
+        :param predicate: Function of a field value
+        :param field: Column to test
+        :param indices: Rows to consider, all of them by default
+        :return: Matching row indices, in the order of ``indices``
+        """
+        indices = range(self._size) if indices is None else indices
+        if field in self._codes:
+            accepted = bytearray(bool(predicate(value)) for value in self._categories[field])
+            codes = self._codes[field]
+            return [index for index in indices if accepted[codes[index]]]
+
+        column = self._columns[field]
+        results: Dict[str, bool] = {}
+        selected = []
+        for index in indices:
+            value = column[index]
+            hit = results.get(value)
+            if hit is None:
+                hit = results[value] = bool(predicate(value))
+            if hit:
+                selected.append(index)
+        return selected
+
+    def search_index(self, fields: Sequence[str]) -> "SearchIndex":
+        """Get the search index of some fields, it is built on first use and kept with the snapshot.
+
+        :param fields: Columns to search
+        :return: SearchIndex instance
+        """
+        fields = tuple(fields)
+        index = self._search_indexes.get(fields)
+        if index is None:
+            index = self._search_indexes[fields] = SearchIndex.from_columns(self, fields)
+        return index
+
+
+class SearchIndex:
+    """Case insensitive substring search over some fields of a snapshot, for search as you type.
+
+    The fields of each row are joined into one haystack when the index is
+    built. Each distinct haystack is lowered and stored once with the rows that
+    have it, array jobs and resubmissions share theirs, so a query is a single
+    ``in`` per distinct haystack. The last query is kept: a query that contains
+    it, as when a character is typed, only tests the haystacks that matched it.
+    """
+
+    # Joins the fields of a row, a query can't match across two of them
+    SEPARATOR = "\x00"
+
+    def __init__(self, haystacks: List[str], rows: Optional[List[List[int]]], size: int):
+        """Initialize the index, use :meth:`from_columns` to build one.
+
+        :param haystacks: The distinct lowered and joined fields of the rows
+        :param rows: The rows of each haystack, None if every row has its own (in row order)
+        :param size: Number of rows
+        """
+        self._haystacks = haystacks
+        self._rows = rows
+        self._size = size
+        self._last_text = ""
+        # Haystacks that contain the last query
+        self._last_hits: Optional[List[int]] = None
+
+    @classmethod
+    def from_columns(cls, columns: JobColumns, fields: Sequence[str]) -> "SearchIndex":
+        """Build the index of some fields of a snapshot.
+
+        :param columns: The snapshot
+        :param fields: Columns to search
+        :return: SearchIndex instance
+        """
+        join = cls.SEPARATOR.join
+        lookup: Dict[str, List[int]] = {}
+        for row, haystack in enumerate(map(join, zip(*map(columns.values, fields)))):
+            rows = lookup.get(haystack)
+            if rows is None:
+                lookup[haystack] = [row]
+            else:
+                rows.append(row)
+        haystacks = [haystack.lower() for haystack in lookup]
+        return cls(haystacks, list(lookup.values()) if len(lookup) < len(columns) else None, len(columns))
+
+    def __len__(self) -> int:
+        return self._size
+
+    def search(self, text: str) -> List[int]:
+        """Select the rows where any of the fields contains ``text`` (case insensitive).
+
+        :param text: Text to look for
+        :return: Matching row indices, in row order
+        """
+        text = text.lower()
+        if self.SEPARATOR in text:
+            return []
+        haystacks = self._haystacks
+        last_hits = self._last_hits
+        if last_hits is not None and self._last_text in text and len(last_hits) < len(haystacks) // 2:
+            # Narrow the previous result, the haystacks that didn't match it can't match this.
+            # Testing a subset costs about twice as much per haystack as a full scan.
+            hits = [code for code in last_hits if text in haystacks[code]]
+        else:
+            hits = list(compress(range(len(haystacks)), [text in haystack for haystack in haystacks]))
+        self._last_text, self._last_hits = text, hits
+
+        if self._rows is None:
+            return hits
+        if len(hits) == len(haystacks):
+            return list(range(self._size))
+        rows = self._rows
+        return sorted(chain.from_iterable(rows[code] for code in hits))
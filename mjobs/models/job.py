@@ -18,6 +18,8 @@ from typing import Any, Dict
 
 from pydantic import BaseModel, Field, field_validator
 
+from mjobs.models.record import VALID_JOB_STATES, JobRecord
+
 
 class SlurmJob(BaseModel):
     """Pydantic model for Slurm job data with validation and type safety.
@@ -42,7 +44,10 @@ class SlurmJob(BaseModel):
     submit_time: str = Field(..., description="Job submission time")
     end_time: str = Field(..., description="Job end time or time remaining")
     workdir: str = Field(..., description="Working directory")
+    account: str = Field("", description="Account charged for the job")
+    qos: str = Field("", description="Quality of service")
     nodes: str = Field(..., description="Allocated nodes")
+    cluster: str = Field("", description="Cluster the job runs on, empty for the local one")
 
     @field_validator("job_id")
     @classmethod
@@ -56,22 +61,8 @@ class SlurmJob(BaseModel):
     @classmethod
     def validate_job_state(cls, v: str) -> str:
         """Validate and normalize job state."""
-        valid_states = {
-            "PENDING",
-            "RUNNING",
-            "SUSPENDED",
-            "COMPLETED",
-            "CANCELLED",
-            "FAILED",
-            "TIMEOUT",
-            "NODE_FAIL",
-            "PREEMPTED",
-            "BOOT_FAIL",
-            "DEADLINE",
-            "OUT_OF_MEMORY",
-        }
         normalized_state = v.upper().strip()
-        if normalized_state not in valid_states:
+        if normalized_state not in VALID_JOB_STATES:
             # Don't fail validation for unknown states, just normalize
             pass
         return normalized_state
@@ -99,39 +90,20 @@ class SlurmJob(BaseModel):
         :return: SlurmJob instance
         :raises ValueError: If line cannot be parsed
         """
-        if not line or line.strip() == "":
-            raise ValueError("Cannot parse empty line")
-
-        try:
-            # Parse the pipe-separated values, handling quoted strings
-            values = [element.strip() for element in line.strip('"').split("|")]
-
-            # Handle missing nodes field for non-running jobs
-            if len(values) == field_count - 1:
-                values.append("-----")
-            elif len(values) != field_count:
-                raise ValueError(f"Expected {field_count} fields, got {len(values)}")
-
-            # Create the job with proper field mapping
-            return cls(
-                job_id=values[0],
-                job_name=values[1],
-                time_limit=values[2],
-                memory=values[3],
-                partition=values[4],
-                job_state=values[5],
-                user_name=values[6],
-                command=values[7],
-                state_reason=values[8],
-                start_time=values[9],
-                submit_time=values[10],
-                end_time=values[11],
-                workdir=values[12],
-                nodes=values[13] if len(values) > 13 else "N/A",
-            )
-
-        except (IndexError, TypeError) as e:
-            raise ValueError(f"Failed to parse squeue line: {line}. Error: {e}")
+        return JobRecord.from_squeue_line(line, field_count).to_model()
+
+    @classmethod
+    def from_squeue_json(cls, record: Dict[str, Any]) -> "SlurmJob":
+        """Create SlurmJob from a job record of ``squeue --json``.
+
+        Handles both the plain values of older Slurm releases and the
+        ``{"set": ..., "infinite": ..., "number": ...}`` wrappers of the data_parser plugins.
+
+        :param record: A single entry of the ``jobs`` array
+        :return: SlurmJob instance
+        :raises ValueError: If the record cannot be converted
+        """
+        return JobRecord.from_squeue_json(record).to_model()
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> "SlurmJob":
@@ -165,22 +137,3 @@ class SlurmJob(BaseModel):
             "Time Rem.": self.end_time,
             "State Reason": self.state_reason,
         }
-
-
-# Field mapping for squeue output - matches the order in slurm.py
-SQUEUE_FIELDS = [
-    ("%.18i", "job_id"),
-    ("%.200j", "job_name"),
-    ("%l", "time_limit"),
-    ("%m", "memory"),
-    ("%.50P", "partition"),
-    ("%T", "job_state"),
-    ("%u", "user_name"),
-    ("%.200o", "command"),
-    ("%.20r", "state_reason"),
-    ("%S", "start_time"),
-    ("%V", "submit_time"),
-    ("%L", "end_time"),
-    ("%.100Z", "workdir"),
-    ("%.N", "nodes"),
-]
@@ -0,0 +1,364 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import operator
+import re
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Pattern, Sequence
+
+from mjobs.models.columns import JobColumns
+from mjobs.models.record import JOB_FIELDS, JobRecord
+
+# Query names of the fields, on top of the JobRecord field names
+FIELD_ALIASES = {
+    "id": "job_id",
+    "job": "job_id",
+    "name": "job_name",
+    "state": "job_state",
+    "status": "job_state",
+    "user": "user_name",
+    "mem": "memory",
+    "cmd": "command",
+    "reason": "state_reason",
+    "time": "time_limit",
+    "limit": "time_limit",
+    "left": "end_time",
+    "start": "start_time",
+    "submit": "submit_time",
+    "dir": "workdir",
+    "node": "nodes",
+    "acct": "account",
+}
+
+# Fields whose ``:`` terms ignore case (the values are case insensitive for Slurm)
+CASE_INSENSITIVE_FIELDS = frozenset({"job_state"})
+
+_COMPARISONS = {">=": operator.ge, "<=": operator.le, ">": operator.gt, "<": operator.lt}
+
+# A term: optional "-" (negation), field name, operator, value; a value with spaces is quoted
+_TERM = re.compile(r"(-?)([A-Za-z_]+)(:|~|>=|<=|>|<)(.*)", re.DOTALL)
+_TOKEN = re.compile(r'(?:"[^"]*"|[^\s"])+')
+
+_SIZE = re.compile(r"(\d+(?:\.\d+)?)([KMGTP]?)B?[nc]?", re.IGNORECASE)
+_SIZE_UNITS = {"K": 1 / 1024, "M": 1, "G": 1024, "T": 1024**2, "P": 1024**3}
+_DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class QueryError(ValueError):
+    """Raised when a query can't be parsed."""
+
+
+def parse_size(value: str) -> Optional[float]:
+    """Parse a memory size as printed by squeue (``4G``, ``16000M``, ``500``), in megabytes.
+
+    :param value: The size, a number of megabytes without unit
+    :return: The size in megabytes, or None if it's not a size
+    """
+    match = _SIZE.fullmatch(value.strip())
+    if match is None:
+        return None
+    number, unit = match.groups()
+    return float(number) * _SIZE_UNITS[unit.upper() or "M"]
+
+
+def parse_duration(value: str) -> Optional[int]:
+    """Parse a duration as printed by squeue (``1-02:00:00``, ``2:00:00``, ``30:00``), in seconds.
+
+    A number with a ``s``/``m``/``h``/``d`` unit (``90m``, ``2h``) is accepted too.
+
+    :param value: The duration, a number of minutes without unit
+    :return: The duration in seconds, or None if it's not a duration (``UNLIMITED``, ``INVALID``...)
+    """
+    value = value.strip()
+    if value[-1:].lower() in _DURATION_UNITS and value[:-1].isdigit():
+        return int(value[:-1]) * _DURATION_UNITS[value[-1].lower()]
+    days, _, clock = value.rpartition("-")
+    parts = clock.split(":")
+    if not all(part.isdigit() for part in parts) or len(parts) > 3 or (days and not days.isdigit()):
+        return None
+    numbers = [int(part) for part in parts]
+    if len(parts) == 1:
+        # Plain minutes, like squeue --time
+        seconds = numbers[0] * 60
+    elif len(parts) == 2:
+        seconds = numbers[0] * 60 + numbers[1]
+    else:
+        seconds = numbers[0] * 3600 + numbers[1] * 60 + numbers[2]
+    return seconds + int(days or 0) * 86400
+
+
+def parse_job_number(value: str) -> Optional[int]:
+    """Parse the numeric part of a job id (``123``, ``123_4``, ``123+1``)."""
+    match = re.match(r"\d+", value)
+    return int(match.group()) if match else None
+
+
+# How the values of each field are compared with <, >, <= and >=, the default is as text
+_FIELD_CONVERTERS: Dict[str, Callable[[str], Optional[float]]] = {
+    "job_id": parse_job_number,
+    "memory": parse_size,
+    "time_limit": parse_duration,
+    "end_time": parse_duration,
+}
+
+
+class QueryTerm:
+    """A ``field<op>value`` term of a query."""
+
+    def __init__(self, field: str, op: str, value: str, negated: bool = False):
+        """Compile the term.
+
+        :param field: A field of ``JOB_FIELDS``
+        :param op: ``:`` (equals one of the comma separated values), ``~`` (regex search) or a comparison
+        :param value: The value to compare with
+        :param negated: Select the jobs that don't match
+        :raises QueryError: If the value is not valid for the operator
+        """
+        self.field = field
+        self.op = op
+        self.value = value
+        self.negated = negated
+        self.values: FrozenSet[str] = frozenset()
+        self.pattern: Optional[Pattern] = None
+
+        if op == ":":
+            values = [item for item in value.split(",") if item]
+            if not values:
+                raise QueryError(f"Missing value for {field}")
+            if field in CASE_INSENSITIVE_FIELDS:
+                values = [item.upper() for item in values]
+            self.values = frozenset(values)
+            self._test = self.values.__contains__
+        elif op == "~":
+            try:
+                self.pattern = re.compile(value)
+            except re.error as e:
+                raise QueryError(f"Invalid regex for {field}: {e}")
+            search = self.pattern.search
+            self._test = lambda text: search(text) is not None
+        else:
+            compare = _COMPARISONS[op]
+            convert = _FIELD_CONVERTERS.get(field)
+            if convert is None:
+                reference = value
+                self._test = lambda text: compare(text, reference)
+            else:
+                reference = convert(value)
+                if reference is None:
+                    raise QueryError(f"Invalid value for {field}{op}: {value}")
+
+                def test(text: str) -> bool:
+                    number = convert(text)
+                    return number is not None and compare(number, reference)
+
+                self._test = test
+
+    @property
+    def indexed(self) -> bool:
+        """True if the term is answered from the postings of its column."""
+        return self.op == ":" and not self.negated
+
+    def test(self, value: str) -> bool:
+        """Check a value of the field against the term."""
+        return self._test(value) != self.negated
+
+    def select(self, columns: JobColumns, indices: Optional[Iterable[int]] = None) -> List[int]:
+        """Select the rows of a snapshot that match the term.
+
+        :param columns: The snapshot
+        :param indices: Rows to consider, all of them by default
+        :return: Matching row indices
+        """
+        if self.indexed and indices is None:
+            return columns.lookup(self.field, self.values)
+        return columns.where(self.test, self.field, indices)
+
+    def __repr__(self) -> str:
+        return f"QueryTerm({'-' if self.negated else ''}{self.field}{self.op}{self.value})"
+
+
+class JobQuery:
+    """A compiled query over the jobs, such as ``state:RUNNING user:alice name~nf-.*SPADES mem>32G``.
+
+    The terms are separated by spaces and all of them must match:
+
+    - ``field:value`` the field is one of the comma separated values (``state:RUNNING,PENDING``)
+    - ``field~regex`` the regex is found in the field
+    - ``field>value`` (``<``, ``>=``, ``<=``) compares sizes, durations and job ids by value, the rest as text
+    - ``-term`` the term doesn't match
+    - any other word is looked for in ``word_fields``, as a regex or as a case insensitive substring
+
+    Values with spaces are quoted: ``reason:"Resources"`` or ``name~"my job"``. The
+    field names of :class:`JobRecord` can be used, or the short ones of ``FIELD_ALIASES``.
+
+    When the words are regexes, a query without any field term is a single regex,
+    spaces included, so the ``--filter`` patterns from before the query syntax
+    (``--filter "my job"``) keep their meaning.
+
+    On a :class:`JobColumns` snapshot the ``field:value`` terms are answered from
+    the postings of their column, and the other terms only test the remaining rows.
+    """
+
+    def __init__(self, terms: List[QueryTerm], words: List[str], word_fields: Sequence[str], regex_words: bool):
+        """Initialize the query, use :meth:`parse` to build one.
+
+        :param terms: The field terms
+        :param words: The free words
+        :param word_fields: Fields the free words are looked for in
+        :param regex_words: Free words are regexes, otherwise case insensitive substrings
+        """
+        self.terms = terms
+        self.words = words
+        self.word_fields = tuple(word_fields)
+        self.regex_words = regex_words
+        self._word_patterns: List[Pattern] = []
+        if regex_words:
+            for word in words:
+                try:
+                    self._word_patterns.append(re.compile(word))
+                except re.error as e:
+                    raise QueryError(f"Invalid regex {word}: {e}")
+
+    @classmethod
+    def parse(
+        cls, text: str, word_fields: Sequence[str] = ("job_name", "command"), regex_words: bool = True
+    ) -> "JobQuery":
+        """Compile a query.
+
+        :param text: The query
+        :param word_fields: Fields the free words are looked for in
+        :param regex_words: Free words are regexes (``--filter``), otherwise case insensitive substrings (dashboard)
+        :return: JobQuery instance
+        :raises QueryError: If the query is not valid
+        """
+        terms: List[QueryTerm] = []
+        words: List[str] = []
+        for token in _TOKEN.findall(text):
+            match = _TERM.fullmatch(token)
+            field = None
+            if match is not None:
+                negated, name, op, value = match.groups()
+                field = FIELD_ALIASES.get(name.lower(), name.lower())
+            if field not in JOB_FIELDS:
+                # Not a term, "a:b" is a word too
+                words.append(_unquote(token))
+                continue
+            terms.append(QueryTerm(field, op, _unquote(value), negated=bool(negated)))
+        if regex_words and not terms and len(words) > 1:
+            # No query syntax, a plain regex
+            words = [text.strip()]
+        return cls(terms, words, word_fields, regex_words)
+
+    def __bool__(self) -> bool:
+        return bool(self.terms or self.words)
+
+    @property
+    def name_patterns(self) -> List[Pattern]:
+        """Regexes of the query that apply to the job name, to highlight them."""
+        return self.field_patterns("job_name")
+
+    def field_patterns(self, field: str) -> List[Pattern]:
+        """Regexes of the query that apply to a field, to highlight them.
+
+        :param field: A field of ``JOB_FIELDS``
+        :return: The patterns of the free words and of the ``field~regex`` terms
+        """
+        patterns = list(self._word_patterns) if field in self.word_fields else []
+        patterns.extend(
+            term.pattern for term in self.terms if term.field == field and term.pattern and not term.negated
+        )
+        return patterns
+
+    def without(self, terms: Iterable[QueryTerm]) -> "JobQuery":
+        """Copy of the query without some of its terms, such as the ones the scheduler evaluates.
+
+        :param terms: Terms of this query to leave out
+        :return: JobQuery instance
+        """
+        excluded = set(map(id, terms))
+        return JobQuery(
+            [term for term in self.terms if id(term) not in excluded], self.words, self.word_fields, self.regex_words
+        )
+
+    def equalities(self) -> Dict[str, FrozenSet[str]]:
+        """Values the ``field:value`` terms accept, by field (the intersection if a field has several terms)."""
+        equalities: Dict[str, FrozenSet[str]] = {}
+        for term in self.terms:
+            if term.indexed:
+                equalities[term.field] = equalities.get(term.field, term.values) & term.values
+        return equalities
+
+    def select(self, columns: JobColumns, indices: Optional[Iterable[int]] = None) -> List[int]:
+        """Select the rows of a snapshot that match the query.
+
+        :param columns: The snapshot
+        :param indices: Rows to consider, all of them by default
+        :return: Matching row indices, in row order
+        """
+        # Start from the indexed terms, the most selective first, the others only filter what's left
+        indexed = [term for term in self.terms if term.indexed]
+        others = [term for term in self.terms if not term.indexed]
+        selected: Optional[List[int]] = None if indices is None else sorted(indices)
+        if indexed:
+            postings = [columns.lookup(term.field, term.values) for term in indexed]
+            postings.sort(key=len)
+            rows = postings[0]
+            for other in postings[1:]:
+                keep = set(other)
+                rows = [index for index in rows if index in keep]
+            if selected is not None:
+                keep = set(selected)
+                rows = [index for index in rows if index in keep]
+            selected = rows
+
+        for term in others:
+            selected = term.select(columns, selected)
+
+        for word, pattern in zip(self.words, self._word_patterns or [None] * len(self.words)):
+            if pattern is not None:
+                selected = columns.match_regex(pattern, self.word_fields, selected)
+            else:
+                matches = columns.search_index(self.word_fields).search(word)
+                if selected is None:
+                    selected = matches
+                else:
+                    keep = set(matches)
+                    selected = [index for index in selected if index in keep]
+
+        return list(range(len(columns))) if selected is None else selected
+
+    def matches(self, job: JobRecord) -> bool:
+        """Check a single job, for streams that are not held in a snapshot."""
+        for term in self.terms:
+            if not term.test(getattr(job, term.field)):
+                return False
+        values = [getattr(job, field) for field in self.word_fields]
+        for word, pattern in zip(self.words, self._word_patterns or [None] * len(self.words)):
+            if pattern is not None:
+                if not any(pattern.search(value) for value in values):
+                    return False
+            elif not any(word.lower() in value.lower() for value in values):
+                return False
+        return True
+
+    def __repr__(self) -> str:
+        return f"JobQuery(terms={self.terms!r}, words={self.words!r})"
+
+
+def _unquote(value: str) -> str:
+    """Remove the pair of quotes around a whole value, the other quotes are part of it."""
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
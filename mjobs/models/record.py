@@ -0,0 +1,440 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import re
+import time
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from mjobs.models.job import SlurmJob
+
+# Field mapping for squeue output - matches the order in slurm.py
+SQUEUE_FIELDS = [
+    ("%.18i", "job_id"),
+    ("%.200j", "job_name"),
+    ("%l", "time_limit"),
+    ("%m", "memory"),
+    ("%.50P", "partition"),
+    ("%T", "job_state"),
+    ("%u", "user_name"),
+    ("%.200o", "command"),
+    ("%.20r", "state_reason"),
+    ("%S", "start_time"),
+    ("%V", "submit_time"),
+    ("%L", "end_time"),
+    ("%.100Z", "workdir"),
+    ("%.50a", "account"),
+    ("%.50q", "qos"),
+    ("%.N", "nodes"),
+]
+
+# The cluster is not printed by squeue, it's the cluster that was queried (-M)
+JOB_FIELDS: Tuple[str, ...] = tuple(field[1] for field in SQUEUE_FIELDS) + ("cluster",)
+
+VALID_JOB_STATES = frozenset(
+    {
+        "PENDING",
+        "RUNNING",
+        "SUSPENDED",
+        "COMPLETED",
+        "CANCELLED",
+        "FAILED",
+        "TIMEOUT",
+        "NODE_FAIL",
+        "PREEMPTED",
+        "BOOT_FAIL",
+        "DEADLINE",
+        "OUT_OF_MEMORY",
+    }
+)
+
+# States a job doesn't leave anymore
+TERMINAL_JOB_STATES = frozenset(
+    {
+        "COMPLETED",
+        "CANCELLED",
+        "FAILED",
+        "TIMEOUT",
+        "NODE_FAIL",
+        "PREEMPTED",
+        "BOOT_FAIL",
+        "DEADLINE",
+        "OUT_OF_MEMORY",
+    }
+)
+
+_EMPTY_NODES = frozenset({"", "-----", "None"})
+
+# bjobs STAT values, as the Slurm states the rest of mjobs knows (UNKWN and ZOMBI are kept as they are)
+LSF_JOB_STATES = {
+    "PEND": "PENDING",
+    "PROV": "PENDING",
+    "WAIT": "PENDING",
+    "RUN": "RUNNING",
+    "PSUSP": "SUSPENDED",
+    "USUSP": "SUSPENDED",
+    "SSUSP": "SUSPENDED",
+    "DONE": "COMPLETED",
+    "EXIT": "FAILED",
+}
+
+# bjobs shows the elements of a job array with the id of the array and the index in the name: "name[7]"
+_LSF_ARRAY_INDEX = re.compile(r"\[(\d+)\]\Z")
+
+
+class JobRecord:
+    """Lightweight job record used on the hot path (parsing, tables and tsv output).
+
+    It only holds the squeue fields, and the cluster, in ``__slots__`` and applies the same cheap
+    normalisation as the pydantic model. The validated :class:`SlurmJob` is built
+    lazily, and only when :meth:`validate`, :meth:`to_model` or :meth:`to_dict` are called.
+    """
+
+    __slots__ = JOB_FIELDS + ("_model",)
+
+    # Number of jobs the record stands for, more for the rows of collapsed job arrays
+    task_count = 1
+
+    def __init__(
+        self,
+        job_id: str,
+        job_name: str,
+        time_limit: str,
+        memory: str,
+        partition: str,
+        job_state: str,
+        user_name: str,
+        command: str,
+        state_reason: str,
+        start_time: str,
+        submit_time: str,
+        end_time: str,
+        workdir: str,
+        account: str,
+        qos: str,
+        nodes: str,
+        cluster: str = "",
+    ):
+        self.job_id = job_id
+        self.job_name = job_name
+        self.time_limit = time_limit
+        self.memory = memory
+        self.partition = partition
+        self.job_state = job_state
+        self.user_name = user_name
+        self.command = command
+        self.state_reason = state_reason
+        self.start_time = start_time
+        self.submit_time = submit_time
+        self.end_time = end_time
+        self.workdir = workdir
+        self.account = account
+        self.qos = qos
+        self.nodes = nodes
+        self.cluster = cluster
+        self._model = None
+
+    @classmethod
+    def from_values(cls, values, cluster: str = "") -> "JobRecord":
+        """Create a normalised JobRecord from the squeue field values, in ``SQUEUE_FIELDS`` order.
+
+        :param values: Stripped field values
+        :param cluster: Cluster the job runs on (default: none, the local cluster)
+        :return: JobRecord instance
+        :raises ValueError: If one of the mandatory fields is empty
+        """
+        (
+            job_id,
+            job_name,
+            time_limit,
+            memory,
+            partition,
+            job_state,
+            user_name,
+            command,
+            state_reason,
+            start_time,
+            submit_time,
+            end_time,
+            workdir,
+            account,
+            qos,
+            nodes,
+        ) = values
+        if not job_id:
+            raise ValueError("Job ID cannot be empty")
+        if not job_name or not partition or not user_name:
+            raise ValueError("Field cannot be empty")
+        return cls(
+            job_id,
+            job_name,
+            time_limit,
+            memory,
+            partition,
+            job_state.upper(),
+            user_name,
+            command,
+            state_reason,
+            start_time,
+            submit_time,
+            end_time,
+            workdir,
+            account,
+            qos,
+            "N/A" if nodes in _EMPTY_NODES else nodes,
+            cluster,
+        )
+
+    @classmethod
+    def from_squeue_line(cls, line: str, field_count: int) -> "JobRecord":
+        """Create JobRecord from squeue output line.
+
+        :param line: Raw line from squeue output
+        :param field_count: Expected number of fields
+        :return: JobRecord instance
+        :raises ValueError: If line cannot be parsed
+        """
+        if not line or line.strip() == "":
+            raise ValueError("Cannot parse empty line")
+
+        # Parse the pipe-separated values, handling quoted strings
+        values = [element.strip() for element in line.strip('"').split("|")]
+
+        # Handle missing nodes field for non-running jobs
+        if len(values) == field_count - 1:
+            values.append("-----")
+        elif len(values) != field_count:
+            raise ValueError(f"Expected {field_count} fields, got {len(values)}")
+
+        return cls.from_values(values)
+
+    @classmethod
+    def from_squeue_json(cls, record: Dict[str, Any]) -> "JobRecord":
+        """Create JobRecord from a job record of ``squeue --json``.
+
+        Handles both the plain values of older Slurm releases and the
+        ``{"set": ..., "infinite": ..., "number": ...}`` wrappers of the data_parser plugins.
+
+        :param record: A single entry of the ``jobs`` array
+        :return: JobRecord instance
+        :raises ValueError: If the record cannot be converted
+        """
+        try:
+            job_state = record.get("job_state")
+            if isinstance(job_state, list):
+                job_state = job_state[0] if job_state else ""
+            job_state = job_state or ""
+
+            return cls.from_values(
+                [
+                    _json_job_id(record),
+                    (record.get("name") or "").strip(),
+                    _json_time_limit(record.get("time_limit")),
+                    _json_memory(record),
+                    (record.get("partition") or "").strip(),
+                    job_state.strip(),
+                    (record.get("user_name") or "").strip(),
+                    (record.get("command") or "").strip(),
+                    record.get("state_reason") or "None",
+                    _json_timestamp(record.get("start_time")),
+                    _json_timestamp(record.get("submit_time")),
+                    _json_time_left(record, job_state),
+                    record.get("current_working_directory") or "",
+                    (record.get("account") or "").strip(),
+                    (record.get("qos") or "").strip(),
+                    (record.get("nodes") or "").strip(),
+                ],
+                (record.get("cluster") or "").strip(),
+            )
+        except (AttributeError, TypeError) as e:
+            raise ValueError(f"Failed to parse squeue json record {record.get('job_id')}: {e}")
+
+    @classmethod
+    def from_bjobs_json(cls, record: Dict[str, Any]) -> "JobRecord":
+        """Create JobRecord from a record of ``bjobs -json -o ...``.
+
+        The LSF states are mapped to the Slurm ones, the queue is the partition and
+        an element of a job array gets the ``<array id>[<index>]`` id bkill takes.
+
+        :param record: A single entry of the ``RECORDS`` array, with upper case field names
+        :return: JobRecord instance
+        :raises ValueError: If the record cannot be converted
+        """
+        try:
+            job_id = _bjobs_value(record, "JOBID")
+            job_name = _bjobs_value(record, "JOB_NAME")
+            array_index = _LSF_ARRAY_INDEX.search(job_name)
+            if job_id and array_index:
+                job_id = f"{job_id}[{array_index.group(1)}]"
+            job_state = _bjobs_value(record, "STAT").upper()
+
+            return cls.from_values(
+                [
+                    job_id,
+                    job_name,
+                    "N/A",
+                    "0",
+                    _bjobs_value(record, "QUEUE"),
+                    LSF_JOB_STATES.get(job_state, job_state),
+                    _bjobs_value(record, "USER"),
+                    _bjobs_value(record, "COMMAND"),
+                    _bjobs_value(record, "PEND_REASON") or _bjobs_value(record, "EXIT_REASON") or "None",
+                    _bjobs_value(record, "START_TIME") or "N/A",
+                    _bjobs_value(record, "SUBMIT_TIME") or "N/A",
+                    "N/A",
+                    "",
+                    "",
+                    "",
+                    _bjobs_value(record, "EXEC_HOST"),
+                ]
+            )
+        except (AttributeError, TypeError) as e:
+            raise ValueError(f"Failed to parse bjobs json record {record.get('JOBID')}: {e}")
+
+    def to_model(self) -> "SlurmJob":
+        """Build (once) the validated pydantic model for this record.
+
+        :return: SlurmJob instance
+        :raises ValueError: If the record doesn't pass the model validation
+        """
+        if self._model is None:
+            from mjobs.models.job import SlurmJob
+
+            self._model = SlurmJob(**{field: getattr(self, field) for field in JOB_FIELDS})
+        return self._model
+
+    def validate(self) -> "JobRecord":
+        """Run the pydantic validation on this record.
+
+        :return: The record itself
+        :raises ValueError: If the record doesn't pass the model validation
+        """
+        self.to_model()
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to dictionary for serialization.
+
+        :return: Dictionary representation of the job
+        """
+        return self.to_model().to_dict()
+
+    def as_tuple(self) -> Tuple[str, ...]:
+        """Return the field values, in ``JOB_FIELDS`` order."""
+        return tuple(getattr(self, field) for field in JOB_FIELDS)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, JobRecord):
+            return NotImplemented
+        return self.as_tuple() == other.as_tuple()
+
+    def __hash__(self) -> int:
+        # Equal records have the same job, the records can be put in sets and used as keys
+        return hash((self.cluster, self.job_id))
+
+    def __repr__(self) -> str:
+        return f"JobRecord(job_id={self.job_id!r}, job_name={self.job_name!r}, job_state={self.job_state!r})"
+
+
+def _json_number(value: Any) -> Optional[int]:
+    """Unwrap a numeric value from ``squeue --json``.
+
+    Newer data_parser versions wrap numbers as ``{"set": bool, "infinite": bool, "number": int}``.
+
+    :param value: Raw json value
+    :return: The number, ``None`` when unset, or ``-1`` when infinite
+    """
+    if isinstance(value, dict):
+        if value.get("infinite"):
+            return -1
+        if not value.get("set", True):
+            return None
+        value = value.get("number")
+    if value is None or isinstance(value, bool):
+        return None
+    return int(value)
+
+
+def _bjobs_value(record: Dict[str, Any], field: str) -> str:
+    """A field of a bjobs json record, bjobs shows the empty ones as ``-``."""
+    value = (record.get(field) or "").strip()
+    return "" if value == "-" else value
+
+
+def _format_duration(seconds: int) -> str:
+    """Format seconds the same way squeue does (``[days-]hours:minutes:seconds``)."""
+    days, seconds = divmod(max(seconds, 0), 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days:
+        return f"{days}-{hours:02d}:{minutes:02d}:{seconds:02d}"
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def _json_job_id(record: Dict[str, Any]) -> str:
+    """Build the squeue ``%i`` job id, including the array notation."""
+    array_job_id = _json_number(record.get("array_job_id"))
+    if array_job_id:
+        task_string = record.get("array_task_string")
+        if task_string:
+            return f"{array_job_id}_[{task_string}]"
+        task_id = _json_number(record.get("array_task_id"))
+        if task_id is not None and task_id >= 0:
+            return f"{array_job_id}_{task_id}"
+    return str(_json_number(record.get("job_id")))
+
+
+def _json_time_limit(value: Any) -> str:
+    """Format a time limit in minutes as squeue ``%l``."""
+    minutes = _json_number(value)
+    if minutes is None:
+        return "N/A"
+    if minutes < 0:
+        return "UNLIMITED"
+    return _format_duration(minutes * 60)
+
+
+def _json_memory(record: Dict[str, Any]) -> str:
+    """Format the requested memory as squeue ``%m``."""
+    megabytes = _json_number(record.get("memory_per_node"))
+    if not megabytes:
+        megabytes = _json_number(record.get("memory_per_cpu"))
+    if not megabytes or megabytes < 0:
+        return "0"
+    if megabytes % 1024 == 0:
+        return f"{megabytes // 1024}G"
+    return f"{megabytes}M"
+
+
+def _json_timestamp(value: Any) -> str:
+    """Format an epoch timestamp as squeue ``%S``/``%V``."""
+    epoch = _json_number(value)
+    if not epoch or epoch < 0:
+        return "N/A"
+    return datetime.fromtimestamp(epoch).strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _json_time_left(record: Dict[str, Any], job_state: str) -> str:
+    """Compute the remaining time as squeue ``%L``."""
+    if job_state.upper() == "PENDING":
+        return _json_time_limit(record.get("time_limit"))
+    end_time = _json_number(record.get("end_time"))
+    if job_state.upper() in ("RUNNING", "SUSPENDED", "COMPLETING") and end_time and end_time > 0:
+        return _format_duration(int(end_time - time.time()))
+    return "INVALID"
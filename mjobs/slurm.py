@@ -15,24 +15,35 @@
 # limitations under the License.
 
 import getpass
-import re
 import sys
 from datetime import datetime
-from subprocess import CalledProcessError, check_output
+from itertools import islice
+from subprocess import CalledProcessError
 from types import SimpleNamespace
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from rich.console import Console
 from rich.text import Text
 
 from mjobs.base import Base
+from mjobs.core.cancel import BulkCanceller, CancelReport
 from mjobs.data import JobRepository
+from mjobs.data.repository import JobRepositoryError
+from mjobs.models import JOB_FIELDS, TERMINAL_JOB_STATES, JobColumns, JobQuery, JobRecord, QueryError, collapse_arrays
 
 
 class Slurm(Base):
+    # Jobs whose details are fetched by a single scontrol call with --extended
+    DETAILS_PAGE_SIZE = 500
+    # scancel calls run at the same time when the jobs don't fit in one
+    CANCEL_WORKERS = 4
+
     def __init__(self, console: Console, error_console: Console, job_repository: Optional[JobRepository] = None):
         super().__init__(console, error_console)
         self.job_repository = job_repository
+        # The compiled --filter, and the part of it squeue doesn't evaluate
+        self.query: Optional[JobQuery] = None
+        self.local_query: Optional[JobQuery] = None
 
     def status_style(self, job_state) -> Text:
         colours = {
@@ -46,29 +57,50 @@ class Slurm(Base):
     def run(self, **kwargs):
         args_dict = dict(kwargs)
         args_dict["job_id"] = args_dict.pop("job_ids", ())
+        args_dict.setdefault("stream", False)
+        args_dict.setdefault("refresh_interval", 10.0)
+        args_dict.setdefault("clusters", [])
+        args_dict.setdefault("collapse_arrays", False)
+        args_dict.setdefault("output_format", None)
+        args_dict.setdefault("export_parquet", None)
+        if args_dict["output_format"] or args_dict["export_parquet"]:
+            # Nothing but the export goes to stdout
+            args_dict["tsv"] = True
         self.args = SimpleNamespace(**args_dict)
 
+        if self.args.output_format and self.args.export_parquet:
+            self.error_console.print(Text("--format and --export-parquet can't be used together"), style="bold red")
+            sys.exit(2)
+
+        try:
+            self.query = JobQuery.parse(self.args.filter) if self.args.filter else None
+        except QueryError as e:
+            self.error_console.print(Text(f"Invalid --filter: {e}"), style="bold red")
+            sys.exit(2)
+
         if self.args.dashboard:
             from mjobs.dashboard import launch_dashboard
 
-            launch_dashboard(self)
+            launch_dashboard(self, refresh_interval=self.args.refresh_interval)
             return
 
         jobs = []
-        extra_args = []
+        extra_args = self.filter_args()
 
-        if self.args.user:
-            extra_args.extend(["-u", self.args.user])
-        if self.args.partition:
-            extra_args.extend(["-p", self.args.partition])
-        for state in self.args.states or []:
-            extra_args.extend(["-t", state])
-        for node in self.args.nodelist or []:
-            extra_args.extend(["-w", node])
+        self.local_query = self.query
+        if self.query:
+            # Let slurmctld filter on what it can, less jobs to send and parse
+            pushed_args, self.local_query = self.job_repository.plan_filters(self.query, extra_args)
+            extra_args.extend(pushed_args)
+
+        if self.args.stream and not self.args.kill:
+            self.stream_tsv(extra_args)
+            return
 
         try:
-            status = self.console.status("Getting jobs from Slurm...")
             if not self.args.tsv:
+                # rich.status loads the spinners and the table machinery, a tsv has no use for them
+                status = self.console.status("Getting jobs from Slurm...")
                 status.start()
 
             jobs = self.get_jobs(self.args.job_id, extra_args)
@@ -85,14 +117,14 @@ class Slurm(Base):
                 status.stop()
             self.console.print_exception()
 
-        if self.args.filter:
-            filter_regex = re.compile(self.args.filter)
-            jobs = list(
-                filter(
-                    lambda j: filter_regex.search(j.job_name) or filter_regex.search(j.command),
-                    jobs,
-                )
-            )
+        # The columns select and sort row indices, the rows are the records squeue gave
+        snapshot = JobColumns.from_records(jobs)
+        indices = self.local_query.select(snapshot) if self.local_query else None
+        jobs = [jobs[index] for index in snapshot.sort_indices("job_id", indices)]
+        del snapshot
+        if self.args.collapse_arrays and not self.args.kill:
+            # The table scales with the number of arrays, not of tasks
+            jobs = collapse_arrays(jobs)
 
         if self.args.kill:
             if not jobs:
@@ -105,17 +137,18 @@ class Slurm(Base):
                     self.console.print(Text("Aborted."))
                     return
             self.console.print(Text(f"Cancelling {len(jobs)} job(s)..."), style="bold white")
-            killed = 0
-            failed = 0
+            report = self.kill_jobs(jobs, extra_args)
             for job in jobs:
-                try:
-                    self.kill_job(job.job_id)
+                reason = report.failed.get((job.cluster, job.job_id))
+                if reason is None:
                     self.console.print(f"  {job.job_id} {job.job_name}: cancelled")
-                    killed += 1
-                except CalledProcessError:
-                    self.error_console.print(Text(f"  {job.job_id} {job.job_name}: failed"), style="bold red")
-                    failed += 1
-            self.console.print(Text(f"Done. Killed: {killed}, Failed: {failed}"))
+                else:
+                    self.error_console.print(Text(f"  {job.job_id} {job.job_name}: failed, {reason}"), style="bold red")
+            self.console.print(Text(f"Done. Killed: {len(report.cancelled)}, Failed: {len(report.failed)}"))
+            return
+
+        if self.args.output_format or self.args.export_parquet:
+            self.export(jobs)
             return
 
         if not jobs:
@@ -127,9 +160,60 @@ class Slurm(Base):
             title += f" on partition {self.args.partition}"
         if self.args.nodelist:
             title += f" running on hosts {self.args.nodelist}"
+        if self.args.clusters:
+            title += f" on clusters {', '.join(self.args.clusters)}"
+
+        self.render(title=title, columns=self.table_columns(), rows=list(self.table_rows(jobs)))
+
+    def filter_args(self) -> list[str]:
+        """The squeue arguments of the command line filters."""
+        extra_args = []
+        if self.args.user:
+            extra_args.extend(["-u", self.args.user])
+        if self.args.partition:
+            extra_args.extend(["-p", self.args.partition])
+        for state in self.args.states or []:
+            extra_args.extend(["-t", state])
+        for node in self.args.nodelist or []:
+            extra_args.extend(["-w", node])
+        return extra_args
+
+    def stream_tsv(self, extra_args: list[str]):
+        """Print (or export) the jobs as a tsv while squeue is still producing them.
+
+        Rows come in the squeue order (sorted by job id), so nothing has to be buffered.
+
+        :param extra_args: squeue filter arguments
+        """
+        self.args.tsv = True
+        jobs = self.job_repository.iter_jobs(self.args.job_id, extra_args + ["--sort", "i"])
+        if self.local_query:
+            jobs = filter(self.local_query.matches, jobs)
+
+        try:
+            if self.args.output_format or self.args.export_parquet:
+                self.export(jobs)
+            else:
+                self.render(title="", columns=self.table_columns(), rows=self.table_rows(jobs))
+        except JobRepositoryError as e:
+            self.error_console.print(Text(str(e)), style="bold red")
+            sys.exit(1)
 
-        cols = [
-            {"header": "JobId", "justify": "right"},
+    def export_fields(self) -> list[str]:
+        """The JobRecord fields written by :meth:`export`, with the cluster and the task count when listed."""
+        fields = [field for field in JOB_FIELDS if field != "cluster" or self.args.clusters]
+        if self.args.collapse_arrays:
+            fields.append("task_count")
+        return fields
+
+    def table_columns(self) -> list[dict[str, Any]]:
+        """Columns of the jobs table, also used as the tsv header."""
+        cols = [{"header": "JobId", "justify": "right"}]
+        if self.args.clusters:
+            cols.append({"header": "Cluster"})
+        if self.args.collapse_arrays:
+            cols.append({"header": "Tasks", "justify": "right"})
+        cols += [
             {"header": "Status"},
             {"header": "JobName", "overflow": "fold"},
             {"header": "User"},
@@ -142,35 +226,74 @@ class Slurm(Base):
         if self.args.extended:
             cols.append({"header": "WorkDir"})
             cols.append({"header": "Nodes"})
+            cols.append({"header": "StdOut", "overflow": "fold"})
+            cols.append({"header": "StdErr", "overflow": "fold"})
+        return cols
 
-        rows = []
+    def table_rows(self, jobs: Iterable[JobRecord]) -> Iterator[list[Any]]:
+        """Build the table (or tsv) rows of the jobs.
 
-        for job in sorted(jobs, key=lambda j: j.job_id):
-            job_name = Text(job.job_name)
-            if self.args.filter:
-                job_name.highlight_regex(rf"{self.args.filter}", "bold red")
+        With --extended the details are fetched for a page of jobs at a time,
+        with one scontrol call per page.
+        """
+        if not self.args.extended:
+            for job in jobs:
+                yield self.table_row(job)
+            return
 
-            row = [
-                job.job_id,
+        jobs = iter(jobs)
+        while True:
+            page = list(islice(jobs, self.DETAILS_PAGE_SIZE))
+            if not page:
+                return
+            details = self.get_jobs_details([job.job_id for job in page])
+            for job in page:
+                yield self.table_row(job, details.get(job.job_id))
+
+    def table_row(self, job: JobRecord, details: Optional[Dict[str, Any]] = None) -> list[Any]:
+        """Build the table (or tsv) row of a job.
+
+        :param job: The job
+        :param details: The scontrol details of the job, for the --extended columns
+        """
+        if self.args.tsv:
+            # The styles would be dropped anyway
+            status, job_name, nodes = job.job_state, job.job_name, job.nodes
+        else:
+            status, job_name, nodes = (
                 self.status_style(job.job_state),
-                job_name,
-                job.user_name,
-                job.partition,
-                self.parse_timestamp_str(job.submit_time),
-                self.parse_timestamp_str(job.start_time),
-                job.end_time,
-                job.state_reason,
-            ]
-            if self.args.extended:
-                row.extend(
-                    [
-                        job.workdir,
-                        Text(job.nodes, overflow="fold"),
-                    ]
-                )
-            rows.append(row)
-
-        self.render(title=title, columns=cols, rows=rows)
+                Text(job.job_name),
+                Text(job.nodes, overflow="fold"),
+            )
+            if self.query:
+                for pattern in self.query.name_patterns:
+                    job_name.highlight_regex(pattern, "bold red")
+
+        row = [job.job_id]
+        if self.args.clusters:
+            row.append(job.cluster)
+        if self.args.collapse_arrays:
+            row.append(str(job.task_count))
+        row += [
+            status,
+            job_name,
+            job.user_name,
+            job.partition,
+            self.parse_timestamp_str(job.submit_time),
+            self.parse_timestamp_str(job.start_time),
+            job.end_time,
+            job.state_reason,
+        ]
+        if self.args.extended:
+            row.extend(
+                [
+                    job.workdir,
+                    nodes,
+                    (details or {}).get("StdOut", "N/A"),
+                    (details or {}).get("StdErr", "N/A"),
+                ]
+            )
+        return row
 
     def get_jobs(self, job_ids: Optional[list[int]] = None, args: Optional[list[str]] = None):
         if not self.job_repository:
@@ -193,6 +316,43 @@ class Slurm(Base):
 
         return self.job_repository.get_job_details(job_id)
 
-    def kill_job(self, job_id: str) -> str:
-        args = ["scancel", str(job_id)]
-        return check_output(args, universal_newlines=True)
+    def get_jobs_details(self, job_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        if not self.job_repository:
+            raise ValueError("No job repository configured. This should not happen in the new architecture.")
+
+        return self.job_repository.get_jobs_details(job_ids)
+
+    def kill_jobs(self, jobs: List[JobRecord], extra_args: Optional[List[str]] = None) -> CancelReport:
+        """Cancel jobs with as few scancel calls as possible, one set per cluster.
+
+        scancel fails as a whole if one of its jobs can't be cancelled, so the
+        jobs are listed again with the same filters to tell which ones were.
+
+        :param jobs: The jobs to cancel
+        :param extra_args: The squeue arguments the jobs were listed with
+        :return: CancelReport keyed on (cluster, job id)
+        """
+        by_cluster: Dict[str, List[str]] = {}
+        for job in jobs:
+            by_cluster.setdefault(job.cluster, []).append(job.job_id)
+
+        canceller = BulkCanceller(max_workers=self.CANCEL_WORKERS)
+        outcomes: Dict[Tuple[str, str], Optional[str]] = {}
+        commands = 0
+        for cluster, job_ids in by_cluster.items():
+            for chunk, error in canceller.cancel(["scancel", "-M", cluster] if cluster else ["scancel"], job_ids):
+                commands += 1
+                outcomes.update(((cluster, job_id), error) for job_id in chunk)
+
+        self.job_repository.invalidate()
+        try:
+            remaining = self.get_jobs(self.args.job_id, extra_args)
+        except Exception as e:
+            self.error_console.print(Text(f"Could not list the jobs again, using the scancel exit status: {e}"))
+            return CancelReport.from_outcomes(outcomes, commands=commands)
+        active = {
+            (job.cluster, job.job_id): job.job_state
+            for job in remaining
+            if job.job_state not in TERMINAL_JOB_STATES and job.job_state != "COMPLETING"
+        }
+        return CancelReport.from_outcomes(outcomes, active, commands)
@@ -14,17 +14,156 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import re
+import time
 from pathlib import Path
+from typing import List, Optional, Tuple
 
+from rich.segment import Segment
+from rich.style import Style
+from textual import work
 from textual.app import ComposeResult
 from textual.binding import Binding
 from textual.containers import Container, Vertical
+from textual.geometry import Size
 from textual.screen import ModalScreen
-from textual.widgets import RichLog
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from textual.widgets import Input, Static
+from textual.worker import get_current_worker
+
+from mjobs.widgets.file_watch import FileWatcher
+from mjobs.widgets.log_file import LogFile, LogSearch
+
+
+class LogView(ScrollView, can_focus=True):
+    """Virtualized view of a LogFile, only the lines on screen are read and rendered.
+
+    Until the line index is complete the height is an estimate. Rows past the
+    indexed lines are located from their approximate offset in the file, or from
+    the end of the file when the view reaches the bottom, and have no line number.
+    """
+
+    MATCH_STYLE = Style(color="black", bgcolor="yellow")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.log_file: Optional[LogFile] = None
+        self.message = ""
+        # (line number or None, text) of the rows on screen, and what they were computed for
+        self._window: List[Tuple[Optional[int], str]] = []
+        self._window_key: Optional[tuple] = None
+        self._gutter_width = 6
+        # Keep showing the end of the file as it grows
+        self.follow = False
+        # Matches are highlighted, the line of the current one is marked
+        self.search: Optional[LogSearch] = None
+        self.current_line: Optional[int] = None
+
+    def set_log_file(self, log_file: Optional[LogFile], message: str = "") -> None:
+        """Show a file, or a message when there is none.
+
+        :param log_file: The file to display
+        :param message: Text shown instead of the file
+        """
+        self.log_file = log_file
+        self.message = message
+        self.update_size()
+
+    def update_size(self) -> None:
+        """Recompute the virtual size, after the index grew."""
+        at_bottom = self.scroll_y >= self.max_scroll_y and (self.scroll_y > 0 or self.follow)
+        lines = self.log_file.estimated_line_count() if self.log_file is not None else 1
+        self._gutter_width = max(len(str(lines)), 6)
+        self._window_key = None
+        self.virtual_size = Size(max(self.virtual_size.width, self.scrollable_content_region.width), lines)
+        if at_bottom:
+            # Stay at the end of the file
+            self.scroll_end(animate=False, immediate=True)
+        self.refresh()
+
+    def _visible_rows(self) -> List[Tuple[Optional[int], str]]:
+        """The rows on screen, computed once per scroll position."""
+        first, height = int(self.scroll_y), self.scrollable_content_region.height
+        key = (first, height, self.virtual_size.height, self.log_file.indexed_bytes)
+        if key == self._window_key:
+            return self._window
+
+        log_file = self.log_file
+        if first + height <= log_file.indexed_lines or log_file.complete:
+            numbers = range(first, min(first + height, log_file.indexed_lines))
+            start = log_file.line_start(first)
+        elif first + height >= self.virtual_size.height:
+            # At the bottom before the index is: the last lines of the file
+            numbers = [None] * height
+            starts = log_file.tail_starts(height)
+            start = starts[0] if starts else None
+        else:
+            numbers = [None] * height
+            start = log_file.line_start_at(log_file.size * first // self.virtual_size.height)
+
+        rows = []
+        for number in numbers:
+            if start is None or start >= log_file.size:
+                break
+            text, start = log_file.read_line(start)
+            rows.append((number, text))
+
+        width = self._gutter_width + 2 + max((len(text) for _, text in rows), default=0)
+        if width > self.virtual_size.width:
+            self.call_after_refresh(self._grow_width, width)
+
+        self._window, self._window_key = rows, key
+        return rows
+
+    def _grow_width(self, width: int) -> None:
+        if width > self.virtual_size.width:
+            self.virtual_size = Size(width, self.virtual_size.height)
+
+    def render_line(self, y: int) -> Strip:
+        """Render one row of the view."""
+        style = self.rich_style
+        width = self.scrollable_content_region.width
+        if self.log_file is None or not self.log_file.size:
+            text = (self.message or "Empty file") if y == 0 else ""
+            message_style = style + (Style(color="red") if self.message else Style(dim=True))
+            return Strip([Segment(text, message_style)]).extend_cell_length(width, style)
+
+        rows = self._visible_rows()
+        if y >= len(rows):
+            return Strip.blank(width, style)
+
+        number, text = rows[y]
+        gutter = f"{number + 1:>{self._gutter_width}}: " if number is not None else " " * (self._gutter_width + 2)
+        current = number is not None and number == self.current_line
+        segments = [Segment(gutter, style + (Style(bold=True, reverse=True) if current else Style(dim=True)))]
+        if self.search is not None:
+            segments.extend(self._highlight(text, style))
+        else:
+            segments.append(Segment(text, style))
+        scroll_x = int(self.scroll_x)
+        return Strip(segments).crop(scroll_x, scroll_x + width).extend_cell_length(width, style)
+
+    def _highlight(self, text: str, style: Style) -> List[Segment]:
+        """Split a line in segments, with the search matches highlighted."""
+        segments = []
+        position = 0
+        for match in self.search.text_regex.finditer(text):
+            if match.start() == match.end():
+                continue
+            segments.append(Segment(text[position : match.start()], style))
+            segments.append(Segment(match.group(), style + self.MATCH_STYLE))
+            position = match.end()
+        segments.append(Segment(text[position:], style))
+        return segments
 
 
 class FileViewerScreen(ModalScreen[None]):
-    """Modal screen for viewing file contents."""
+    """Modal screen for viewing file contents.
+
+    Files of any size open instantly: see :class:`LogFile` and :class:`LogView`.
+    """
 
     BINDINGS = [
         Binding("escape", "close", "Close"),
@@ -35,8 +174,15 @@ class FileViewerScreen(ModalScreen[None]):
         Binding("k", "scroll_up", "Scroll Up"),
         Binding("space", "page_down", "Page Down"),
         Binding("b", "page_up", "Page Up"),
+        Binding("f", "toggle_follow", "Follow"),
+        Binding("slash", "search", "Search"),
+        Binding("n", "next_match", "Next Match"),
+        Binding("N", "previous_match", "Previous Match"),
     ]
 
+    # Blocks indexed between two updates of the view (16 MiB with the default block size)
+    INDEX_BATCH = 256
+
     CSS = """
     FileViewerScreen {
         align: center middle;
@@ -60,34 +206,69 @@ class FileViewerScreen(ModalScreen[None]):
         height: 1fr;
         border: solid $secondary;
         scrollbar-gutter: stable;
-        text-wrap: wrap;
+    }
+
+    #search_input {
+        display: none;
+    }
+
+    #search_input.visible {
+        display: block;
     }
 
     """
 
-    def __init__(self, file_path: str, **kwargs):
+    def __init__(self, file_path: str, follow: bool = False, poll_interval: float = 1.0, **kwargs):
+        """Create the viewer.
+
+        :param file_path: The file to show
+        :param follow: Start in follow mode, showing what is appended to the file like ``tail -f``
+        :param poll_interval: Seconds between two checks in follow mode when inotify can't be used
+        """
         super().__init__(**kwargs)
         self.file_path = file_path
-        self.file_lines = []
+        self.log_file: Optional[LogFile] = None
         self.error_message = ""
+        self.follow = follow
+        self.poll_interval = poll_interval
+        self.watch_mode = ""
+        self.search: Optional[LogSearch] = None
+        # Start of the line of the current match, and whether to go to the first match once found
+        self._match_offset: Optional[int] = None
+        self._jump_to_match = False
+        # A match to show once the background indexer gets to it
+        self._pending_match: Optional[int] = None
 
     def compose(self) -> ComposeResult:
         """Create the file viewer interface."""
         with Container(id="file_viewer_dialog"):
             with Vertical():
-                yield RichLog(id="file_header", max_lines=1, markup=True)
-                yield RichLog(id="file_log", markup=True, highlight=True, auto_scroll=False, wrap=True)
+                yield Static(id="file_header", markup=False)
+                yield LogView(id="file_log")
+                yield Input(
+                    placeholder="Search (regex, smart case), Enter to search, Escape to cancel", id="search_input"
+                )
 
     def on_mount(self) -> None:
-        """Load and display file content when screen mounts."""
+        """Open the file and display it, the line index is built in the background."""
         self.load_file_content()
         self.display_content()
         # Focus the log widget so scrolling works
-        log_widget = self.query_one("#file_log", RichLog)
+        log_widget = self.query_one("#file_log", LogView)
         log_widget.focus()
+        if self.log_file is not None and not self.log_file.complete:
+            self._index_file()
+        if self.follow:
+            self.start_following()
+
+    def on_unmount(self) -> None:
+        """Release the file."""
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
 
     def load_file_content(self) -> None:
-        """Load the file content or set error message."""
+        """Open the file or set error message."""
         try:
             file_path = Path(self.file_path)
 
@@ -99,22 +280,12 @@ class FileViewerScreen(ModalScreen[None]):
                 self.error_message = f"Path is not a file: {self.file_path}"
                 return
 
-            # Check if file is too large (increase limit to 10MB)
-            file_size = file_path.stat().st_size
-            if file_size > 10 * 1024 * 1024:  # 10MB
-                self.error_message = f"File too large to display: {file_size:,} bytes (limit: 10MB)"
-                return
-
-            # Read file content line by line for better performance
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    self.file_lines = f.readlines()
-                # Remove trailing newlines to avoid double spacing
-                self.file_lines = [line.rstrip("\n\r") for line in self.file_lines]
-            except UnicodeDecodeError:
-                # Try reading as binary and display hex or basic info
-                self.error_message = f"File appears to be binary. Size: {file_size:,} bytes"
+            log_file = LogFile(str(file_path))
+            if log_file.is_binary():
+                log_file.close()
+                self.error_message = f"File appears to be binary. Size: {log_file.size:,} bytes"
                 return
+            self.log_file = log_file
 
         except PermissionError:
             self.error_message = f"Permission denied reading file: {self.file_path}"
@@ -122,66 +293,302 @@ class FileViewerScreen(ModalScreen[None]):
             self.error_message = f"Error reading file: {str(e)}"
 
     def display_content(self) -> None:
-        """Display the file content in the RichLog widget."""
-        # Update header
-        header_widget = self.query_one("#file_header", RichLog)
-        header_widget.clear()
-        header_widget.write(
-            f"[bold]File: {self.file_path}[/bold] (Press ESC/Q to close, g/G for top/bottom, j/k/space/b to scroll)"
-        )
-
-        # Update content
-        log_widget = self.query_one("#file_log", RichLog)
-        log_widget.clear()
-
-        if self.error_message:
-            log_widget.write(f"[red]{self.error_message}[/red]")
-            return
+        """Display the file content in the LogView widget."""
+        self.update_header()
+        log_widget = self.query_one("#file_log", LogView)
+        log_widget.set_log_file(self.log_file, self.error_message)
+
+    def update_header(self) -> None:
+        """Show the file name, its size and how many lines it has."""
+        header = f"File: {self.file_path}"
+        if self.log_file is not None:
+            header += f" ({self.log_file.size:,} bytes, "
+            if self.log_file.complete:
+                header += f"{self.log_file.indexed_lines:,} lines)"
+            else:
+                header += f"indexing {self.log_file.indexed_bytes * 100 // self.log_file.size}%)"
+        if self._pending_match is not None:
+            header += " [indexing up to the match]"
+        if self.follow and self.watch_mode:
+            header += f" [following, {self.watch_mode}]"
+        if self.search is not None:
+            header += f" [/{self.search.pattern}: {len(self.search.matches):,} matches"
+            if not self.search.complete:
+                header += f", searching {self.search.scanned * 100 // max(self.log_file.size, 1)}%"
+            header += "]"
+        header += " (Press ESC/Q to close, g/G for top/bottom, j/k/space/b to scroll, f to follow, / n N to search)"
+        self.query_one("#file_header", Static).update(header)
+
+    @work(thread=True, exclusive=True, group="index")
+    def _index_file(self) -> None:
+        """Build the line index a batch of blocks at a time, updating the view in between."""
+        worker = get_current_worker()
+        log_file = self.log_file
+        while not worker.is_cancelled:
+            complete = log_file.index_blocks(self.INDEX_BATCH)
+            self.app.call_from_thread(self._index_updated)
+            if complete:
+                return
 
-        if not self.file_lines:
-            log_widget.write("[dim]Empty file[/dim]")
+    def _index_updated(self) -> None:
+        pending = self._pending_match
+        if pending is not None and (self.log_file.line_number_at(pending) is not None or self.log_file.complete):
+            self._go_to_match(pending)
+        self.update_header()
+        self.query_one("#file_log", LogView).update_size()
+
+    def start_following(self) -> None:
+        """Follow the end of the file as it grows."""
+        if self.log_file is None:
+            return
+        self.follow = True
+        log_widget = self.query_one("#file_log", LogView)
+        log_widget.follow = True
+        log_widget.scroll_end(animate=False)
+        self._follow_file()
+
+    def stop_following(self) -> None:
+        self.follow = False
+        self.watch_mode = ""
+        self.query_one("#file_log", LogView).follow = False
+        self.workers.cancel_group(self, "follow")
+        self.update_header()
+
+    @work(thread=True, exclusive=True, group="follow")
+    def _follow_file(self) -> None:
+        """Wait for the file to change, the new bytes are then picked up on the UI thread.
+
+        When the file is rotated, replaced or deleted, the path is polled until a
+        file is there again, and that one is opened and followed.
+        """
+        worker = get_current_worker()
+        watcher = FileWatcher(self.file_path, poll_interval=self.poll_interval, identity=self.log_file.identity)
+        self.app.call_from_thread(self._set_watch_mode, watcher.mode)
+        try:
+            while not worker.is_cancelled:
+                if watcher.wait(1.0) and not worker.is_cancelled:
+                    if watcher.replaced:
+                        break
+                    self.app.call_from_thread(self._file_changed)
+        finally:
+            watcher.close()
+        if worker.is_cancelled:
             return
 
-        # Add each line with line numbers
-        for i, line_content in enumerate(self.file_lines):
-            line_num = i + 1
-            # RichLog handles Rich markup automatically, no need to escape
-            log_widget.write(f"[dim]{line_num:6}:[/dim] {line_content}")
+        self.app.call_from_thread(self._file_replaced)
+        while not worker.is_cancelled:
+            if os.path.isfile(self.file_path):
+                self.app.call_from_thread(self._reopen_file)
+                return
+            time.sleep(self.poll_interval)
+
+    def _set_watch_mode(self, mode: str) -> None:
+        self.watch_mode = mode
+        self.update_header()
+
+    def _file_replaced(self) -> None:
+        # What was read of the old file stays on screen meanwhile
+        self._file_changed()
+        self._set_watch_mode("waiting for the file to be created again")
+        self.notify(f"{self.file_path} was moved or deleted, waiting for a new file", severity="warning")
+
+    def _reopen_file(self) -> None:
+        """Show and follow the file that is at the path now."""
+        self.workers.cancel_group(self, "index")
+        self.workers.cancel_group(self, "search")
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+        self.error_message = ""
+        self.load_file_content()
+        self.display_content()
+        if self.log_file is None:
+            self.stop_following()
+            return
+        if not self.log_file.complete:
+            self._index_file()
+        if self.search is not None:
+            self.start_search(self.search.pattern)
+        self.notify(f"Following the new {self.file_path}", timeout=3)
+        self.start_following()
+
+    def _file_changed(self) -> None:
+        """Map and index what was appended to the file."""
+        if self.log_file is None or not self.log_file.refresh():
+            return
+        if not self.log_file.index_blocks(self.INDEX_BATCH):
+            # A big append, index the rest in the background
+            self._index_file()
+        if self.search is not None:
+            if self.search.scanned > self.log_file.size:
+                # Truncated, search it again
+                self.start_search(self.search.pattern)
+            else:
+                self._search_file()
+        self._index_updated()
+
+    def start_search(self, pattern: str) -> None:
+        """Search the file in the background, and go to the first match once found.
+
+        :param pattern: Regular expression, an empty one clears the search
+        """
+        log_widget = self.query_one("#file_log", LogView)
+        self.workers.cancel_group(self, "search")
+        self.search = None
+        self._match_offset = None
+        self._pending_match = None
+        log_widget.search = None
+        log_widget.current_line = None
+
+        if pattern and self.log_file is not None:
+            try:
+                self.search = LogSearch(self.log_file, pattern)
+            except re.error as e:
+                self.notify(f"Invalid pattern: {e}", severity="error")
+            else:
+                log_widget.search = self.search
+                self._jump_to_match = True
+                self._search_file()
+
+        self.update_header()
+        log_widget.refresh()
+
+    @work(thread=True, exclusive=True, group="search")
+    def _search_file(self) -> None:
+        """Scan the file a chunk at a time, updating the header in between."""
+        worker = get_current_worker()
+        search = self.search
+        while not worker.is_cancelled:
+            complete = search.scan()
+            self.app.call_from_thread(self._search_updated, search)
+            if complete:
+                return
 
-        # Add status information
-        total_lines = len(self.file_lines)
-        log_widget.write(f"\n[dim]File contains {total_lines} lines[/dim]")
+    def _search_updated(self, search: LogSearch) -> None:
+        if search is not self.search:
+            return
+        if self._jump_to_match and search.matches:
+            self._jump_to_match = False
+            self.action_next_match()
+        elif search.complete and not search.matches:
+            self._jump_to_match = False
+            self.notify(f"Pattern not found: {search.pattern}", severity="warning", timeout=3)
+        self.update_header()
+
+    def _go_to_match(self, offset: int) -> None:
+        """Show the line of a match, a third of the way down the view.
+
+        A match ahead of the line index is shown once the indexer worker gets to it,
+        indexing a multi-GB file up to it here would freeze the UI.
+        """
+        log_file = self.log_file
+        self._match_offset = offset
+        number = log_file.line_number_at(offset)
+        if number is None:
+            if not log_file.complete:
+                self._pending_match = offset
+                self._index_file()
+                self.update_header()
+            return
+        self._pending_match = None
+        log_widget = self.query_one("#file_log", LogView)
+        log_widget.current_line = number
+        if log_file.complete:
+            log_widget.update_size()
+        log_widget.scroll_to(y=max(number - log_widget.scrollable_content_region.height // 3, 0), animate=False)
+        log_widget.refresh()
+
+    def _search_position(self) -> int:
+        """Where n/N search from: the current match, or the top of the view."""
+        if self._match_offset is not None:
+            return self._match_offset
+        log_widget = self.query_one("#file_log", LogView)
+        return self.log_file.line_start(int(log_widget.scroll_y)) or 0
 
     def action_close(self) -> None:
-        """Close the file viewer."""
+        """Close the file viewer, or the search input if it's open."""
+        if self.query_one("#search_input", Input).has_class("visible"):
+            self._hide_search_input()
+            return
         self.dismiss()
 
+    def action_search(self) -> None:
+        """Ask for a search pattern."""
+        search_input = self.query_one("#search_input", Input)
+        search_input.add_class("visible")
+        search_input.value = self.search.pattern if self.search is not None else ""
+        search_input.focus()
+
+    def on_input_submitted(self, event: Input.Submitted) -> None:
+        """Search for the submitted pattern."""
+        self._hide_search_input()
+        self.start_search(event.value)
+
+    def _hide_search_input(self) -> None:
+        self.query_one("#search_input", Input).remove_class("visible")
+        self.query_one("#file_log", LogView).focus()
+
+    def action_next_match(self) -> None:
+        """Go to the next match, wrapping around at the end of the file."""
+        if self.search is None:
+            return
+        position = self._search_position()
+        # The line at the top of the view is a candidate, the current match is not
+        offset = self.search.next_match(position if self._match_offset is not None else position - 1)
+        if offset is None and self.search.matches and self.search.complete:
+            offset = self.search.matches[0]
+            self.notify("Search hit the bottom, continuing at the top", timeout=2)
+        if offset is None:
+            self.notify("No more matches" if self.search.complete else "Still searching...", timeout=2)
+            return
+        self._go_to_match(offset)
+
+    def action_previous_match(self) -> None:
+        """Go to the previous match, wrapping around at the start of the file."""
+        if self.search is None:
+            return
+        offset = self.search.previous_match(self._search_position())
+        if offset is None and self.search.matches and self.search.complete:
+            offset = self.search.matches[-1]
+            self.notify("Search hit the top, continuing at the bottom", timeout=2)
+        if offset is None:
+            self.notify("No previous match", timeout=2)
+            return
+        self._go_to_match(offset)
+
+    def action_toggle_follow(self) -> None:
+        """Turn the follow (``tail -f``) mode on or off."""
+        if self.follow:
+            self.stop_following()
+        else:
+            self.start_following()
+
     def action_go_to_top(self) -> None:
         """Go to the beginning of the file."""
-        log_widget = self.query_one("#file_log", RichLog)
-        log_widget.scroll_home()
+        log_widget = self.query_one("#file_log", LogView)
+        log_widget.scroll_home(animate=False)
 
     def action_go_to_bottom(self) -> None:
-        """Go to the end of the file."""
-        log_widget = self.query_one("#file_log", RichLog)
-        log_widget.scroll_end()
+        """Go to the end of the file, it doesn't wait for the index."""
+        log_widget = self.query_one("#file_log", LogView)
+        log_widget.scroll_end(animate=False)
 
     def action_scroll_down(self) -> None:
         """Scroll down one line."""
-        log_widget = self.query_one("#file_log", RichLog)
-        log_widget.scroll_down()
+        log_widget = self.query_one("#file_log", LogView)
+        log_widget.scroll_down(animate=False)
 
     def action_scroll_up(self) -> None:
         """Scroll up one line."""
-        log_widget = self.query_one("#file_log", RichLog)
-        log_widget.scroll_up()
+        log_widget = self.query_one("#file_log", LogView)
+        log_widget.scroll_up(animate=False)
 
     def action_page_down(self) -> None:
         """Scroll down one page."""
-        log_widget = self.query_one("#file_log", RichLog)
-        log_widget.scroll_page_down()
+        log_widget = self.query_one("#file_log", LogView)
+        log_widget.scroll_page_down(animate=False)
 
     def action_page_up(self) -> None:
         """Scroll up one page."""
-        log_widget = self.query_one("#file_log", RichLog)
-        log_widget.scroll_page_up()
+        log_widget = self.query_one("#file_log", LogView)
+        log_widget.scroll_page_up(animate=False)
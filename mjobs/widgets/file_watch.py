@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import ctypes
+import ctypes.util
+import os
+import select
+import time
+from typing import Optional, Tuple
+
+# inotify only sees the writes made by this host, on these the job writes from a compute node
+NETWORK_FILESYSTEMS = frozenset(
+    {
+        "9p",
+        "afs",
+        "beegfs",
+        "ceph",
+        "cifs",
+        "fuse.sshfs",
+        "gpfs",
+        "lustre",
+        "nfs",
+        "nfs4",
+        "panfs",
+        "smb3",
+        "smbfs",
+        "wekafs",
+    }
+)
+
+
+def filesystem_type(path: str, mounts: str = "/proc/self/mounts") -> Optional[str]:
+    """Type of the filesystem a path is on, from the longest matching mount point.
+
+    :param path: The path
+    :param mounts: The mount table to read
+    :return: The filesystem type, or None if it can't be found
+    """
+    path = os.path.realpath(path)
+    best, best_type = "", None
+    try:
+        with open(mounts) as mount_table:
+            for line in mount_table:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # Spaces and the like are octal escaped in the mount table
+                mount_point = fields[1].encode().decode("unicode_escape")
+                prefix = mount_point.rstrip("/") + "/"
+                if (path == mount_point or path.startswith(prefix)) and len(mount_point) > len(best):
+                    best, best_type = mount_point, fields[2]
+    except OSError:
+        return None
+    return best_type
+
+
+def file_identity(path: str) -> Optional[Tuple[int, int]]:
+    """Device and inode of the file a path names, to tell when it's replaced.
+
+    :param path: The path
+    :return: (device, inode), or None if there is no file
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+class Inotify:
+    """Minimal inotify watch of a single file, through libc.
+
+    :raises OSError: If inotify is not available
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, path: str):
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            inotify_init1, inotify_add_watch = libc.inotify_init1, libc.inotify_add_watch
+        except (OSError, AttributeError) as e:
+            raise OSError(f"inotify is not available: {e}")
+
+        self.fd = inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_MODIFY | self.IN_ATTRIB | self.IN_CLOSE_WRITE | self.IN_DELETE_SELF | self.IN_MOVE_SELF
+        if inotify_add_watch(self.fd, os.fsencode(path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {path}")
+
+    def wait(self, timeout: float) -> bool:
+        """Wait for the file to change.
+
+        :param timeout: Seconds to wait at most
+        :return: True if it changed
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            # Drain the events, we only care that there were some
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FileWatcher:
+    """Wait for a file to change, with inotify where it works and polling elsewhere.
+
+    inotify doesn't see the writes made by other hosts on network filesystems
+    such as NFS or Lustre, where the job output usually is, the file is polled
+    there instead.
+
+    A file that is rotated, replaced or deleted is no longer watched: ``replaced``
+    is set, the new file at the path has to be opened and watched again.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 1.0, identity: Optional[Tuple[int, int]] = None):
+        """Start watching.
+
+        :param path: The file to watch
+        :param poll_interval: Seconds between two checks when polling
+        :param identity: :func:`file_identity` of the file that was opened (default: the one at the path now)
+        """
+        self.path = path
+        self.poll_interval = poll_interval
+        self.identity = identity if identity is not None else file_identity(path)
+        self.replaced = False
+        self._inotify: Optional[Inotify] = None
+        if filesystem_type(path) not in NETWORK_FILESYSTEMS:
+            try:
+                self._inotify = Inotify(path)
+            except OSError:
+                pass
+
+    @property
+    def mode(self) -> str:
+        """How the file is watched, "inotify" or "polling"."""
+        return "inotify" if self._inotify is not None else "polling"
+
+    def wait(self, timeout: float) -> bool:
+        """Wait until the file may have changed, or for ``timeout`` seconds.
+
+        :param timeout: Seconds to wait at most
+        :return: True if the file may have changed and should be checked, see ``replaced`` too
+        """
+        if self._inotify is not None:
+            if not self._inotify.wait(timeout):
+                return False
+        else:
+            time.sleep(min(timeout, self.poll_interval))
+        # The watch stays on the old file, its inode, once the path names another one
+        self.replaced = file_identity(self.path) != self.identity
+        return True
+
+    def close(self) -> None:
+        """Stop watching."""
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
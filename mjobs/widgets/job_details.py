@@ -14,11 +14,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from typing import Any, Dict, Optional
+
 from textual.app import ComposeResult
 from textual.containers import Horizontal
 from textual.widgets import Static
 
-from mjobs.models import SlurmJob
+from mjobs.models import JobRecord
 from mjobs.widgets.clickable_path import create_file_path_display
 
 
@@ -35,25 +37,17 @@ class JobDetailsPanel(Horizontal):
         yield Static(id="middle_panel")
         yield Static(id="right_panel")
 
-    def update_job_details(self, job: SlurmJob, slurm_instance=None):
+    def update_job_details(self, job: JobRecord, details: Optional[Dict[str, Any]] = None):
         """Update the panel with job details.
 
-        :param job: SlurmJob namedtuple to display details for
-        :param slurm_instance: Optional Slurm instance to get detailed job information
+        The details are fetched by the caller, without blocking the UI; until they
+        come, or if scontrol has none, the fields of the listing are shown.
+
+        :param job: JobRecord to display details for
+        :param details: The scontrol details of the job (optional)
         """
         self.current_job = job
-
-        # Get enhanced details if available
-        if slurm_instance and hasattr(slurm_instance, "get_job_details"):
-            # Get detailed information from scontrol
-            detailed_info = slurm_instance.get_job_details(job.job_id)
-            if detailed_info:
-                details = detailed_info
-            else:
-                # Fallback to basic info if scontrol fails
-                details = self._basic_job_details(job)
-        else:
-            # Fallback to basic job details
+        if not details:
             details = self._basic_job_details(job)
 
         # Format details for three-column display
@@ -68,10 +62,10 @@ class JobDetailsPanel(Horizontal):
         middle_panel.update(middle_content)
         right_panel.update(right_content)
 
-    def _basic_job_details(self, job: SlurmJob) -> dict:
+    def _basic_job_details(self, job: JobRecord) -> dict:
         """Basic job details when not using test data.
 
-        :param job: SlurmJob namedtuple
+        :param job: JobRecord
         :return: Dictionary with basic job information
         """
         return {
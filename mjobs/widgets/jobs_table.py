@@ -14,35 +14,89 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import List, Optional
+from operator import attrgetter
+from typing import Dict, List, Optional, Tuple
 
 from rich.text import Text
 from textual.message import Message
 from textual.widgets import DataTable
+from textual.widgets.data_table import RowDoesNotExist
 
-from mjobs.models import SlurmJob
+from mjobs.models import JobColumns, JobQuery, JobRecord
+
+# Column key (a JobRecord field) and its header
+TABLE_COLUMNS = [
+    ("job_id", "JobId"),
+    ("job_state", "Status"),
+    ("job_name", "JobName"),
+    ("user_name", "User"),
+    ("partition", "Partition"),
+    ("submit_time", "Submit Time"),
+    ("start_time", "Start Time"),
+    ("end_time", "Time Rem."),
+    ("state_reason", "State Reason"),
+]
+
+# Shown after the job id when several clusters are listed
+CLUSTER_COLUMN = ("cluster", "Cluster")
+# Shown after the job id (and cluster) when job arrays are collapsed, see ArrayJobRecord
+TASKS_COLUMN = ("task_count", "Tasks")
+
+# Fields the dashboard search looks in
+SEARCH_FIELDS = ("job_name", "job_state", "user_name", "command")
 
 
 class JobsTable(DataTable):
-    """Interactive jobs table widget."""
+    """Interactive jobs table widget.
+
+    Rows are keyed on the job id and updated in place: a refresh or a new filter
+    only touches the rows that were added, removed or changed, so the cursor and
+    scroll position survive and the cost scales with the number of changes.
+    With ``show_cluster`` the jobs of several clusters are listed, the rows are
+    keyed on the cluster and the job id, which can be the same on two clusters.
+    """
 
     class RowSelected(Message):
         """Message sent when a row is selected."""
 
-        def __init__(self, job: SlurmJob):
+        def __init__(self, job: JobRecord):
             super().__init__()
             self.job = job
 
+    class Scrolled(Message):
+        """Message sent when the first row on screen changes."""
+
+    # Columns holding the values the row key is made of
+    ROW_KEY_COLUMNS = ("job_id",)
+    # Rows removed one by one at most, the table is rebuilt when more go
+    REMOVE_ROWS_MAX = 50
+
     BINDINGS = [
         ("enter", "select_row", "Show Details"),
         ("j", "cursor_down", "Down"),
         ("k", "cursor_up", "Up"),
     ]
 
-    def __init__(self, jobs: List[SlurmJob] = None, **kwargs):
+    def __init__(self, jobs: List[JobRecord] = None, show_cluster: bool = False, show_tasks: bool = False, **kwargs):
         super().__init__(**kwargs)
+        self.show_cluster = show_cluster
+        extra_columns = [CLUSTER_COLUMN] if show_cluster else []
+        if show_tasks:
+            extra_columns.append(TASKS_COLUMN)
+        self.table_columns = [TABLE_COLUMNS[0], *extra_columns, *TABLE_COLUMNS[1:]]
+        if show_cluster:
+            self.ROW_KEY_COLUMNS = ("cluster", "job_id")
+        self._cell_values = attrgetter(*(field for field, _ in self.table_columns))
         self.jobs = jobs or []
         self.filtered_jobs = self.jobs.copy()
+        self.snapshot = JobColumns.from_records(self.jobs)
+        self.search_text = ""
+        self._query: Optional[JobQuery] = None
+        # Snapshot rows shown for the current search, None for all of them
+        self._matches: Optional[List[int]] = None
+        # Displayed cell values and job of each row, by row key
+        self._row_values: Dict[str, Tuple[str, ...]] = {}
+        self._row_jobs: Dict[str, JobRecord] = {}
         self.cursor_type = "row"
         self.zebra_stripes = True
         self.show_header = True
@@ -62,89 +116,187 @@ class JobsTable(DataTable):
         }
         return Text(job_state, style=colours.get(job_state, "grey93"))
 
-    def populate_table(self, jobs: List[SlurmJob]):
-        """Populate the table with job data.
+    def row_key(self, job: JobRecord) -> str:
+        """Key that identifies the row of a job across refreshes."""
+        if self.show_cluster:
+            return f"{job.cluster}/{job.job_id}"
+        return job.job_id
+
+    def _key_from_cells(self, values) -> str:
+        """Row key from the values of the ``ROW_KEY_COLUMNS`` cells."""
+        if self.show_cluster:
+            return "/".join(values)
+        return values
+
+    def populate_table(self, jobs: List[JobRecord]) -> int:
+        """Populate the table with job data, keeping the current search.
 
-        :param jobs: List of SlurmJob namedtuples to display
+        :param jobs: List of JobRecord instances to display
+        :return: Number of rows added, removed or changed
         """
         self.jobs = jobs
-        self.filtered_jobs = jobs.copy()
-        self.clear()
+        self.snapshot = JobColumns.from_records(jobs)
 
         # Add columns only if they don't exist
         if not self.columns:
-            self.add_columns(
-                "JobId",
-                "Status",
-                "JobName",
-                "User",
-                "Partition",
-                "Submit Time",
-                "Start Time",
-                "Time Rem.",
-                "State Reason",
-            )
-
-        # Add rows
-        for job in self.filtered_jobs:
-            self.add_row(
-                job.job_id,
-                self.status_style(job.job_state),
-                job.job_name,
-                job.user_name,
-                job.partition,
-                job.submit_time,
-                job.start_time,
-                job.end_time,
-                job.state_reason,
-                key=job.job_id,
-            )
-
-    def filter_jobs(self, search_text: str):
+            for key, header in self.table_columns:
+                self.add_column(header, key=key)
+
+        return self._apply_search(force=True)
+
+    @property
+    def query(self) -> Optional[JobQuery]:
+        """The compiled search, None if there is none."""
+        return self._query
+
+    def filter_jobs(self, search_text: str) -> int:
         """Filter jobs based on search text.
 
-        :param search_text: Text to filter jobs by (searches job name, state, user, command)
+        :param search_text: Words to look for in the job name, state, user and command, and
+            ``field:value`` terms such as ``state:RUNNING mem>32G`` (see :class:`JobQuery`)
+        :return: Number of rows added, removed or changed
+        :raises QueryError: If the search is not a valid query, the current filter is kept
+        """
+        query = JobQuery.parse(search_text, SEARCH_FIELDS, regex_words=False)
+        self.search_text = search_text
+        self._query = query if query else None
+        return self._apply_search()
+
+    def _apply_search(self, force: bool = False) -> int:
+        """Show the jobs that match the current search text.
+
+        :param force: Sync the rows even if the same jobs match, for a new snapshot
+        :return: Number of rows added, removed or changed
         """
-        if not search_text:
+        matches = self._query.select(self.snapshot) if self._query is not None else None
+        if matches is not None and len(matches) == len(self.jobs):
+            matches = None
+        if not force and matches == self._matches:
+            # Typing often doesn't change the result, don't walk all the rows for nothing
+            return 0
+        self._matches = matches
+        if matches is None:
             self.filtered_jobs = self.jobs.copy()
         else:
-            self.filtered_jobs = [
-                job
-                for job in self.jobs
-                if (
-                    search_text.lower() in job.job_name.lower()
-                    or search_text.lower() in job.job_state.lower()
-                    or search_text.lower() in job.user_name.lower()
-                    or search_text.lower() in job.command.lower()
-                )
-            ]
-
-        # Clear rows but keep columns
-        self.clear(columns=False)
-
-        # Add rows
-        for job in self.filtered_jobs:
-            self.add_row(
-                job.job_id,
-                self.status_style(job.job_state),
-                job.job_name,
-                job.user_name,
-                job.partition,
-                job.submit_time,
-                job.start_time,
-                job.end_time,
-                job.state_reason,
-                key=job.job_id,
-            )
-
-    def get_selected_job(self) -> Optional[SlurmJob]:
+            self.filtered_jobs = [self.jobs[index] for index in matches]
+
+        return self._sync_rows(self.filtered_jobs)
+
+    def _sync_rows(self, jobs: List[JobRecord]) -> int:
+        """Update the rows to show ``jobs``, in that order, touching only what changed.
+
+        :param jobs: Jobs to display
+        :return: Number of rows added, removed or changed
+        """
+        selected_key = self._cursor_row_key()
+
+        target: Dict[str, Tuple[JobRecord, Tuple[str, ...]]] = {}
+        for job in jobs:
+            target[self.row_key(job)] = (job, self._cell_values(job))
+
+        removed = [key for key in self._row_values if key not in target]
+        changes = len(removed)
+        if len(removed) > self.REMOVE_ROWS_MAX:
+            changes += sum(1 for key, (_, values) in target.items() if self._row_values.get(key) != values)
+            self._rebuild_rows(target)
+            self._restore_cursor(selected_key, target)
+            return changes
+
+        for key in removed:
+            self.remove_row(key)
+            del self._row_values[key]
+            del self._row_jobs[key]
+        # The rows on screen: the ones we kept, in their order, then the new ones
+        displayed = list(self._row_values)
+
+        for key, (job, values) in target.items():
+            current = self._row_values.get(key)
+            if current is None:
+                self.add_row(*self._cells(values), key=key)
+                displayed.append(key)
+                changes += 1
+            elif current != values:
+                for (column_key, _), old, new in zip(self.table_columns, current, values):
+                    if old != new:
+                        self.update_cell(key, column_key, self._cell(column_key, new))
+                changes += 1
+            self._row_values[key] = values
+            self._row_jobs[key] = job
+
+        # New rows are appended at the bottom, sort them into place if needed
+        if changes and displayed != list(target):
+            position = {key: index for index, key in enumerate(target)}
+            self.sort(*self.ROW_KEY_COLUMNS, key=lambda values: position[self._key_from_cells(values)])
+        self._row_values = {key: self._row_values[key] for key in target}
+        self._restore_cursor(selected_key, target)
+        return changes
+
+    def _rebuild_rows(self, target: Dict[str, Tuple[JobRecord, Tuple[str, ...]]]) -> None:
+        """Replace all the rows, in order.
+
+        ``remove_row`` re-indexes every remaining row on each call, when many rows
+        go it's cheaper to clear the table and add the rows again.
+
+        :param target: The job and cell values of each row, by row key
+        """
+        self.clear()
+        self._row_values = {}
+        self._row_jobs = {}
+        for key, (job, values) in target.items():
+            self.add_row(*self._cells(values), key=key)
+            self._row_values[key] = values
+            self._row_jobs[key] = job
+
+    def _restore_cursor(self, selected_key: Optional[str], target: Dict[str, Tuple[JobRecord, Tuple[str, ...]]]):
+        """Put the cursor back on the row it was on, if the row is still there."""
+        if selected_key is not None and selected_key in target:
+            row_index = self.get_row_index(selected_key)
+            if row_index != self.cursor_row:
+                self.move_cursor(row=row_index, scroll=False)
+
+    def _cell(self, column_key: str, value: str):
+        """Render a cell value."""
+        if column_key == "job_state":
+            return self.status_style(value)
+        return value
+
+    def _cells(self, values: Tuple[str, ...]) -> list:
+        """Render the cells of a row."""
+        return [self._cell(column_key, value) for (column_key, _), value in zip(self.table_columns, values)]
+
+    def _cursor_row_key(self) -> Optional[str]:
+        """Key of the row under the cursor, if any."""
+        if not self.row_count:
+            return None
+        try:
+            return self.coordinate_to_cell_key(self.cursor_coordinate).row_key.value
+        except RowDoesNotExist:
+            return None
+
+    def page_jobs(self) -> List[JobRecord]:
+        """Get the jobs of the rows currently on screen.
+
+        :return: The visible JobRecord instances, top to bottom
+        """
+        header_height = self.header_height if self.show_header else 0
+        height = max(self.scrollable_content_region.height - header_height, 0)
+        first = int(self.scroll_y)
+        return [self._row_jobs[row.key.value] for row in self.ordered_rows[first : first + height]]
+
+    def watch_scroll_y(self, old_value: float, new_value: float) -> None:
+        super().watch_scroll_y(old_value, new_value)
+        if int(old_value) != int(new_value):
+            self.post_message(self.Scrolled())
+
+    def get_selected_job(self) -> Optional[JobRecord]:
         """Get the currently selected job.
 
-        :return: Selected SlurmJob namedtuple or None if no selection
+        :return: Selected JobRecord or None if no selection
         """
-        if self.cursor_row >= 0 and self.cursor_row < len(self.filtered_jobs):
-            return self.filtered_jobs[self.cursor_row]
-        return None
+        row_key = self._cursor_row_key()
+        if row_key is None:
+            return None
+        return self._row_jobs.get(row_key)
 
     def action_select_row(self):
         """Handle row selection."""
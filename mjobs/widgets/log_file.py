@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2024 - Martin Beracochea
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import mmap
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Tuple
+
+# Characters that would garble the terminal, tabs are expanded separately
+_CONTROL_CHARACTERS = {code: None for code in (*range(0, 9), *range(10, 32), 127)}
+
+
+class LogFile:
+    """Random access to the lines of a (possibly huge) text file.
+
+    The file is memory mapped and never read as a whole. The line index is
+    sparse and built lazily: for every block of ``block_size`` bytes it keeps the
+    number of newlines before the block, so indexing only counts bytes and a
+    line is found by scanning a single block. The index can be completed in the
+    background with :meth:`index_blocks` while the lines already indexed, and the
+    last lines of the file, are available right away.
+
+    A file that grows is picked up with :meth:`refresh`, only the new bytes
+    are indexed.
+    """
+
+    BLOCK_SIZE = 1 << 16
+    # Longest part of a line that is returned, the rest is not displayed
+    MAX_LINE_BYTES = 1 << 14
+
+    def __init__(self, path: str, block_size: Optional[int] = None):
+        """Open and map the file.
+
+        :param path: Path of the file
+        :param block_size: Bytes per index block (default: ``BLOCK_SIZE``)
+        :raises OSError: If the file can't be opened or mapped
+        """
+        self.path = path
+        self.block_size = block_size or self.BLOCK_SIZE
+        self._file = open(path, "rb")
+        self.size = 0
+        self._mm: Optional[mmap.mmap] = None
+        # Newlines before the start of each indexed block, plus the total so far
+        self._block_lines = array("Q", [0])
+        # Held while the index or the mapping change, indexing runs in a worker thread
+        self._lock = threading.Lock()
+        stat = os.fstat(self._file.fileno())
+        # Device and inode of the opened file, the path can be given to another one (log rotation)
+        self.identity = (stat.st_dev, stat.st_ino)
+        self._map(stat.st_size)
+
+    def _map(self, size: int) -> None:
+        """Map the file, an empty file can't be mapped and has no lines."""
+        if self._mm is not None:
+            self._mm.close()
+        self.size = size
+        self._mm = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ) if size else None
+
+    def refresh(self) -> bool:
+        """Pick up the bytes appended to the file since it was mapped.
+
+        The index is kept, except for its last block if that one was partial.
+        A file that shrank was truncated or rewritten and is indexed again.
+
+        :return: True if the size of the file changed
+        """
+        with self._lock:
+            if self._file.closed:
+                return False
+            size = os.fstat(self._file.fileno()).st_size
+            if size == self.size:
+                return False
+            if size < self.size:
+                self._block_lines = array("Q", [0])
+            elif (len(self._block_lines) - 1) * self.block_size > self.size:
+                # The last block was counted up to the old end of the file
+                self._block_lines.pop()
+            self._map(size)
+            return True
+
+    def close(self) -> None:
+        """Unmap and close the file."""
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+                self._mm = None
+            self._file.close()
+
+    @property
+    def indexed_bytes(self) -> int:
+        """Bytes covered by the line index."""
+        return min((len(self._block_lines) - 1) * self.block_size, self.size)
+
+    @property
+    def complete(self) -> bool:
+        """True once the whole file is indexed."""
+        return self.indexed_bytes >= self.size
+
+    @property
+    def indexed_lines(self) -> int:
+        """Number of lines that can be reached by number."""
+        newlines = self._block_lines[-1]
+        if self.complete and self.size and self._mm[self.size - 1 : self.size] != b"\n":
+            # The last line has no newline
+            return newlines + 1
+        return newlines
+
+    def estimated_line_count(self) -> int:
+        """Number of lines, extrapolated from the indexed part until the index is complete."""
+        if self.complete:
+            return self.indexed_lines
+        indexed_bytes = self.indexed_bytes
+        if not indexed_bytes:
+            return self.size // 80 + 1
+        return max(self.indexed_lines * self.size // indexed_bytes, self.indexed_lines + 1)
+
+    def is_binary(self) -> bool:
+        """Guess if the file is binary, from a NUL byte in its first 8 KiB."""
+        return self._mm is not None and self._mm.find(b"\x00", 0, 8192) != -1
+
+    def index_blocks(self, count: Optional[int] = None) -> bool:
+        """Extend the line index.
+
+        :param count: Number of blocks to index (default: the rest of the file)
+        :return: True if the whole file is indexed
+        """
+        with self._lock:
+            if self._file.closed:
+                return True
+            mm, size, block_size, block_lines = self._mm, self.size, self.block_size, self._block_lines
+            position = self.indexed_bytes
+            newlines = block_lines[-1]
+            while position < size and count != 0:
+                newlines += mm[position : position + block_size].count(b"\n")
+                block_lines.append(newlines)
+                position += block_size
+                if count is not None:
+                    count -= 1
+            return self.complete
+
+    def line_start(self, number: int) -> Optional[int]:
+        """Offset of the first byte of a line.
+
+        :param number: Line number, starting at 0
+        :return: The offset, or None if the line is not indexed (yet)
+        """
+        if number == 0:
+            return 0 if self.size else None
+        if number >= self.indexed_lines:
+            return None
+        # The line starts after the number-th newline, find the block that has it
+        block = bisect_left(self._block_lines, number) - 1
+        position = block * self.block_size - 1
+        for _ in range(number - self._block_lines[block]):
+            position = self._mm.find(b"\n", position + 1)
+        return position + 1
+
+    def line_number_at(self, offset: int) -> Optional[int]:
+        """Number of the line that contains ``offset``.
+
+        :param offset: Offset in the file
+        :return: The line number, or None if that part of the file is not indexed (yet)
+        """
+        if offset >= self.indexed_bytes:
+            return None
+        block = offset // self.block_size
+        return self._block_lines[block] + self._mm[block * self.block_size : offset].count(b"\n")
+
+    def line_start_at(self, offset: int) -> int:
+        """Offset of the first line that starts at, or after, ``offset``."""
+        if offset <= 0 or self._mm is None:
+            return 0
+        newline = self._mm.find(b"\n", offset - 1)
+        return newline + 1 if newline != -1 else self.size
+
+    def tail_starts(self, count: int, end: Optional[int] = None) -> List[int]:
+        """Offsets of the last lines before ``end``, found from the end without any index.
+
+        :param count: Number of lines
+        :param end: Where the lines end (default: the end of the file)
+        :return: Line starts, in file order
+        """
+        end = self.size if end is None else end
+        if self._mm is None or end <= 0:
+            return []
+        position = end - 1 if self._mm[end - 1 : end] == b"\n" else end
+        starts = []
+        while len(starts) < count and position >= 0:
+            newline = self._mm.rfind(b"\n", 0, position)
+            starts.append(newline + 1)
+            position = newline
+        starts.reverse()
+        return starts
+
+    def read_line(self, start: int) -> Tuple[str, int]:
+        """Read the line that starts at ``start``.
+
+        :param start: Offset of the line
+        :return: The displayable text of the line and the offset of the next one
+        """
+        end = self._mm.find(b"\n", start)
+        if end == -1:
+            end = self.size
+        data = self._mm[start : min(end, start + self.MAX_LINE_BYTES)]
+        text = data.decode("utf-8", errors="replace").rstrip("\r").expandtabs(8).translate(_CONTROL_CHARACTERS)
+        return text, end + 1
+
+
+# Characters that make a search pattern more than a literal string
+_REGEX_METACHARACTERS = frozenset(".^$*+?{}[]\\|()")
+
+
+class LogSearch:
+    """Regex search in a LogFile, it builds an index of the offsets of the matching lines.
+
+    The file is scanned a chunk at a time with :meth:`scan`, so a worker thread
+    can report progress, and the matches found so far can be navigated with
+    :meth:`next_match` and :meth:`previous_match` without scanning again.
+
+    Patterns that are literal strings, or alternations of literals such as
+    ``ERROR|Traceback``, are searched with ``bytes.find``, several times faster
+    than the regex engine on alternations. The search ignores case when the
+    pattern is all lowercase (smart case).
+    """
+
+    CHUNK_SIZE = 1 << 24
+
+    def __init__(self, log_file: LogFile, pattern: str, ignore_case: Optional[bool] = None):
+        """Prepare the search.
+
+        :param log_file: The file to search
+        :param pattern: Regular expression, matched line by line
+        :param ignore_case: Ignore case (default: if the pattern has lowercase letters but no uppercase one)
+        :raises re.error: If the pattern is not a valid regular expression
+        """
+        self.log_file = log_file
+        self.pattern = pattern
+        if ignore_case is None:
+            ignore_case = pattern == pattern.lower() != pattern.upper()
+        self.ignore_case = ignore_case
+        flags = re.MULTILINE | (re.IGNORECASE if self.ignore_case else 0)
+        self.regex = re.compile(pattern.encode("utf-8"), flags)
+        # To highlight the matches in the displayed text
+        self.text_regex = re.compile(pattern, flags)
+
+        self._literals: Optional[List[bytes]] = None
+        alternatives = pattern.split("|")
+        if pattern.isascii() and all(
+            alternative and _REGEX_METACHARACTERS.isdisjoint(alternative) for alternative in alternatives
+        ):
+            self._literals = [
+                (alternative.lower() if self.ignore_case else alternative).encode() for alternative in alternatives
+            ]
+
+        # Start offsets of the matching lines, in file order
+        self.matches = array("Q")
+        self.scanned = 0
+
+    @property
+    def complete(self) -> bool:
+        """True once the whole file was searched."""
+        return self.scanned >= self.log_file.size
+
+    def scan(self, chunk_size: Optional[int] = None) -> bool:
+        """Search the next chunk of the file.
+
+        :param chunk_size: Bytes to search, rounded up to the end of a line (default: ``CHUNK_SIZE``)
+        :return: True if the whole file was searched
+        """
+        log_file = self.log_file
+        with log_file._lock:
+            mm, size = log_file._mm, log_file.size
+            start = self.scanned
+            if mm is None or start >= size:
+                self.scanned = max(start, size)
+                return True
+            end = start + (chunk_size or self.CHUNK_SIZE)
+            newline = mm.find(b"\n", end) if end < size else -1
+            end = newline + 1 if newline != -1 else size
+
+            if self._literals is not None:
+                lines = self._find_literals(mm, start, end)
+            else:
+                lines = self._find_regex(mm, start, end)
+            self.matches.extend(lines)
+            self.scanned = end
+        return self.complete
+
+    def _find_regex(self, mm: mmap.mmap, start: int, end: int) -> List[int]:
+        lines = []
+        search = self.regex.search
+        match = search(mm, start, end)
+        while match is not None:
+            lines.append(mm.rfind(b"\n", 0, match.start()) + 1)
+            # One match per line is enough
+            newline = mm.find(b"\n", match.end(), end)
+            if newline == -1:
+                break
+            match = search(mm, newline + 1, end)
+        return lines
+
+    def _find_literals(self, mm: mmap.mmap, start: int, end: int) -> List[int]:
+        if self.ignore_case:
+            # bytes.lower() is ASCII only, like the IGNORECASE of a bytes regex
+            data, base = mm[start:end].lower(), start
+        else:
+            data, base = mm, 0
+        lines = set()
+        for literal in self._literals:
+            position = data.find(literal, start - base, end - base)
+            while position != -1:
+                lines.add(data.rfind(b"\n", 0, position) + 1 + base)
+                newline = data.find(b"\n", position, end - base)
+                if newline == -1:
+                    break
+                position = data.find(literal, newline + 1, end - base)
+        return sorted(lines)
+
+    def next_match(self, offset: int) -> Optional[int]:
+        """Start of the first matching line after ``offset``, None if there is none (yet)."""
+        index = bisect_right(self.matches, offset)
+        return self.matches[index] if index < len(self.matches) else None
+
+    def previous_match(self, offset: int) -> Optional[int]:
+        """Start of the last matching line before ``offset``, None if there is none."""
+        index = bisect_left(self.matches, offset)
+        return self.matches[index - 1] if index else None
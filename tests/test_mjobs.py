@@ -1,12 +1,60 @@
+import asyncio
+import csv
 import io
+import json
+import os
+import re
+import stat
+import subprocess
+import sys
+import threading
+import time
+from subprocess import CalledProcessError
+from types import SimpleNamespace
 from unittest.mock import patch
 
+import pytest
 from click.testing import CliRunner
 from rich.console import Console
+from textual.app import App
 
-from mjobs.cli import lsf as lsf_cli, slurm as slurm_cli
+from mjobs.cli import lsf as lsf_cli
+from mjobs.cli import slurm as slurm_cli
+from mjobs.core.cancel import BulkCanceller, CancelReport
+from mjobs.core.export import JobExporter
+from mjobs.dashboard import Dashboard, RefreshPolicy
+from mjobs.data import (
+    AsyncSlurmRepository,
+    CachingJobRepository,
+    LsfRepository,
+    SlurmRepository,
+    ThreadedJobRepository,
+)
+from mjobs.data.async_repo import run_command
+from mjobs.data.details_cache import JobDetailsCache
+from mjobs.data.lsf_repo import iter_bjobs_records
+from mjobs.data.repository import JobRepositoryError
+from mjobs.data.slurm_repo import plan_squeue_filters
 from mjobs.data.test_repo import TestJobRepository
+from mjobs.lsf import LSF
+from mjobs.models import (
+    SQUEUE_FIELDS,
+    ArrayJobRecord,
+    JobColumns,
+    JobQuery,
+    JobRecord,
+    QueryError,
+    SlurmJob,
+    collapse_arrays,
+)
+from mjobs.models.arrays import first_task_id, parse_array_id
+from mjobs.models.query import parse_duration, parse_size
 from mjobs.slurm import Slurm
+from mjobs.widgets.file_viewer import FileViewerScreen, LogView
+from mjobs.widgets.file_watch import filesystem_type
+from mjobs.widgets.job_details import JobDetailsPanel
+from mjobs.widgets.jobs_table import JobsTable
+from mjobs.widgets.log_file import LogFile, LogSearch
 
 
 def make_console():
@@ -107,10 +155,66 @@ def test_slurm_kill_skips_prompt_with_filter():
     )
 
     with patch("builtins.input") as mock_input:
-        with patch.object(slurm, "kill_job"):
+        with patch.object(slurm, "kill_jobs", return_value=CancelReport([], {}, 0)) as kill_jobs:
             slurm.run(**run_kwargs)
 
     mock_input.assert_not_called()
+    assert kill_jobs.call_args[0][0]
+
+
+def test_bulk_canceller_packs_job_ids_and_checks_the_outcome(tmp_path, monkeypatch):
+    calls = tmp_path / "calls"
+    script = tmp_path / "scancel"
+    # Fails as a whole, like scancel, when one of the jobs is unknown
+    script.write_text(
+        f'#!/bin/sh\necho "$@" >> {calls}\ncase " $* " in *" 13 "*) echo "Invalid job id 13"; exit 1;; esac\n'
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+
+    job_ids = [str(job_id) for job_id in range(1, 21)]
+    canceller = BulkCanceller(budget=200)
+    lines = canceller.command_lines(["scancel"], job_ids)
+    assert [job_id for line in lines for job_id in line[1:]] == job_ids
+    assert all(line[0] == "scancel" and sum(len(arg) + 9 for arg in line) <= 200 for line in lines)
+    assert len(BulkCanceller().command_lines(["scancel"], [f"1200_{i}" for i in range(20000)])) == 1
+
+    results = BulkCanceller(max_workers=2, budget=200).cancel(["scancel"], job_ids)
+    assert len(calls.read_text().splitlines()) == len(lines) > 1
+    outcomes = {job_id: error for chunk, error in results for job_id in chunk}
+    assert outcomes["13"] == "Invalid job id 13" and outcomes["20"] is None
+
+    # The listing made afterwards tells which jobs of the failed call were cancelled
+    report = CancelReport.from_outcomes(outcomes, {"13": "RUNNING"}, len(results))
+    assert report.failed == {"13": "still RUNNING (Invalid job id 13)"}
+    # A command that succeeded was accepted, its jobs can take a while to be over
+    assert "20" not in CancelReport.from_outcomes(outcomes, {"13": "RUNNING", "20": "RUNNING"}).failed
+    assert len(report.cancelled) == 19
+    assert "13" in CancelReport.from_outcomes(outcomes).failed
+
+
+def test_lsf_bkill_only_passes_the_listed_jobs(tmp_path, monkeypatch):
+    calls = tmp_path / "calls"
+    script = tmp_path / "bkill"
+    script.write_text(f'#!/bin/sh\necho "$@" >> {calls}\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+
+    lsf = LSF(make_console(), make_console())
+    lsf.args = SimpleNamespace(job_id=(), filter=None)
+    jobs = [{"JOBID": job_id} for job_id in range(1, 2001)]
+    # Filtered by user only, bkill -u alice 0 would also kill the jobs submitted since
+    # bkill returns before the jobs are over, they can still be listed as running
+    still_running = [{"JOBID": 1, "STAT": "RUN"}, {"JOBID": 2, "STAT": "PEND"}]
+    with patch("mjobs.core.cancel.argument_budget", return_value=2000), patch.object(
+        lsf, "get_jobs", return_value=still_running
+    ):
+        report = lsf.bkill_jobs(jobs, ["-u", "alice"])
+    lines = calls.read_text().splitlines()
+    assert len(lines) == report.commands > 1
+    # run by several threads, in any order
+    assert sorted(int(arg) for line in lines for arg in line.split()) == [job["JOBID"] for job in jobs]
+    assert len(report.cancelled) == 2000 and not report.failed
 
 
 def test_slurm_cli_help():
@@ -137,3 +241,1399 @@ def test_lsf_bkill_flag_accepted():
     runner = CliRunner()
     result = runner.invoke(lsf_cli, ["--help"])
     assert "bkill" in result.output
+
+
+SQUEUE_JSON = json.dumps(
+    {
+        "errors": [],
+        "jobs": [
+            {
+                "job_id": 1234,
+                "array_job_id": {"set": True, "infinite": False, "number": 1200},
+                "array_task_id": {"set": True, "infinite": False, "number": 34},
+                "name": "nf-PIPE|WITH|PIPES_" + "x" * 250,
+                "time_limit": {"set": True, "infinite": False, "number": 1500},
+                "memory_per_node": {"set": True, "infinite": False, "number": 16384},
+                "partition": "gpu",
+                "job_state": ["PENDING"],
+                "user_name": "alice",
+                "command": "run.sh --sep '|'",
+                "state_reason": "Priority",
+                "start_time": {"set": True, "infinite": False, "number": 0},
+                "submit_time": {"set": True, "infinite": False, "number": 1700000000},
+                "end_time": {"set": True, "infinite": False, "number": 0},
+                "current_working_directory": "/home/alice",
+                "nodes": "",
+            }
+        ],
+    }
+)
+
+
+def make_slurm_repo(**kwargs):
+    return SlurmRepository(make_console(), make_console(), **kwargs)
+
+
+def test_slurm_repo_parses_squeue_json():
+    jobs = make_slurm_repo()._parse_squeue_json(SQUEUE_JSON)
+    assert len(jobs) == 1
+    job = jobs[0]
+    assert job.job_id == "1200_34"
+    assert job.job_name.startswith("nf-PIPE|WITH|PIPES_") and len(job.job_name) == 269
+    assert job.command == "run.sh --sep '|'"
+    assert job.time_limit == "1-01:00:00"
+    assert job.end_time == "1-01:00:00"
+    assert job.memory == "16G"
+    assert job.start_time == "N/A"
+    assert job.nodes == "N/A"
+
+
+def test_slurm_repo_asks_json_only_for_the_jobs_format_cut():
+    repo = make_slurm_repo()
+    short = "1|job|1:00:00|4G|compute|RUNNING|bob|run.sh|None|N/A|N/A|10:00|/home/bob|lab|normal|node-1"
+    cut = "1200_34|" + "x" * 200 + "|1-01:00:00|16G|gpu|PENDING|alice|run.sh|Priority|N/A|N/A|1-01:00:00|/home/alice||"
+    outputs = {"-h": f"{short}\n{cut}\n", "--version": "slurm 23.02.7\n", "--json": SQUEUE_JSON}
+
+    def fake_check_output(cmd, **kwargs):
+        return outputs[cmd[1]]
+
+    with patch("mjobs.data.slurm_repo.check_output", side_effect=fake_check_output) as mock_check_output:
+        jobs = repo.get_jobs(extra_args=["-u", "alice"])
+        assert [j.job_id for j in jobs] == ["1", "1200_34"]
+        assert len(jobs[1].job_name) == 269
+        assert mock_check_output.call_args[0][0] == ["squeue", "--json", "-u", "alice", "-j", "1200_34"]
+
+        # Too many jobs to name, the query is asked again
+        repo.JSON_PER_JOB_MAX = 0
+        repo.get_jobs(extra_args=["-u", "alice"])
+        assert mock_check_output.call_args[0][0] == ["squeue", "--json", "-u", "alice"]
+        del repo.JSON_PER_JOB_MAX
+
+        # Nothing was cut, --format is all it takes
+        outputs["-h"] = short + "\n"
+        mock_check_output.reset_mock()
+        assert [j.job_id for j in repo.get_jobs()] == ["1"]
+        assert mock_check_output.call_count == 1
+
+    # Without a Slurm that filters with --json, the cut values are kept
+    repo = make_slurm_repo()
+    outputs.update({"-h": cut + "\n", "--version": "slurm 22.05.11\n"})
+    with patch("mjobs.data.slurm_repo.check_output", side_effect=fake_check_output):
+        assert len(repo.get_jobs()[0].job_name) == 200
+
+
+def test_slurm_repo_lists_with_json_when_asked():
+    repo = make_slurm_repo(use_json=True)
+
+    with patch("mjobs.data.slurm_repo.check_output", return_value=SQUEUE_JSON) as mock_check_output:
+        jobs = repo.get_jobs(extra_args=["-u", "alice"])
+
+    assert [j.job_id for j in jobs] == ["1200_34"]
+    assert mock_check_output.call_args_list[0][0][0] == ["squeue", "--json", "-u", "alice"]
+    assert mock_check_output.call_count == 1
+
+
+def test_slurm_repo_falls_back_to_format_output():
+    repo = make_slurm_repo(use_json=True)
+    line = "1|job|1:00:00|4G|compute|RUNNING|bob|run.sh|None|N/A|N/A|10:00|/home/bob|lab|normal|node-1"
+
+    def fake_check_output(cmd, **kwargs):
+        if "--json" in cmd:
+            raise CalledProcessError(1, cmd)
+        return line + "\n"
+
+    with patch("mjobs.data.slurm_repo.check_output", side_effect=fake_check_output):
+        jobs = repo.get_jobs()
+
+    assert [j.job_id for j in jobs] == ["1"]
+    assert repo.use_json is False
+
+
+@pytest.mark.parametrize(
+    "version, supported",
+    # 21.08 and 22.05 have --json but ignore the filters with it
+    [("20.11.9", False), ("21.08.8", False), ("22.05.11", False), ("23.02.0", True), ("24.05.1", True)],
+)
+def test_slurm_repo_json_needs_squeue_that_filters(version, supported):
+    repo = make_slurm_repo()
+    with patch("mjobs.data.slurm_repo.check_output", return_value=f"slurm {version}\n"):
+        assert repo._json_supported() is supported
+
+
+SQUEUE_LINE = '"42| my job |1:00:00|4G|gpu|running|alice|run.sh|None|N/A|N/A|10:00|/home/alice|lab|normal|"'
+
+
+def test_job_record_from_squeue_line_matches_model():
+    record = JobRecord.from_squeue_line(SQUEUE_LINE, len(SQUEUE_FIELDS))
+    model = SlurmJob.from_squeue_line(SQUEUE_LINE, len(SQUEUE_FIELDS))
+    assert record.job_state == "RUNNING"
+    assert record.nodes == "N/A"
+    assert record.to_dict() == model.to_dict()
+
+    # Equal records hash the same, they can be put in sets
+    copy = JobRecord(*record.as_tuple())
+    assert copy == record and hash(copy) == hash(record)
+    assert len({record, copy}) == 1
+    copy.job_state = "PENDING"
+    assert len({record, copy}) == 2
+
+
+def test_job_record_builds_model_lazily():
+    record = JobRecord.from_squeue_line(SQUEUE_LINE, len(SQUEUE_FIELDS))
+    assert record._model is None
+    assert record.to_model() is record.to_model()
+
+
+def test_job_record_rejects_empty_fields():
+    with pytest.raises(ValueError):
+        JobRecord.from_squeue_line(SQUEUE_LINE.replace("alice|", "|", 1), len(SQUEUE_FIELDS))
+
+
+def test_job_columns_round_trip_and_encoding():
+    jobs = TestJobRepository(seed=42).get_jobs()
+    snapshot = JobColumns.from_records(jobs)
+    assert len(snapshot) == len(jobs)
+    assert snapshot.records() == jobs
+    assert sorted(snapshot.categories("job_state")) == sorted({j.job_state for j in jobs})
+    assert snapshot.values("user_name") == [j.user_name for j in jobs]
+
+
+def test_job_columns_filters_match_per_object_scan():
+    jobs = TestJobRepository(seed=42).get_jobs()
+    snapshot = JobColumns.from_records(jobs)
+
+    regex = re.compile("blast|nf-")
+    expected = sorted((j for j in jobs if regex.search(j.job_name) or regex.search(j.command)), key=lambda j: j.job_id)
+    indices = snapshot.sort_indices("job_id", snapshot.match_regex(regex, ("job_name", "command")))
+    assert snapshot.records(indices) == expected
+
+    fields = ("job_name", "job_state", "user_name", "command")
+    expected = [j for j in jobs if any("run" in getattr(j, f).lower() for f in fields)]
+    assert [jobs[i] for i in snapshot.search("RUN", fields)] == expected
+
+
+@pytest.mark.parametrize("distinct", [False, True])
+def test_search_index_narrows_as_you_type(distinct):
+    jobs = TestJobRepository(seed=42).get_jobs() * 3
+    if distinct:
+        jobs = [JobRecord(*((job.job_id, f"{job.job_name}-{i}") + job.as_tuple()[2:])) for i, job in enumerate(jobs)]
+    snapshot = JobColumns.from_records(jobs)
+    fields = ("job_name", "job_state", "user_name", "command")
+    index = snapshot.search_index(fields)
+    assert snapshot.search_index(list(fields)) is index
+    assert len(index) == len(jobs)
+
+    for text in ["r", "ru", "RUN", "runn", "running!", "run", "", "nf-", "\x00"]:
+        assert index.search(text) == snapshot.search(text, fields), text
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("state:RUNNING user:alice", lambda j: j.job_state == "RUNNING" and j.user_name == "alice"),
+        ("state:running,pending -user:bob", lambda j: j.job_state in ("RUNNING", "PENDING") and j.user_name != "bob"),
+        (
+            "mem>=32G time<1-00:00:00",
+            lambda j: int(j.memory[:-1]) >= 32 and j.time_limit in ("1:00:00", "4:00:00", "12:00:00"),
+        ),
+        ("partition:gpu,bigmem name~^nf-", lambda j: j.partition in ("gpu", "bigmem") and j.job_name.startswith("nf-")),
+        (
+            "blast|spades state:RUNNING",
+            lambda j: re.search("blast|spades", j.job_name + j.command) and j.job_state == "RUNNING",
+        ),
+        ('reason:"AdminCancel" mem<16384', lambda j: j.state_reason == "AdminCancel" and int(j.memory[:-1]) < 16),
+        ("http://x user:nobody", lambda j: False),
+    ],
+)
+def test_job_query_selects_like_a_per_object_scan(query, expected):
+    jobs = TestJobRepository(seed=42).get_jobs() * 2
+    snapshot = JobColumns.from_records(jobs)
+    compiled = JobQuery.parse(query)
+    matching = [index for index, job in enumerate(jobs) if expected(job)]
+    assert compiled.select(snapshot) == matching
+    assert [index for index, job in enumerate(jobs) if compiled.matches(job)] == matching
+    assert compiled.select(snapshot, matching[::2]) == matching[::2]
+
+
+def test_job_query_keeps_a_plain_filter_as_one_regex():
+    template = TestJobRepository(seed=42).get_jobs()[0]
+    jobs = [
+        JobRecord(*((job_id, name) + template.as_tuple()[2:]))
+        for job_id, name in (("1", "my job"), ("2", "my other job"), ("3", "job my"))
+    ]
+    query = JobQuery.parse("my job")
+    assert query.words == ["my job"]
+    assert [job.job_id for job in jobs if query.matches(job)] == ["1"]
+    assert JobQuery.parse(" ^my (other )?job$ ").words == ["^my (other )?job$"]
+    # with field terms, the words are separate regexes, quotes keep the spaces
+    query = JobQuery.parse('"my job" id<3')
+    assert query.words == ["my job"]
+    assert [job.job_id for job in jobs if query.matches(job)] == ["1"]
+    assert len(JobQuery.parse("my job id<3").words) == 2
+    # only a pair of quotes around a whole value is removed, the other quotes are matched
+    assert JobQuery.parse('name="x" id<3').words == ['name="x"']
+    assert JobQuery.parse('name~x="y"').terms[0].value == 'x="y"'
+    assert JobQuery.parse('name:"my job"').terms[0].value == "my job"
+    # the dashboard search looks for each word
+    assert JobQuery.parse("my job", regex_words=False).words == ["my", "job"]
+
+
+def test_job_query_parsing():
+    query = JobQuery.parse('state:RUNNING user:alice name~"nf-.*SPADES" blast id>100 a:b', ("job_name",))
+    assert [(term.field, term.op) for term in query.terms] == [
+        ("job_state", ":"),
+        ("user_name", ":"),
+        ("job_name", "~"),
+        ("job_id", ">"),
+    ]
+    assert query.words == ["blast", "a:b"]
+    assert query.equalities() == {"job_state": {"RUNNING"}, "user_name": {"alice"}}
+    assert [pattern.pattern for pattern in query.name_patterns] == ["blast", "a:b", "nf-.*SPADES"]
+    assert not JobQuery.parse("  ")
+
+    for invalid in ("state:", "name~(", "mem>lots", "(unclosed"):
+        with pytest.raises(QueryError):
+            JobQuery.parse(invalid)
+
+    assert parse_size("4G") == parse_size("4096") == parse_size("4096Mc") == 4096
+    assert parse_size("N/A") is None
+    assert parse_duration("1-02:00:00") == parse_duration("26h") == 26 * 3600
+    assert parse_duration("30:00") == parse_duration("30") == 1800
+    assert parse_duration("UNLIMITED") is None
+
+
+def test_plan_squeue_filters_pushes_down_equality_terms():
+    query = JobQuery.parse("state:running user:alice,bob name~blast -qos:low acct:lab part:gpu state:pending x")
+    args, local = plan_squeue_filters(query, ["-p", "long"])
+    assert args == ["--states=RUNNING", "--user=alice,bob", "--account=lab"]
+    assert [repr(term) for term in local.terms] == [
+        "QueryTerm(job_name~blast)",
+        "QueryTerm(-qos:low)",
+        "QueryTerm(job_state:pending)",
+    ]
+    assert local.words == ["part:gpu", "x"]
+
+    args, local = plan_squeue_filters(JobQuery.parse("state:FOO user:-bob"), ["--user=alice"])
+    assert args == [] and len(local.terms) == 2
+    assert plan_squeue_filters(JobQuery.parse("name:-rf"))[0] == ["--name=-rf"]
+
+
+def test_slurm_run_pushes_filters_to_squeue():
+    repo = TestJobRepository(seed=42)
+    calls = []
+    get_jobs = repo.get_jobs
+    listed = []
+
+    def spy(job_ids=None, extra_args=None):
+        calls.append(list(extra_args))
+        listed.extend(get_jobs(job_ids, extra_args))
+        return listed
+
+    repo.get_jobs = spy
+    slurm = make_slurm(repo)
+    with patch.object(slurm, "table_rows", wraps=slurm.table_rows) as table_rows:
+        slurm.run(
+            job_ids=(),
+            tsv=True,
+            no_header=True,
+            dashboard=False,
+            kill=False,
+            filter="state:RUNNING user:alice mem>8G",
+            user=None,
+            partition="gpu",
+            states=(),
+            nodelist=(),
+            extended=False,
+        )
+    assert calls == [["-p", "gpu", "--states=RUNNING", "--user=alice"]]
+    assert [(term.field, term.op) for term in slurm.local_query.terms] == [("memory", ">")]
+    # The rows are the listed records, sorted and filtered, not copies of them
+    rows = table_rows.call_args[0][0]
+    assert rows and all(any(row is job for job in listed) for row in rows)
+    assert [row.job_id for row in rows] == sorted(row.job_id for row in rows)
+
+
+def test_slurm_cli_filter_query():
+    runner = CliRunner()
+    result = runner.invoke(slurm_cli, ["--test-data", "--tsv", "--no-header", "--filter", "state:RUNNING user:alice"])
+    assert result.exit_code == 0
+    rows = [line.split("\t") for line in result.output.splitlines() if line]
+    assert rows and all(row[1] == "RUNNING" and row[3] == "alice" for row in rows)
+
+    result = runner.invoke(slurm_cli, ["--test-data", "--filter", "mem>lots"])
+    assert result.exit_code == 2
+
+
+def fake_squeue(tmp_path, monkeypatch, output, exit_code=0):
+    script = tmp_path / "squeue"
+    script.write_text(f"#!/bin/sh\ncat <<'EOF'\n{output}\nEOF\nexit {exit_code}\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+
+
+def test_slurm_repo_iter_jobs_streams_from_pipe(tmp_path, monkeypatch):
+    fake_squeue(tmp_path, monkeypatch, "\n".join([SQUEUE_LINE, SQUEUE_LINE.replace("42|", "43|")]))
+    repository = make_slurm_repo(use_json=False)
+    repository.details_cache.put("42", {"JobId": "42", "JobState": "PENDING"})
+    repository.details_cache.put("43", {"JobId": "43", "JobState": "RUNNING"})
+    jobs = repository.iter_jobs()
+    assert next(jobs).job_id == "42"
+    # tracked as it's yielded, the details of the job that started are read again
+    assert repository.details_cache.get("42") is None
+    assert repository.details_cache.get("43") is not None
+    assert [j.job_id for j in jobs] == ["43"]
+    assert repository.plan_jobs_details(["42", "43"])[1] == ["42"]
+
+
+def test_slurm_repo_iter_jobs_reports_squeue_failure(tmp_path, monkeypatch):
+    fake_squeue(tmp_path, monkeypatch, SQUEUE_LINE, exit_code=1)
+    with pytest.raises(JobRepositoryError):
+        list(make_slurm_repo(use_json=False).iter_jobs())
+
+
+BJOBS_OUTPUT = json.dumps(
+    {
+        "COMMAND": "bjobs",
+        "JOBS": 3,
+        "RECORDS": [
+            {
+                "JOBID": "101",
+                "STAT": "RUN",
+                "JOB_NAME": "align",
+                "USER": "alice",
+                "QUEUE": "long",
+                "COMMAND": "bwa mem ref.fa reads.fq",
+                "SUBMIT_TIME": "Oct 16 10:20",
+                "START_TIME": "Oct 16 10:21",
+                "FINISH_TIME": "-",
+                "EXEC_HOST": "node7",
+                "PEND_REASON": "",
+                "OUTPUT_FILE": "/home/alice/align.out",
+                "ERROR_FILE": "/home/alice/align.err",
+            },
+            {
+                "JOBID": "102",
+                "STAT": "PEND",
+                "JOB_NAME": "blast[7]",
+                "USER": "bob",
+                "QUEUE": "short",
+                "COMMAND": "blastn",
+                "SUBMIT_TIME": "Oct 16 10:22",
+                "START_TIME": "-",
+                "EXEC_HOST": "-",
+                "PEND_REASON": "Job slot limit reached;",
+            },
+            {"JOBID": "103", "ERROR": "Job <103> is not found"},
+        ],
+    }
+)
+
+
+def test_lsf_repo_normalizes_bjobs_records(tmp_path, monkeypatch):
+    # The table also shows the columns the other tests leave out
+    output = json.loads(BJOBS_OUTPUT)
+    for record in output["RECORDS"]:
+        record.setdefault("JOB_GROUP", "")
+        record.setdefault("FINISH_TIME", "-")
+    script = tmp_path / "bjobs"
+    script.write_text(f"#!/bin/sh\necho \"$@\" >> {tmp_path / 'calls'}\ncat <<'EOF'\n{json.dumps(output)}\nEOF\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+    repository = LsfRepository(make_console(), make_console())
+
+    running, pending = repository.get_jobs(None, ["-u", "all"])
+    assert (running.job_id, running.job_state, running.partition, running.nodes) == ("101", "RUNNING", "long", "node7")
+    assert (pending.job_id, pending.job_state, pending.nodes) == ("102[7]", "PENDING", "N/A")
+    assert pending.state_reason == "Job slot limit reached;"
+    assert pending.validate() is pending
+
+    details = repository.get_jobs_details(["101", "102[7]"])
+    assert details["101"]["StdOut"] == "/home/alice/align.out"
+    assert details["102[7]"]["JobState"] == "PENDING"
+    assert repository.get_job_details("101") == details["101"]
+    assert len((tmp_path / "calls").read_text().splitlines()) == 2
+
+    pushed, rest = repository.plan_filters(JobQuery.parse("user:bob state:pending partition:a,b blast"), ["-q", "long"])
+    assert pushed == ["-u", "bob", "-p"]
+    assert [term.field for term in rest.terms] == ["partition"] and rest.words == ["blast"]
+
+    # The snapshot cache works with any repository that has a snapshot key
+    cache = CachingJobRepository(repository, ttl=60, cache_dir=tmp_path / "cache")
+    assert cache.get_jobs(None, ["-u", "all"]) == cache.get_jobs(None, ["-u", "all"]) == [running, pending]
+    assert len((tmp_path / "calls").read_text().splitlines()) == 3
+
+
+@pytest.mark.parametrize("read_size", [1, 7, 65536])
+def test_bjobs_records_are_decoded_incrementally(read_size):
+    output = "Job <103> is not found\n" + BJOBS_OUTPUT.replace(",", " ,\n ") + "\n"
+    errors = []
+    records = iter_bjobs_records(io.StringIO(output), on_error=errors.append, read_size=read_size)
+    assert next(records)["JOB_NAME"] == "align"
+    assert [record["JOBID"] for record in records] == ["102"]
+    assert errors == [{"JOBID": "103", "ERROR": "Job <103> is not found"}]
+
+    assert list(iter_bjobs_records(io.StringIO('{"COMMAND": "bjobs", "JOBS": 0}'), read_size=read_size)) == []
+    with pytest.raises(ValueError):
+        list(iter_bjobs_records(io.StringIO(BJOBS_OUTPUT[:-40]), read_size=read_size))
+    with pytest.raises(ValueError):
+        list(iter_bjobs_records(io.StringIO("bjobs: LSF is down"), read_size=read_size))
+
+
+def test_lsf_dashboard_uses_the_repository(tmp_path, monkeypatch):
+    fake_squeue(tmp_path, monkeypatch, BJOBS_OUTPUT)
+    (tmp_path / "squeue").rename(tmp_path / "bjobs")
+    lsf = LSF(Console(), Console(), job_repository=LsfRepository(make_console(), make_console()))
+    lsf.args = SimpleNamespace(
+        job_id=(),
+        user="all",
+        queue=None,
+        run=False,
+        all=False,
+        recent=False,
+        user_group=None,
+        group=None,
+        hosts=None,
+        pend=False,
+    )
+
+    async def run():
+        app = Dashboard(lsf, refresh_interval=0)
+        async with app.run_test() as pilot:
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            assert app._fetched_args == ["-u", "all"]
+            assert [job.job_id for job in app.query_one(JobsTable).filtered_jobs] == ["101", "102[7]"]
+
+    asyncio.run(run())
+
+
+def test_lsf_cli_filters_with_the_query_and_exports(tmp_path, monkeypatch):
+    # The table also shows the columns the other tests leave out
+    output = json.loads(BJOBS_OUTPUT)
+    for record in output["RECORDS"]:
+        record.setdefault("JOB_GROUP", "")
+        record.setdefault("FINISH_TIME", "-")
+    script = tmp_path / "bjobs"
+    script.write_text(f"#!/bin/sh\necho \"$@\" >> {tmp_path / 'calls'}\ncat <<'EOF'\n{json.dumps(output)}\nEOF\n")
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+    runner = CliRunner()
+
+    result = runner.invoke(lsf_cli, ["--format", "ndjson", "--filter", "state:RUNNING cmd~bwa"])
+    assert result.exit_code == 0
+    assert [json.loads(line)["job_id"] for line in result.stdout.splitlines()] == ["101"]
+    # The state is passed to bjobs
+    assert (tmp_path / "calls").read_text().split()[-1] == "-r"
+
+    # A plain regex is looked for in the name and the pending reason, as before
+    result = runner.invoke(lsf_cli, ["--tsv", "--no-header", "--filter", "slot limit"])
+    assert result.exit_code == 0
+    assert [line.split("\t")[0] for line in result.stdout.splitlines()] == ["102"]
+    result = runner.invoke(lsf_cli, ["--tsv", "--no-header", "--filter", "partition:short blast"])
+    assert result.exit_code == 0
+    assert (tmp_path / "calls").read_text().splitlines()[-1].endswith("-q short")
+
+    result = runner.invoke(lsf_cli, ["--filter", "mem>lots"])
+    assert result.exit_code == 2
+
+
+def test_slurm_repo_queries_clusters_concurrently(tmp_path, monkeypatch):
+    script = tmp_path / "squeue"
+    script.write_text(
+        '#!/bin/sh\nsleep 0.5\nwhile [ $# -gt 0 ]; do [ "$1" = "-M" ] && cluster=$2; shift; done\n'
+        f"echo \"CLUSTER: $cluster\"\necho '{SQUEUE_LINE}'\n"
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+    repository = make_slurm_repo(use_json=False, clusters=["a", "b", "c"])
+
+    started = time.monotonic()
+    jobs = repository.get_jobs()
+    # One sleep, not three
+    assert time.monotonic() - started < 1.2
+    assert [(job.cluster, job.job_id) for job in jobs] == [("a", "42"), ("b", "42"), ("c", "42")]
+    assert [job.cluster for job in repository.iter_jobs()] == ["a", "b", "c"]
+
+    with patch("mjobs.data.slurm_repo.check_output", return_value="JobId=42 JobName=test") as scontrol:
+        repository.get_job_details("42")
+        assert scontrol.call_args[0][0] == ["scontrol", "-M", "c", "show", "job", "42"]
+
+
+def test_slurm_repo_streams_clusters_without_waiting_on_full_pipes(tmp_path, monkeypatch):
+    script = tmp_path / "squeue"
+    # a is slow to answer, b writes more than a pipe holds before taking as long
+    script.write_text(
+        '#!/bin/sh\nwhile [ $# -gt 0 ]; do [ "$1" = "-M" ] && cluster=$2; shift; done\n'
+        '[ "$cluster" = a ] && sleep 0.6\necho "CLUSTER: $cluster"\n'
+        f"i=0; while [ $i -lt 2000 ]; do echo '{SQUEUE_LINE}'; i=$((i+1)); done\n"
+        '[ "$cluster" = b ] && sleep 0.6\nexit 0\n'
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+    repository = make_slurm_repo(use_json=False, clusters=["a", "b"])
+
+    started = time.monotonic()
+    clusters = [job.cluster for job in repository.iter_jobs()]
+    # One sleep, b was drained while a was awaited
+    assert time.monotonic() - started < 1.1
+    assert clusters == ["a"] * 2000 + ["b"] * 2000
+
+    # Stopping early kills the squeues and ends the readers
+    jobs = repository.iter_jobs()
+    assert next(jobs).cluster == "a"
+    jobs.close()
+
+
+def test_async_slurm_repo_awaits_squeue_with_a_timeout(tmp_path, monkeypatch):
+    fake_squeue(tmp_path, monkeypatch, SQUEUE_LINE)
+    repository = make_slurm_repo(use_json=False).as_async()
+    assert isinstance(repository, AsyncSlurmRepository)
+    jobs = asyncio.run(repository.get_jobs())
+    assert [job.job_id for job in jobs] == ["42"]
+
+    script = tmp_path / "squeue"
+    script.write_text("#!/bin/sh\nexec sleep 10\n")
+    repository.timeout = 0.2
+    started = time.monotonic()
+    with pytest.raises(JobRepositoryError, match="timed out"):
+        asyncio.run(repository.get_jobs())
+    assert time.monotonic() - started < 5
+
+    async def cancel():
+        task = asyncio.ensure_future(run_command([str(script)]))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    started = time.monotonic()
+    asyncio.run(cancel())
+    assert time.monotonic() - started < 5
+
+    assert isinstance(TestJobRepository().as_async(), ThreadedJobRepository)
+
+
+def test_async_slurm_repo_completes_the_cut_jobs_with_json(tmp_path, monkeypatch):
+    cut = "1200_34|" + "x" * 200 + "|1-01:00:00|16G|gpu|PENDING|alice|run.sh|Priority|N/A|N/A|1-01:00:00|/home/alice||"
+    script = tmp_path / "squeue"
+    script.write_text(
+        "#!/bin/sh\n"
+        f'echo "$@" >> {tmp_path / "calls"}\n'
+        'case "$1" in\n'
+        "--version) echo 'slurm 24.05.1' ;;\n"
+        f"--json) cat <<'EOF'\n{SQUEUE_JSON}\nEOF\n;;\n"
+        f"*) echo '{cut}' ;;\n"
+        "esac\n"
+    )
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{tmp_path}:{os.environ['PATH']}")
+
+    jobs = asyncio.run(make_slurm_repo().as_async().get_jobs())
+    assert len(jobs[0].job_name) == 269
+    assert (tmp_path / "calls").read_text().splitlines()[1:] == ["--version", "--json -j 1200_34"]
+
+
+def test_slurm_cli_lists_clusters_with_test_data():
+    result = CliRunner().invoke(slurm_cli, ["--test-data", "--tsv", "--clusters", "east,west"])
+    assert result.exit_code == 0
+    header, *rows = [line.split("\t") for line in result.output.splitlines() if line]
+    assert header[:2] == ["JobId", "Cluster"]
+    assert rows and {row[1] for row in rows} <= {"east", "west"}
+
+
+def test_slurm_cli_stream_with_test_data():
+    runner = CliRunner()
+    result = runner.invoke(slurm_cli, ["--test-data", "--stream", "-nh"])
+    assert result.exit_code == 0
+    assert len(result.output.strip().split("\n")) == 50
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 16384])
+def test_job_exporter_escapes_only_what_needs_it(chunk_size):
+    jobs = TestJobRepository(seed=42).get_jobs()[:3]
+    jobs[1].job_name = 'say "hi",\tthen\nleave\\'
+    fields = ["job_id", "job_name", "job_state"]
+    expected = [[job.job_id, job.job_name, job.job_state] for job in jobs]
+
+    def export(output_format, rows=jobs, **kwargs):
+        stream = io.StringIO()
+        with patch("mjobs.core.export.CHUNK_SIZE", chunk_size):
+            assert JobExporter(output_format, fields, **kwargs).write(rows, stream) == len(rows)
+        return stream.getvalue()
+
+    assert list(csv.reader(io.StringIO(export("csv")))) == [fields, *expected]
+    assert [line.split("\t") for line in export("tsv", header=False).splitlines()][1][1] == 'say "hi", then leave\\'
+    assert [list(record.values()) for record in json.loads(export("json"))] == expected
+    assert [list(json.loads(line).values()) for line in export("ndjson").splitlines()] == expected
+    assert json.loads(export("json", rows=[])) == []
+
+    stream = io.StringIO()
+    JobExporter("ndjson", ["job_id", "task_count"]).write(collapse_arrays(make_array_jobs()), stream)
+    assert json.loads(stream.getvalue().splitlines()[1]) == {"job_id": "5_[1-3]", "task_count": 3}
+
+
+def test_slurm_cli_exports_with_test_data():
+    result = CliRunner().invoke(slurm_cli, ["--test-data", "--format", "json", "--collapse-arrays"])
+    assert result.exit_code == 0
+    records = json.loads(result.output)
+    assert records and all(isinstance(record["task_count"], int) for record in records)
+    assert "cluster" not in records[0]
+
+
+def test_arrow_export_types_the_columns(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    from mjobs.core.arrow import write_arrow_stream
+
+    jobs = TestJobRepository(seed=42).get_jobs()[:5]
+    jobs[0].time_limit, jobs[0].start_time, jobs[0].submit_time = "1-02:00:00", "N/A", "2024-03-01T10:20:30"
+    jobs[1].time_limit = "UNLIMITED"
+    fields = ["job_id", "job_state", "partition", "time_limit", "submit_time", "start_time"]
+
+    sink = io.BytesIO()
+    with patch("mjobs.core.arrow.BATCH_SIZE", 2):
+        assert write_arrow_stream(jobs, fields, sink) == 5
+    table = pa.ipc.open_stream(sink.getvalue()).read_all()
+    assert table.schema.field("job_state").type == pa.dictionary(pa.int32(), pa.string())
+    assert table.schema.field("time_limit").type == pa.duration("s")
+    assert table.column("job_state").to_pylist() == [job.job_state for job in jobs]
+    first = table.slice(0, 1).to_pylist()[0]
+    assert first["time_limit"].total_seconds() == 93600 and first["start_time"] is None
+    assert first["submit_time"].isoformat() == "2024-03-01T10:20:30"
+    assert table.column("time_limit")[1].as_py() is None
+
+    result = CliRunner().invoke(slurm_cli, ["--test-data", "--export-parquet", str(tmp_path / "jobs.parquet")])
+    assert result.exit_code == 0
+    assert pq.read_table(tmp_path / "jobs.parquet").num_rows == 50
+
+
+def test_arrow_export_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    result = CliRunner().invoke(slurm_cli, ["--test-data", "--format", "arrow"])
+    assert result.exit_code == 1 and "pip install" in result.output
+
+
+def test_tsv_listing_does_not_import_the_heavy_modules():
+    code = (
+        "import sys; sys.argv = ['mjobs', '--test-data', '--tsv']\n"
+        "from mjobs.main import main\n"
+        "try:\n    main()\nexcept SystemExit:\n    pass\n"
+        "heavy = ('pydantic', 'textual', 'asyncio', 'rich.table')\n"
+        "print(sorted(module for module in heavy if module in sys.modules), file=sys.stderr)"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert len(result.stdout.splitlines()) == 51
+    assert result.stderr.strip() == "[]"
+
+
+def test_jobs_table_updates_rows_in_place():
+    jobs = TestJobRepository(seed=42).get_jobs()[:5]
+
+    class TableApp(App):
+        def compose(self):
+            yield JobsTable()
+
+    async def run():
+        app = TableApp()
+        async with app.run_test():
+            table = app.query_one(JobsTable)
+            assert table.populate_table(jobs) == 5
+            table.move_cursor(row=2)
+            selected = jobs[2].job_id
+
+            assert table.populate_table(jobs) == 0
+
+            changed = JobRecord(*jobs[2].as_tuple())
+            changed.job_state = "COMPLETED" if changed.job_state != "COMPLETED" else "FAILED"
+            added = JobRecord(*jobs[4].as_tuple())
+            added.job_id = "1"
+            assert table.populate_table([added, jobs[1], changed, jobs[3], jobs[4]]) == 3
+
+            assert [row.key.value for row in table.ordered_rows] == [
+                job.job_id for job in (added, jobs[1], changed, jobs[3], jobs[4])
+            ]
+            assert table.get_selected_job() is changed
+            assert table.get_row(selected)[1].plain == changed.job_state
+
+            # Many rows going at once: the table is rebuilt, the cursor stays on its job
+            many = TestJobRepository(seed=7).get_jobs()[:40]
+            with patch.object(JobsTable, "REMOVE_ROWS_MAX", 2):
+                table.populate_table([jobs[1], changed, *many])
+                assert table.populate_table([changed, jobs[4]]) == 42
+            assert [row.key.value for row in table.ordered_rows] == [changed.job_id, jobs[4].job_id]
+            assert table.get_selected_job() is changed
+            table.populate_table([added, jobs[1], changed, jobs[3], jobs[4]])
+
+            table.filter_jobs(jobs[3].job_name)
+            table.populate_table(jobs)
+            assert table.search_text == jobs[3].job_name
+            assert jobs[3] in table.filtered_jobs
+            assert table.row_count == len(table.filtered_jobs) < len(jobs)
+
+            table.filter_jobs(f"state:{jobs[0].job_state.lower()} -user:{jobs[0].user_name}")
+            assert table.filtered_jobs == [
+                j for j in jobs if j.job_state == jobs[0].job_state and j.user_name != jobs[0].user_name
+            ]
+            with pytest.raises(QueryError):
+                table.filter_jobs("name~(")
+            assert table.search_text.startswith("state:")
+
+    asyncio.run(run())
+
+
+def test_jobs_table_keys_rows_on_the_cluster():
+    job = TestJobRepository(seed=42).get_jobs()[0]
+    east, west = JobRecord(*job.as_tuple()), JobRecord(*job.as_tuple())
+    east.cluster, west.cluster = "east", "west"
+
+    class TableApp(App):
+        def compose(self):
+            yield JobsTable(show_cluster=True)
+
+    async def run():
+        app = TableApp()
+        async with app.run_test():
+            table = app.query_one(JobsTable)
+            assert table.populate_table([east]) == 1
+            assert table.populate_table([west, east]) == 1
+            assert [row.key.value for row in table.ordered_rows] == [f"west/{job.job_id}", f"east/{job.job_id}"]
+            assert table.get_row(f"west/{job.job_id}")[:2] == [job.job_id, "west"]
+
+    asyncio.run(run())
+
+
+def make_array_jobs():
+    template = TestJobRepository(seed=42).get_jobs()[0]
+    jobs = []
+    for job_id, job_state in [("7", "RUNNING"), ("5_1", "RUNNING"), ("5_2", "RUNNING"), ("5_[4-10%2]", "PENDING")]:
+        job = JobRecord(*template.as_tuple())
+        job.job_id, job.job_state = job_id, job_state
+        jobs.append(job)
+    task = JobRecord(*jobs[1].as_tuple())
+    task.job_id = "5_3"
+    return jobs + [task]
+
+
+def test_collapse_arrays_groups_tasks_by_array_and_state():
+    assert parse_array_id("5_[1-3,7%2]") == ("5", [(1, 3), (7, 7)])
+    assert parse_array_id("5") is None and parse_array_id("5_[1-9:2]") is None
+    assert first_task_id("5_[4-10%2]") == "5_4" and first_task_id("5_[7,1-3]") == "5_1"
+    assert first_task_id("5_3") == "5_3" and first_task_id("5") == "5"
+
+    collapsed = collapse_arrays(make_array_jobs())
+    assert [(job.job_id, job.job_state, job.task_count) for job in collapsed] == [
+        ("7", "RUNNING", 1),
+        ("5_[1-3]", "RUNNING", 3),
+        ("5_[4-10]", "PENDING", 7),
+    ]
+    assert isinstance(collapsed[1], ArrayJobRecord) and collapsed[1].array_id == "5"
+    assert len(collapse_arrays(make_array_jobs(), expanded={("", "5")})) == 5
+
+
+def test_dashboard_expands_job_arrays_on_demand():
+    repository = TestJobRepository(seed=42)
+    slurm = Slurm(Console(), Console(), job_repository=repository)
+    slurm.args = SimpleNamespace(job_id=(), user=None, partition=None, states=(), nodelist=())
+
+    async def run():
+        with patch.object(repository, "get_jobs", return_value=make_array_jobs()):
+            app = Dashboard(slurm, refresh_interval=0)
+            async with app.run_test() as pilot:
+                await app.workers.wait_for_complete()
+                await pilot.pause()
+                table = app.query_one(JobsTable)
+                assert [job.job_id for job in table.filtered_jobs] == ["7", "5_[1-3]", "5_[4-10]"]
+                assert table.get_row("5_[1-3]")[1] == 3
+
+                table.move_cursor(row=1)
+                await pilot.press("x")
+                assert [job.job_id for job in table.filtered_jobs] == ["7", "5_1", "5_2", "5_[4-10%2]", "5_3"]
+                await pilot.press("x")
+                assert table.row_count == 3
+                await pilot.press("a")
+                assert table.row_count == 5
+
+    asyncio.run(run())
+
+
+def test_dashboard_asks_the_details_of_an_array_row_for_its_first_task():
+    repository = TestJobRepository(seed=42)
+    asked = []
+    get_job_details = repository.get_job_details
+
+    def get_task_details(job_id):
+        asked.append(job_id)
+        return {**get_job_details(job_id), "StdOut": f"/scratch/{job_id}.out"}
+
+    repository.get_job_details = get_task_details
+    slurm = Slurm(Console(), Console(), job_repository=repository)
+    slurm.args = SimpleNamespace(job_id=(), user=None, partition=None, states=(), nodelist=())
+
+    async def run():
+        with patch.object(repository, "get_jobs", return_value=make_array_jobs()):
+            app = Dashboard(slurm, refresh_interval=0)
+            async with app.run_test() as pilot:
+                await app.workers.wait_for_complete()
+                table = app.query_one(JobsTable)
+                table.move_cursor(row=1)
+                await pilot.pause()
+                assert table.get_selected_job().job_id == "5_[1-3]"
+
+                app.action_show_details()
+                await app.workers.wait_for_complete()
+                assert asked[-1] == "5_1"
+                with patch.object(app, "copy_to_clipboard") as copy, patch.object(app, "notify") as notify:
+                    app._copy_file_path("StdOut")
+                    await app.workers.wait_for_complete()
+                copy.assert_called_once_with("/scratch/5_1.out")
+                assert "expand the array (x)" in notify.call_args_list[0][0][0]
+                assert not any("[" in job_id for job_id in asked)
+
+    asyncio.run(run())
+
+
+def test_refresh_policy_backs_off_and_resets():
+    policy = RefreshPolicy(10, max_interval=30)
+    assert policy.next_interval(0, 0.1) == 15
+    assert policy.next_interval(0, 0.1) == 22.5
+    assert policy.next_interval(0, 0.1) == 30
+    assert policy.next_interval(0, 0.1) == 30
+    assert policy.next_interval(3, 0.1) == 10
+    # slow squeue, wait longer
+    assert policy.next_interval(3, 2.0) == 20
+
+
+def test_dashboard_refreshes_in_a_worker():
+    slurm = Slurm(Console(), Console(), job_repository=TestJobRepository(seed=42))
+    slurm.args = SimpleNamespace(job_id=(), user=None, partition=None, states=(), nodelist=())
+
+    async def run():
+        app = Dashboard(slurm, refresh_interval=5)
+        async with app.run_test() as pilot:
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            assert app.query_one(JobsTable).row_count == len(app.jobs) == 50
+            assert app.sub_title.startswith("updated 0s ago, next in")
+            assert app.refresh_policy.interval == 5
+            page = app.query_one(JobsTable).page_jobs()
+            assert 0 < len(page) < 50
+            assert page == app.query_one(JobsTable).filtered_jobs[: len(page)]
+
+            user = app.jobs[0].user_name
+            await pilot.press("ctrl+f", *user)
+            await asyncio.sleep(app.SEARCH_DELAY * 2)
+            await pilot.pause()
+            table = app.query_one(JobsTable)
+            assert table.search_text == user
+            assert table.filtered_jobs == [job for job in app.jobs if user in job.user_name]
+            assert table.filter_jobs(user) == 0
+
+            await pilot.press("escape")
+            assert table.search_text == ""
+            assert table.row_count == 50
+
+            await pilot.press("ctrl+f", *f"user:{user}", "enter")
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            assert f"--user={user}" in app._fetched_args
+            assert table.row_count == len(app.jobs) > 0
+            assert all(job.user_name == user for job in app.jobs)
+
+    asyncio.run(run())
+
+
+def test_dashboard_prefetches_details_when_the_cursor_moves_not_on_refresh():
+    repository = TestJobRepository(seed=42)
+    prefetched = []
+    repository.get_jobs_details = lambda job_ids: prefetched.append(list(job_ids)) or {}
+    slurm = Slurm(Console(), Console(), job_repository=repository)
+    slurm.args = SimpleNamespace(job_id=(), user=None, partition=None, states=(), nodelist=())
+
+    async def run():
+        app = Dashboard(slurm, refresh_interval=0)
+        async with app.run_test() as pilot:
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            calls = len(prefetched)
+            for _ in range(3):
+                app.refresh_jobs()
+                await app.workers.wait_for_complete()
+                await pilot.pause()
+            assert len(prefetched) == calls
+
+            await pilot.press("down")
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            assert len(prefetched) == calls + 1
+            selected = app.query_one(JobsTable).get_selected_job()
+            assert prefetched[-1][0] == selected.job_id
+            assert len(prefetched[-1]) <= Dashboard.PREFETCH_MAX
+
+    asyncio.run(run())
+
+
+def test_dashboard_gets_job_details_off_the_ui_thread():
+    repository = TestJobRepository(seed=42)
+    threads = []
+    get_job_details = repository.get_job_details
+
+    def get_job_details_in_thread(job_id):
+        threads.append(threading.current_thread())
+        return {**get_job_details(job_id), "StdOut": f"/scratch/{job_id}.out"}
+
+    repository.get_job_details = get_job_details_in_thread
+    slurm = Slurm(Console(), Console(), job_repository=repository)
+    slurm.args = SimpleNamespace(job_id=(), user=None, partition=None, states=(), nodelist=())
+
+    async def run():
+        app = Dashboard(slurm, refresh_interval=0)
+        async with app.run_test() as pilot:
+            await app.workers.wait_for_complete()
+            job = app.query_one(JobsTable).get_selected_job()
+            app.action_show_details()
+            panel = app.query_one(JobDetailsPanel)
+            # the listing fields are shown at once, the details when they come
+            assert panel.current_job is job
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            assert threads and threading.main_thread() not in threads
+
+            with patch.object(app, "copy_to_clipboard") as copy:
+                app._copy_file_path("StdOut")
+                await app.workers.wait_for_complete()
+            copy.assert_called_once_with(f"/scratch/{job.job_id}.out")
+            assert threading.main_thread() not in threads
+
+    asyncio.run(run())
+
+
+def make_caching_repo(tmp_path, jobs, delay=0.0):
+    repository = make_slurm_repo(use_json=False)
+    calls = []
+
+    def get_jobs(job_ids=None, extra_args=None):
+        calls.append(extra_args)
+        time.sleep(delay)
+        return jobs
+
+    repository.get_jobs = get_jobs
+    return CachingJobRepository(repository, ttl=60, cache_dir=tmp_path / "cache"), calls
+
+
+def test_caching_repo_shares_snapshots(tmp_path):
+    jobs = TestJobRepository(seed=42).get_jobs()
+    cache, calls = make_caching_repo(tmp_path, jobs)
+
+    assert cache.get_jobs(None, ["-u", "alice"]) == jobs
+    # Another invocation, same query
+    other, other_calls = make_caching_repo(tmp_path, [])
+    assert other.get_jobs(None, ["-u", "alice"]) == jobs
+    assert list(other.iter_jobs(None, ["-u", "alice"])) == jobs
+    assert other_calls == []
+
+    assert other.get_jobs(None, ["-u", "bob"]) == []
+    assert len(other_calls) == 1
+
+    # Stale snapshot
+    for path in (tmp_path / "cache").glob("jobs-*.json"):
+        os.utime(path, (time.time() - 120, time.time() - 120))
+    assert cache.get_jobs(None, ["-u", "alice"]) == jobs
+    assert len(calls) == 2
+
+    cache.invalidate()
+    assert list((tmp_path / "cache").glob("jobs-*.json")) == []
+
+
+def test_caching_repo_coalesces_concurrent_refreshes(tmp_path):
+    jobs = TestJobRepository(seed=42).get_jobs()
+    cache, calls = make_caching_repo(tmp_path, jobs, delay=0.2)
+    results = []
+
+    def query():
+        # Each invocation opens its own lock file, as separate processes would
+        results.append(CachingJobRepository(cache.repository, ttl=60, cache_dir=cache.cache_dir).get_jobs())
+
+    threads = [threading.Thread(target=query) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [jobs] * 4
+
+
+def test_job_details_cache_lru_ttl_and_state_changes():
+    cache = JobDetailsCache(maxsize=2, ttl=0, terminal_ttl=60)
+    cache.put("1", {"JobState": "RUNNING"})
+    assert cache.get("1") is None  # expired
+
+    cache = JobDetailsCache(maxsize=2, ttl=60, terminal_ttl=60)
+    cache.put("1", {"JobState": "RUNNING"})
+    cache.put("2", {"JobState": "COMPLETED"})
+    assert cache.get("1") == {"JobState": "RUNNING"}
+    cache.put("3", {"JobState": "PENDING"})
+    assert cache.get("2") is None  # least recently used
+    assert len(cache) == 2
+
+    running = JobRecord.from_squeue_line(SQUEUE_LINE.replace("42|", "3|", 1), len(SQUEUE_FIELDS))
+    completed = JobRecord.from_squeue_line(
+        SQUEUE_LINE.replace("42|", "1|", 1).replace("running", "completed"), len(SQUEUE_FIELDS)
+    )
+    cache.update_states([running, completed])
+    assert cache.get("1") is None
+    assert cache.get("3") is None  # was PENDING
+
+
+def test_slurm_repo_caches_job_details():
+    repository = make_slurm_repo(use_json=False)
+    output = "JobId=42 JobName=test\n   JobState=RUNNING StdOut=/tmp/out"
+    with patch("mjobs.data.slurm_repo.check_output", return_value=output) as scontrol:
+        assert repository.get_job_details("42")["StdOut"] == "/tmp/out"
+        assert repository.get_job_details("42")["JobState"] == "RUNNING"
+        assert scontrol.call_count == 1
+        repository.invalidate()
+        repository.get_job_details("42")
+        assert scontrol.call_count == 2
+
+
+SCONTROL_RECORDS = """JobId=42 JobName=test
+   JobState=RUNNING Reason=None
+   StdOut=/tmp/42.out
+
+JobId=50 ArrayJobId=49 ArrayTaskId=1 JobName=array
+   JobState=PENDING
+   StdOut=/tmp/49_1.out
+
+JobId=60 JobName=other
+   JobState=RUNNING
+"""
+
+
+def test_slurm_repo_reads_job_details_with_one_dump_per_listing():
+    repository = make_slurm_repo(use_json=False)
+    repository.SCONTROL_PER_JOB_MAX = 1
+    listing = [
+        JobRecord.from_squeue_line(SQUEUE_LINE.replace("42|", f"{job_id}|", 1), len(SQUEUE_FIELDS))
+        for job_id in ("42", "49_1", "60", "404")
+    ]
+    repository.track_jobs(listing)
+    with patch("mjobs.data.slurm_repo.check_output", return_value=SCONTROL_RECORDS) as scontrol:
+        details = repository.get_jobs_details(["42", "49_1"])
+        assert scontrol.call_count == 1
+        assert scontrol.call_args[0][0] == ["scontrol", "show", "job"]
+        assert details["42"]["StdOut"] == "/tmp/42.out"
+        assert details["49_1"]["JobName"] == "array"
+
+        # The next page of the listing is looked up in the same dump, 404 is gone
+        assert set(repository.get_jobs_details(["60", "404"])) == {"60"}
+        assert repository.get_jobs_details(["42", "49_1"]) == details
+        assert scontrol.call_count == 1
+
+        # A new listing reads them again
+        repository.track_jobs(listing)
+        repository.details_cache.clear()
+        repository.get_jobs_details(["60", "404"])
+        assert scontrol.call_count == 2
+
+    # A few jobs are asked for by ID, not with a dump of the cluster
+    repository.SCONTROL_PER_JOB_MAX = 8
+    repository.invalidate()
+    with patch("mjobs.data.slurm_repo.check_output", return_value=SCONTROL_RECORDS) as scontrol:
+        repository.get_jobs_details(["42", "60"])
+        assert [call[0][0] for call in scontrol.call_args_list] == [
+            ["scontrol", "show", "job", "42"],
+            ["scontrol", "show", "job", "60"],
+        ]
+
+
+def test_slurm_repo_parses_scontrol_records():
+    repository = make_slurm_repo(use_json=False)
+    output = (
+        SCONTROL_RECORDS
+        + """
+JobId=70 JobName="quoted name"
+   Command=python train.py --lr=0.1 --out my dir
+   TRES=cpu=1,mem=4G,node=1 CPUs/Task=2 ReqB:S:C:T=0:0:*:*
+   WorkDir=/home/alice/my project   Comment=
+"""
+    )
+    records = repository._parse_scontrol_records(output)
+    assert [record["JobId"] for record in records] == ["42", "50", "60", "70"]
+    assert records[0] == {
+        "JobId": "42",
+        "JobName": "test",
+        "JobState": "RUNNING",
+        "Reason": "None",
+        "StdOut": "/tmp/42.out",
+    }
+    last = records[-1]
+    assert last["JobName"] == "quoted name"
+    assert last["Command"] == "python train.py --lr=0.1 --out my dir"
+    assert last["TRES"] == "cpu=1,mem=4G,node=1"
+    assert last["CPUs/Task"] == "2"
+    assert last["ReqB:S:C:T"] == "0:0:*:*"
+    assert last["WorkDir"] == "/home/alice/my project"
+    assert last["Comment"] == ""
+    assert repository._parse_scontrol_output(output)["JobId"] == "42"
+    assert repository._parse_scontrol_output("") == {}
+
+
+@pytest.mark.parametrize("trailing_newline", [True, False])
+def test_log_file_lazy_index(tmp_path, trailing_newline):
+    lines = [f"line {i}\t" + "x" * (i % 37) for i in range(500)]
+    path = tmp_path / "job.out"
+    path.write_text("\n".join(lines) + ("\n" if trailing_newline else ""))
+    log_file = LogFile(str(path), block_size=256)
+
+    # The end is there before anything is indexed
+    assert [log_file.read_line(start)[0] for start in log_file.tail_starts(2)] == [
+        line.expandtabs(8) for line in lines[-2:]
+    ]
+    assert log_file.line_start(100) is None
+
+    assert not log_file.index_blocks(4)
+    assert log_file.line_start(10) is not None
+    assert log_file.estimated_line_count() > log_file.indexed_lines
+
+    assert log_file.index_blocks()
+    assert log_file.indexed_lines == log_file.estimated_line_count() == 500
+    assert [log_file.read_line(log_file.line_start(i))[0] for i in range(500)] == [line.expandtabs(8) for line in lines]
+    log_file.close()
+
+
+def test_file_viewer_renders_visible_window(tmp_path):
+    path = tmp_path / "job.out"
+    path.write_text("".join(f"[red]line {i}[/red]\n" for i in range(10_000)))
+
+    async def run():
+        app = App()
+        async with app.run_test(size=(100, 30)) as pilot:
+            screen = FileViewerScreen(str(path))
+            app.push_screen(screen)
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            view = screen.query_one(LogView)
+            assert view.virtual_size.height == 10_000
+            assert view.render_line(0).text.strip() == "1: [red]line 0[/red]"
+            assert len(view._visible_rows()) == view.scrollable_content_region.height
+
+            await pilot.press("G")
+            await pilot.pause()
+            last = view.scrollable_content_region.height - 1
+            assert view.render_line(last).text.strip() == "10000: [red]line 9999[/red]"
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "pattern, expected",
+    [
+        ("ERROR|Traceback", [3, 7, 10]),
+        ("error", [3, 7]),
+        ("Error", []),
+        (r"ERR\w+ \d$", [3]),
+    ],
+)
+def test_log_search_finds_matching_lines(tmp_path, pattern, expected):
+    lines = [f"step {i}" for i in range(12)]
+    lines[3] = "ERROR 3"
+    lines[7] = "ERROR 7 and ERROR again"
+    lines[10] = "Traceback (most recent call last):"
+    path = tmp_path / "job.err"
+    path.write_text("\n".join(lines))
+    log_file = LogFile(str(path), block_size=16)
+    search = LogSearch(log_file, pattern)
+    while not search.scan(chunk_size=20):
+        pass
+    assert log_file.index_blocks()
+    assert [log_file.line_number_at(offset) for offset in search.matches] == expected
+
+    if expected:
+        first, last = search.matches[0], search.matches[-1]
+        assert search.next_match(-1) == first
+        assert search.next_match(last) is None
+        assert search.previous_match(first) is None
+        assert search.previous_match(last) == (search.matches[-2] if len(expected) > 1 else None)
+    log_file.close()
+
+
+def test_file_viewer_searches_and_jumps_to_matches(tmp_path):
+    path = tmp_path / "job.err"
+    path.write_text("".join(f"{'ERROR' if i in (500, 4_000) else 'INFO'} line {i}\n" for i in range(10_000)))
+
+    async def run():
+        app = App()
+        async with app.run_test(size=(100, 30)) as pilot:
+            screen = FileViewerScreen(str(path))
+            app.push_screen(screen)
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            view = screen.query_one(LogView)
+
+            await pilot.press("slash", *"ERROR", "enter")
+            await app.workers.wait_for_complete()
+            await pilot.pause()
+            assert len(screen.search.matches) == 2
+            assert view.current_line == 500
+            assert screen.focused is view
+
+            await pilot.press("n")
+            assert view.current_line == 4_000
+            row = view.current_line - int(view.scroll_y)
+            assert view.render_line(row).text.strip() == "4001: ERROR line 4000"
+            await pilot.press("n")
+            assert view.current_line == 500
+            await pilot.press("N")
+            assert view.current_line == 4_000
+
+            await pilot.press("slash", "escape")
+            assert screen.is_current
+
+    asyncio.run(run())
+
+
+def test_file_viewer_waits_for_the_indexer_to_reach_a_match(tmp_path):
+    path = tmp_path / "job.err"
+    path.write_text("".join(f"{'ERROR' if i == 9_000 else 'INFO'} line {i}\n" for i in range(10_000)))
+
+    async def run():
+        app = App()
+        async with app.run_test(size=(100, 30)) as pilot:
+            # The background indexer is held back
+            with patch.object(FileViewerScreen, "_index_file"):
+                screen = FileViewerScreen(str(path))
+                app.push_screen(screen)
+                await pilot.pause()
+                view = screen.query_one(LogView)
+                log_file = screen.log_file
+                offset = path.read_bytes().index(b"ERROR")
+                assert log_file.line_number_at(offset) is None
+
+                with patch.object(log_file, "index_blocks", wraps=log_file.index_blocks) as index_blocks:
+                    screen._go_to_match(offset)
+                index_blocks.assert_not_called()
+                assert view.current_line is None
+                assert screen._pending_match == offset
+
+            # The indexer gets there
+            log_file.index_blocks()
+            screen._index_updated()
+            await pilot.pause()
+            assert view.current_line == 9_000
+            assert screen._pending_match is None
+
+    asyncio.run(run())
+
+
+def test_file_viewer_reports_missing_file(tmp_path):
+    screen = FileViewerScreen(str(tmp_path / "missing.out"))
+    screen.load_file_content()
+    assert screen.error_message.startswith("File does not exist")
+    assert screen.log_file is None
+
+
+@pytest.mark.parametrize("filesystem", ["ext4", "nfs"])
+def test_file_viewer_follows_appended_lines(tmp_path, filesystem):
+    path = tmp_path / "job.out"
+    path.write_text("".join(f"line {i}\n" for i in range(100)))
+
+    async def run():
+        app = App()
+        async with app.run_test(size=(100, 30)) as pilot:
+            screen = FileViewerScreen(str(path), follow=True, poll_interval=0.05)
+            app.push_screen(screen)
+            await pilot.pause()
+            view = screen.query_one(LogView)
+            last = view.scrollable_content_region.height - 1
+            assert view.render_line(last).text.strip() == "100: line 99"
+
+            with open(path, "a") as output:
+                output.write("line 100\nline 101\n")
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                await pilot.pause()
+                if screen.log_file.size == path.stat().st_size:
+                    break
+            await pilot.pause()
+            assert view.render_line(last).text.strip() == "102: line 101"
+            assert screen.watch_mode == ("polling" if filesystem == "nfs" else "inotify")
+
+            await pilot.press("f")
+            assert not screen.follow
+
+    with patch("mjobs.widgets.file_watch.filesystem_type", return_value=filesystem):
+        asyncio.run(run())
+
+
+@pytest.mark.parametrize("filesystem", ["ext4", "nfs"])
+def test_file_viewer_follows_a_rotated_file(tmp_path, filesystem):
+    path = tmp_path / "job.out"
+    path.write_text("".join(f"line {i}\n" for i in range(100)))
+
+    async def wait_for(pilot, condition):
+        for _ in range(200):
+            await asyncio.sleep(0.02)
+            await pilot.pause()
+            if condition():
+                return
+        raise AssertionError("timed out")
+
+    async def run():
+        app = App()
+        async with app.run_test(size=(100, 30)) as pilot:
+            screen = FileViewerScreen(str(path), follow=True, poll_interval=0.05)
+            app.push_screen(screen)
+            await pilot.pause()
+            view = screen.query_one(LogView)
+            old_identity = screen.log_file.identity
+
+            path.rename(tmp_path / "job.out.1")
+            await wait_for(pilot, lambda: screen.watch_mode.startswith("waiting"))
+            # The old lines stay on screen
+            assert screen.log_file.identity == old_identity
+
+            path.write_text("new line 0\nnew line 1\n")
+            await wait_for(pilot, lambda: screen.log_file.identity != old_identity and screen.watch_mode)
+            assert screen.follow and screen.watch_mode == ("polling" if filesystem == "nfs" else "inotify")
+            assert view.render_line(1).text.strip() == "2: new line 1"
+
+            with open(path, "a") as output:
+                output.write("new line 2\n")
+            await wait_for(pilot, lambda: screen.log_file.size == path.stat().st_size)
+            await pilot.pause()
+            assert view.render_line(2).text.strip() == "3: new line 2"
+
+    with patch("mjobs.widgets.file_watch.filesystem_type", return_value=filesystem):
+        asyncio.run(run())
+
+
+def test_log_file_refresh_indexes_appended_bytes(tmp_path):
+    path = tmp_path / "job.out"
+    path.write_text("".join(f"line {i}\n" for i in range(100)))
+    log_file = LogFile(str(path), block_size=64)
+    assert log_file.index_blocks()
+    assert not log_file.refresh()
+
+    with open(path, "a") as output:
+        output.write("".join(f"line {i}\n" for i in range(100, 150)))
+    assert log_file.refresh()
+    assert log_file.index_blocks()
+    assert log_file.indexed_lines == 150
+    assert log_file.read_line(log_file.line_start(149))[0] == "line 149"
+
+    path.write_text("truncated\n")
+    assert log_file.refresh()
+    assert log_file.index_blocks()
+    assert log_file.indexed_lines == 1
+    log_file.close()
+
+
+def test_filesystem_type_uses_longest_mount_point(tmp_path):
+    mounts = tmp_path / "mounts"
+    mounts.write_text(
+        "/dev/sda1 / ext4 rw 0 0\nserver:/hps /hps nfs4 rw 0 0\nlfs@tcp:/scratch /hps/scratch\\040dir lustre rw 0 0\n"
+    )
+    assert filesystem_type("/hps/nobackup/job.out", str(mounts)) == "nfs4"
+    assert filesystem_type("/hps/scratch dir/job.out", str(mounts)) == "lustre"
+    assert filesystem_type("/home/alice/job.out", str(mounts)) == "ext4"